@@ -0,0 +1,64 @@
+from collections import deque
+from threading import Lock
+
+# a sensor is polled again by this share of the time any of its parameters could reach a boundary
+_SAFETY = 0.5
+
+
+def _slope(samples):
+    # least squares rate of change per second
+    count = len(samples)
+    mean_t = sum(t for t, _ in samples) / count
+    mean_v = sum(v for _, v in samples) / count
+    variance = sum((t - mean_t) ** 2 for t, _ in samples)
+    if variance == 0:
+        return 0.0
+    return sum((t - mean_t) * (v - mean_v) for t, v in samples) / variance
+
+
+def time_to_boundary(samples, low, high):
+    # seconds until the trend of (timestamp, value) samples crosses [low, high], None if there's no trend yet
+    value = samples[-1][1]
+    if not low <= value <= high:
+        return 0.0
+    if len(samples) < 2:
+        return None
+    slope = _slope(samples)
+    if slope < 0:
+        return (value - low) / -slope
+    if slope > 0:
+        return (high - value) / slope
+    return float("inf")
+
+
+class AdaptiveIntervals(object):
+    # a readings listener which keeps the latest readings of each sensor and picks its next interval: short when
+    # a parameter trends towards its boundary, long when all are far from them or stable
+    def __init__(self, min_interval, max_interval, history=5):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._history_size = history
+        self._history = {}
+        self._lock = Lock()
+
+    def on_readings(self, name, readings, timestamp):
+        with self._lock:
+            history = self._history.setdefault(name, {})
+            for param, value in readings.items():
+                if value is not None:
+                    history.setdefault(param, deque(maxlen=self._history_size)).append((timestamp, float(value)))
+
+    def forget(self, name):
+        with self._lock:
+            self._history.pop(name, None)
+
+    def next_interval(self, name, boundaries, default):
+        # boundaries are an evaluator's ones, parameters without a trend yet are polled at the default interval
+        interval = self.max_interval
+        with self._lock:
+            history = self._history.get(name, {})
+            for param, boundary in boundaries.items():
+                samples = history.get(param)
+                remaining = time_to_boundary(samples, boundary["min"], boundary["max"]) if samples else None
+                interval = min(interval, default if remaining is None else remaining * _SAFETY)
+        return max(self.min_interval, min(interval, self.max_interval))
@@ -0,0 +1,93 @@
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+_SERVICE_DATA = 0x16
+_MIBEACON_UUID = b"\x95\xfe"
+_FRAME_ENCRYPTED = 0x0008
+_FRAME_MAC = 0x0010
+_FRAME_CAPABILITY = 0x0020
+_FRAME_OBJECT = 0x0040
+_OBJECTS = {
+    0x1004: ("temperature", 2, lambda v: int.from_bytes(v, "little", signed=True) / 10.0),
+    0x1007: ("light", 3, lambda v: int.from_bytes(v, "little")),
+    0x1008: ("moisture", 1, lambda v: v[0]),
+    0x1009: ("conductivity", 2, lambda v: int.from_bytes(v, "little")),
+    0x100A: ("battery", 1, lambda v: v[0]),
+}
+# what a sensor has to advertise to be checked without connecting to it, battery is rarely advertised
+PARAMETERS = ("light", "temperature", "moisture", "conductivity")
+
+
+# service data starts with the 0xFE95 UUID, None is returned for anything which is not a readable MiBeacon
+def decode_mibeacon(service_data):
+    if len(service_data) < 7 or service_data[:2] != _MIBEACON_UUID:
+        return None
+    frame = service_data[2:]
+    control = int.from_bytes(frame[0:2], "little")
+    if control & _FRAME_ENCRYPTED:
+        return None
+    # frame control, product id, frame counter
+    pos = 5
+    if control & _FRAME_MAC:
+        pos += 6
+    if control & _FRAME_CAPABILITY:
+        pos += 1
+    readings = {}
+    if not control & _FRAME_OBJECT:
+        return readings
+    while pos + 3 <= len(frame):
+        object_type = int.from_bytes(frame[pos:pos + 2], "little")
+        size = frame[pos + 2]
+        value = frame[pos + 3:pos + 3 + size]
+        pos += 3 + size
+        if len(value) < size:
+            return None
+        if object_type in _OBJECTS:
+            param, expected, decode = _OBJECTS[object_type]
+            if size == expected:
+                readings[param] = decode(value)
+    return readings
+
+
+# a bluepy scan delegate, keeps the latest advertised readings and the signal strength (rssi, dBm) of the given
+# sensors
+class AdvertisementListener(object):
+    def __init__(self, macs):
+        self.readings = {mac.upper(): {} for mac in macs}
+        self.rssi = {}
+
+    def handleDiscovery(self, entry, is_new_device, is_new_data):
+        mac = entry.addr.upper()
+        if mac not in self.readings:
+            return
+        self.rssi[mac] = entry.rssi
+        if not (is_new_device or is_new_data):
+            return
+        service_data = entry.getValue(_SERVICE_DATA)
+        readings = decode_mibeacon(service_data) if service_data is not None else None
+        if readings:
+            _LOGGER.debug("{} advertised {} (rssi {})".format(mac, readings, entry.rssi))
+            self.readings[mac].update(readings)
+
+
+# readings heard within the window per (uppercase) mac, a failed scan just returns what was heard so far
+def scan(adapter, window, macs):
+    listener = AdvertisementListener(macs)
+    _scan(adapter, window, listener)
+    return {mac: readings for mac, readings in listener.readings.items() if len(readings) > 0}
+
+
+# rssi of the sensors heard within the window per (uppercase) mac, None if the scan failed
+def discover(adapter, window, macs):
+    listener = AdvertisementListener(macs)
+    return listener.rssi if _scan(adapter, window, listener) else None
+
+
+def _scan(adapter, window, listener):
+    from bluepy.btle import BTLEException, Scanner
+    try:
+        Scanner(iface=int(adapter.replace("hci", ""))).withDelegate(listener).scan(window, passive=True)
+    except BTLEException as e:
+        _LOGGER.warning("Scanning advertisements on {} failed".format(adapter), exc_info=e)
+        return False
+    return True
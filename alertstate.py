@@ -0,0 +1,57 @@
+import time
+from threading import Lock
+
+from storage import load_json, save_json
+
+
+class AlertState(object):
+    OPEN = "open"
+    RENOTIFY = "renotify"
+    CLOSE = "close"
+
+    def __init__(self, path, renotify_interval=0, notify_recovery=False):
+        self.notify_recovery = notify_recovery
+        self._path = path
+        self._renotify_interval = renotify_interval
+        self._alerts = load_json(path, {})
+        self._dirty = False
+        self._lock = Lock()
+
+    def update(self, name, param, out_of_range, recovered, value, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            sensor = self._alerts.get(name)
+            alert = sensor.get(param) if sensor is not None else None
+            if alert is None:
+                if not out_of_range:
+                    return None
+                self._alerts.setdefault(name, {})[param] = {"since": now, "notified": now, "value": value}
+                self._dirty = True
+                return self.OPEN
+            alert["value"] = value
+            self._dirty = True
+            if recovered:
+                del sensor[param]
+                if len(sensor) == 0:
+                    del self._alerts[name]
+                return self.CLOSE
+            if out_of_range and 0 < self._renotify_interval <= now - alert["notified"]:
+                alert["notified"] = now
+                return self.RENOTIFY
+            return None
+
+    def get(self, name, param):
+        with self._lock:
+            alert = self._alerts.get(name, {}).get(param)
+            return None if alert is None else dict(alert)
+
+    def open_alerts(self, name=None):
+        with self._lock:
+            names = [name] if name is not None else list(self._alerts)
+            return {n: {p: dict(a) for p, a in self._alerts.get(n, {}).items()} for n in names if n in self._alerts}
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                save_json(self._path, self._alerts)
+                self._dirty = False
@@ -0,0 +1,141 @@
+import math
+from threading import Lock
+
+from messenger import RangeCheckerEvaluator
+from storage import load_json, save_json
+
+# the rules a wellbeing range may have on top of min and max
+RULES = ("max_rate", "stuck", "max_zscore")
+# weight of the latest reading in the moving average
+_ALPHA = 0.1
+# readings the z-score is learned from before the rule is applied
+_MIN_SAMPLES = 10
+# the rate of change is measured over up to this many latest deltas
+_RATE_DELTAS = 3
+_HOUR = 3600
+
+
+def _new_stats():
+    # ewma of the values, Welford's count, mean and sum of squares of the readings' deviations from the ewma,
+    # the last value and time, and the last deltas as [value change, seconds] pairs
+    return {"ewma": None, "count": 0, "mean": 0.0, "m2": 0.0, "last": None, "at": None, "deltas": []}
+
+
+def update(stats, value, timestamp, deltas):
+    # folds one reading in and returns (z-score of the reading against the statistics before it, None while too few
+    # readings are seen), each step is constant time and memory; deltas is how many of them are kept
+    zscore = None
+    if stats["ewma"] is None:
+        stats["ewma"] = value
+    else:
+        deviation = value - stats["ewma"]
+        if stats["count"] >= _MIN_SAMPLES:
+            std = math.sqrt(stats["m2"] / (stats["count"] - 1))
+            distance = abs(deviation - stats["mean"])
+            zscore = distance / std if std > 0 else (0.0 if distance == 0 else math.inf)
+        stats["count"] += 1
+        delta = deviation - stats["mean"]
+        stats["mean"] += delta / stats["count"]
+        stats["m2"] += delta * (deviation - stats["mean"])
+        stats["ewma"] += _ALPHA * deviation
+        stats["deltas"] = (stats["deltas"] + [[value - stats["last"], timestamp - stats["at"]]])[-deltas:]
+    stats["last"] = value
+    stats["at"] = timestamp
+    return zscore
+
+
+def rate(stats):
+    # change per hour over the latest deltas, None without any
+    recent = stats["deltas"][-_RATE_DELTAS:]
+    seconds = sum(dt for _, dt in recent)
+    if seconds <= 0:
+        return None
+    return sum(dv for dv, _ in recent) / seconds * _HOUR
+
+
+def is_stuck(stats, readings):
+    # the last readings (as many as given) are all the same
+    deltas = stats["deltas"][-(readings - 1):]
+    return len(deltas) == readings - 1 and all(dv == 0 for dv, _ in deltas)
+
+
+class AnomalyState(object):
+    # statistics of every (sensor, parameter) with an anomaly rule, kept between runs
+    def __init__(self, path):
+        self._path = path
+        self._stats = None
+        self._dirty = False
+        self._lock = Lock()
+
+    def _load(self):
+        if self._stats is None:
+            self._stats = load_json(self._path, {})
+        return self._stats
+
+    def update(self, name, param, value, timestamp, deltas):
+        with self._lock:
+            stats = self._load().setdefault(name, {}).setdefault(param, _new_stats())
+            if stats["at"] is not None and timestamp <= stats["at"]:
+                # a cached value, it's been seen already
+                return stats, None
+            self._dirty = True
+            return stats, update(stats, value, timestamp, deltas)
+
+    def forget(self, name):
+        with self._lock:
+            if self._load().pop(name, None) is not None:
+                self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                save_json(self._path, self._stats)
+                self._dirty = False
+
+
+class StreamingEvaluator(RangeCheckerEvaluator):
+    # min/max of a wellbeing range, plus its anomaly rules on statistics which are updated by every reading:
+    # max_rate (change per hour, either way), stuck (this many readings in a row are the same) and max_zscore
+    # (deviation from the moving average, in standard deviations of the past deviations)
+    def __init__(self, name, sensor_config, state, hysteresis=None, table=None):
+        super().__init__(sensor_config, hysteresis, table)
+        self.name = name
+        self.rules = {
+            p: {rule: b[rule] for rule in RULES if b.get(rule) is not None}
+            for p, b in sensor_config["wellbeing_range"].items()
+        }
+        self.rules = {p: rules for p, rules in self.rules.items() if len(rules) > 0}
+        self._state = state
+        self.anomalies = {}
+
+    def update(self, readings, timestamp, ages=None):
+        self.anomalies = {}
+        for param, rules in self.rules.items():
+            value = readings.get(param)
+            if value is None:
+                continue
+            at = timestamp - (ages or {}).get(param, 0)
+            stats, zscore = self._state.update(
+                self.name, param, float(value), at, max(rules.get("stuck", 0) - 1, _RATE_DELTAS)
+            )
+            anomaly = self._check(rules, stats, zscore)
+            if anomaly is not None:
+                self.anomalies[param] = anomaly
+
+    @staticmethod
+    def _check(rules, stats, zscore):
+        if "max_rate" in rules:
+            change = rate(stats)
+            if change is not None and abs(change) > rules["max_rate"]:
+                return "rate"
+        if "stuck" in rules and is_stuck(stats, rules["stuck"]):
+            return "stuck"
+        if "max_zscore" in rules and zscore is not None and zscore > rules["max_zscore"]:
+            return "zscore"
+        return None
+
+    def need_to_notify(self, param, value):
+        return self.out_of_range(param, value) or param in self.anomalies
+
+    def is_recovered(self, param, value):
+        return super().is_recovered(param, value) and param not in self.anomalies
@@ -0,0 +1,136 @@
+import json
+import logging
+from threading import Event, Lock, Thread
+from time import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from reading import Reading
+
+_LOGGER = logging.getLogger(__name__)
+_CONTENT_TYPE = "application/json"
+
+
+class LatestReadings(object):
+    # a readings listener which keeps the latest readings of every sensor, along with the time of the latest read;
+    # parameters which aren't read in a check (they're cached) keep their values from before
+    def __init__(self):
+        self._latest = {}
+        self._lock = Lock()
+
+    def on_readings(self, name, readings, timestamp):
+        with self._lock:
+            previous = self._latest.get(name)
+            if previous is not None:
+                readings = dict(previous[0], **readings)
+            self._latest[name] = (Reading(readings), timestamp)
+
+    def get(self, name):
+        # (readings, timestamp), readings are a read-only Reading; None if the sensor hasn't been read yet
+        with self._lock:
+            return self._latest.get(name)
+
+
+class RefreshRequests(object):
+    # sensors the daemon is asked to check right away; all the requests of a sensor made before the daemon takes them
+    # share one event, so they are served by one read however many clients are waiting
+    def __init__(self):
+        self._pending = {}
+        self._lock = Lock()
+
+    def request(self, name):
+        with self._lock:
+            event = self._pending.get(name)
+            if event is None:
+                event = self._pending[name] = Event()
+                metrics.inc("refreshes", sensor=name)
+            return event
+
+    def take(self):
+        # {name: event}, events are to be set once their sensors are checked
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            return pending
+
+
+def sensor_status(name, latest, evaluator, alerts=None, now=None):
+    now = time() if now is None else now
+    entry = latest.get(name)
+    readings, timestamp = entry if entry is not None else (None, None)
+    return {
+        "name": name,
+        "readings": dict(readings) if readings is not None else None,
+        "timestamp": timestamp,
+        "age": None if timestamp is None else max(now - timestamp, 0),
+        "out_of_range": sorted(
+            param for param, value in (readings or {}).items()
+            if value is not None and evaluator.need_to_notify(param, value)
+        ),
+        "anomalies": dict(evaluator.anomalies),
+        "alerts": alerts.open_alerts(name).get(name, {}) if alerts is not None else None
+    }
+
+
+def serve(address, port, latest, evaluators, alerts=None, refresh=None, refresh_timeout=60):
+    # GET /sensors and /sensors/<name>[?max_age=<seconds>] answer from the latest readings only, Bluetooth is never
+    # touched here: readings older than max_age are refreshed by the daemon, the request waits for it up to
+    # refresh_timeout and gets whatever is the latest then. Evaluators decide which sensors exist, so reloaded
+    # configs are followed
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class ApiHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [unquote(part) for part in url.path.split("/") if part != ""]
+            if parts == ["sensors"]:
+                self._send(200, {
+                    name: sensor_status(name, latest, evaluator, alerts) for name, evaluator in list(evaluators.items())
+                })
+                return
+            if len(parts) != 2 or parts[0] != "sensors" or parts[1] not in evaluators:
+                self._send(404, {"error": "not found"})
+                return
+            name = parts[1]
+            try:
+                max_age = _max_age(parse_qs(url.query))
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+            if max_age is not None and refresh is not None and _is_older(latest.get(name), max_age):
+                if not refresh.request(name).wait(refresh_timeout):
+                    _LOGGER.warning("{} sensor isn't refreshed within {}s".format(name, refresh_timeout))
+            self._send(200, sensor_status(name, latest, evaluators[name], alerts))
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", _CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), ApiHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="api", daemon=True).start()
+    _LOGGER.info("Serving sensors on http://{}:{}/sensors".format(address, server.server_port))
+    return server
+
+
+def _max_age(query):
+    if "max_age" not in query:
+        return None
+    value = query["max_age"][-1]
+    try:
+        max_age = float(value)
+    except ValueError:
+        raise ValueError("max_age is expected to be numerical, but '{}' is given".format(value)) from None
+    if max_age < 0:
+        raise ValueError("max_age is expected to be non-negative, but '{}' is given".format(value))
+    return max_age
+
+
+def _is_older(entry, max_age):
+    return entry is None or time() - entry[1] > max_age
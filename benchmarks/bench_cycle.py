@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""One check cycle of simulated sensors: check_sensors, PlantSensor and Dispatcher/Messenger end to end.
+
+Sensors are PlantSensors on a simulated BLE backend (see tests/blesim.py), messages go to a local fake
+Telegram API. Every mode runs two cycles: "cold" includes the firmware/name check of new pollers, "warm"
+reuses them. "retries" are repeated reads, "failed" sensors are given up after all attempts.
+
+With --metrics the hot path instrumentation is enabled, to compare its overhead with the default run.
+--unreachable sensors (a share of them) time out on every connection; with --discovery a (simulated) discovery
+scan finds them, so they're tried once after the others instead of on every attempt.
+
+    python3 benchmarks/bench_cycle.py [--adapters 1 4] [--failure-rate 0.05] [--metrics] [--discovery] ... [sizes...]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from http.server import ThreadingHTTPServer
+from threading import Thread
+from time import monotonic
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics  # noqa: E402
+import plantcare  # noqa: E402
+from messenger import AlertMessageRender, Dispatcher, Messenger, RangeCheckerEvaluator  # noqa: E402
+from discovery import Discovery  # noqa: E402
+from plantsensor import PlantSensor  # noqa: E402
+from tests.blesim import simulated_backend  # noqa: E402
+from tests.test_messenger import _FakeTelegram  # noqa: E402
+
+_DRY = 10  # every 10th sensor reports a too low moisture
+
+
+class _CountingSensor(PlantSensor):
+    attempts = 0
+
+    def read(self):
+        self.attempts += 1
+        return super().read()
+
+
+def _cycle(sensors, evaluators, render, base_url, discovery, args):
+    for sensor in sensors:
+        sensor.attempts = 0
+    messenger = Dispatcher(Messenger("123:ABC", "-100", "MarkdownV2", render, base_url=base_url), len(sensors))
+    start = monotonic()
+    success = plantcare.check_sensors(sensors, args.attempts, messenger, evaluators, discovery=discovery)
+    elapsed = monotonic() - start
+    messenger.close(60)
+    retries = sum(max(sensor.attempts - 1, 0) for sensor in sensors)
+    return elapsed, retries, len(sensors) - success
+
+
+def _run(size, adapters, server, args):
+    macs = ["00:00:00:00:{:02X}:{:02X}".format(i // 256, i % 256) for i in range(size)]
+    unreachable = frozenset(macs[1::int(1 / args.unreachable)] if args.unreachable > 0 else ())
+    backend = simulated_backend(
+        connect_latency=args.connect_latency, read_latency=args.read_latency, failure_rate=args.failure_rate,
+        drop_rate=args.drop_rate, readings={mac: {"moisture": 5} for mac in macs[::_DRY]}, unreachable=unreachable,
+        connect_timeout=args.connect_timeout
+    )
+    config = {mac: {"wellbeing_range": {"moisture": {"min": 20, "max": None}}} for mac in macs}
+    render = AlertMessageRender(config, {"moisture": "{plant} needs water ({value})"})
+    evaluators = {mac: RangeCheckerEvaluator(sensor) for mac, sensor in config.items()}
+    sensors = [_CountingSensor("hci{}".format(i % adapters), mac, mac, backend=backend) for i, mac in enumerate(macs)]
+    base_url = "http://127.0.0.1:{}/bot".format(server.server_port)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        discovery = None
+        if args.discovery:
+            heard = {mac: -70 for mac in macs if mac not in unreachable}
+            discovery = Discovery(
+                os.path.join(tmp, "discovery.json"), {sensor.adapter for sensor in sensors}, 0, 600,
+                scan=lambda adapter, window, scanned: heard
+            )
+        for cycle in ("cold", "warm"):
+            server.requests = []
+            elapsed, retries, failed = _cycle(sensors, evaluators, render, base_url, discovery, args)
+            results.append((cycle, elapsed, retries, failed, len(server.requests)))
+    return results
+
+
+def main(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    if args.metrics:
+        metrics.enable()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeTelegram)
+    server.requests = []
+    server.responses = []
+    Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    # retry backoff scaled to the simulated latencies
+    plantcare._SLEEP = args.connect_latency * 10
+    plantcare._MAX_BACKOFF = args.connect_latency * 100
+    print("{:>8} {:>9} {:>6} {:>10} {:>8} {:>7} {:>9}".format(
+        "sensors", "adapters", "cycle", "wall s", "retries", "failed", "messages"))
+    try:
+        for size in args.sizes:
+            for adapters in args.adapters:
+                for cycle, elapsed, retries, failed, messages in _run(size, adapters, server, args):
+                    print("{:>8} {:>9} {:>6} {:>10.3f} {:>8} {:>7} {:>9}".format(
+                        size, adapters, cycle, elapsed, retries, failed, messages))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check cycle throughput with simulated sensors")
+    parser.add_argument("sizes", nargs="*", type=int, default=[10, 100, 1000])
+    parser.add_argument("--adapters", nargs="+", type=int, default=[1, 4], help="adapter counts to compare")
+    parser.add_argument("--connect-latency", type=float, default=0.002)
+    parser.add_argument("--read-latency", type=float, default=0.0005)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    parser.add_argument("--drop-rate", type=float, default=0.02)
+    parser.add_argument("--attempts", type=int, default=5)
+    parser.add_argument("--unreachable", type=float, default=0.0, help="share of sensors which are out of range")
+    parser.add_argument("--connect-timeout", type=float, default=0.05)
+    parser.add_argument("--discovery", action="store_true", help="plan the cycle with a discovery scan")
+    parser.add_argument("--metrics", action="store_true", help="enable metrics")
+    main(parser.parse_args())
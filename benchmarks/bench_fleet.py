@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""Per-sensor RangeCheckerEvaluator vs. FleetRangeEvaluator for one cycle of readings.
+
+"fleet" includes converting per-sensor reading dicts into the matrix, "fleet eval" is the batched
+comparison alone, i.e. the cost when readings are already matrix shaped (e.g. read from the store).
+
+    python3 benchmarks/bench_fleet.py [sizes...]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fleet import FleetRangeEvaluator  # noqa: E402
+from messenger import RangeCheckerEvaluator  # noqa: E402
+from tests.test_fleet import _random_fleet  # noqa: E402
+
+
+def _per_sensor(evaluators, readings):
+    return [
+        (name, p, value) for name, sensor_readings in readings.items() for p, value in sensor_readings.items()
+        if evaluators[name].need_to_notify(p, value)
+    ]
+
+
+def main(sizes):
+    print("{:>8} {:>14} {:>14} {:>14} {:>8}".format("sensors", "per-sensor ms", "fleet ms", "fleet eval ms", "speedup"))
+    for size in sizes:
+        sensors, readings = _random_fleet(size, size)
+        evaluators = {name: RangeCheckerEvaluator(sensor) for name, sensor in sensors.items()}
+        fleet = FleetRangeEvaluator(sensors)
+        values = fleet.to_matrix(readings)
+        assert sorted(_per_sensor(evaluators, readings)) == sorted(fleet.evaluate(readings))
+        number = max(1, 100000 // size)
+        per_sensor = min(timeit.repeat(lambda: _per_sensor(evaluators, readings), number=number, repeat=3)) / number
+        batched = min(timeit.repeat(lambda: fleet.evaluate(readings), number=number, repeat=3)) / number
+        mask_only = min(timeit.repeat(lambda: fleet.need_to_notify(values), number=number, repeat=3)) / number
+        print("{:>8} {:>14.3f} {:>14.3f} {:>14.3f} {:>7.1f}x".format(
+            size, per_sensor * 1000, batched * 1000, mask_only * 1000, per_sensor / batched))
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or [10, 1000, 100000])
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Memory of the daemon mode with simulated sensors: what is kept per sensor, and RSS over daemon cycles.
+
+Sensors come from config.get_sensors() of a configuration with a few plant kinds (so wellbeing ranges repeat,
+as in a real fleet); PlantSensors run on the simulated BLE backend (see tests/blesim.py), messages are only
+rendered (replay.ReplayMessenger) and the latest readings are kept as for the API. "state KB" is what the
+sensors, evaluators, message render and latest readings hold after the first cycle (tracemalloc); RSS is sampled
+after every daemon cycle, "growth" is the RSS of the last cycle minus the one of the second cycle.
+
+    python3 benchmarks/bench_memory.py [--cycles 20] [--kinds 10] [sizes...]
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+from threading import Event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import api  # noqa: E402
+import config  # noqa: E402
+import plantcare  # noqa: E402
+from alertstate import AlertState  # noqa: E402
+from boundaries import BoundaryTable  # noqa: E402
+from messenger import AlertMessageRender  # noqa: E402
+from plantsensor import PlantSensor  # noqa: E402
+from replay import ReplayMessenger  # noqa: E402
+from tests.blesim import simulated_backend  # noqa: E402
+
+_INTERVAL = 0.2
+
+
+def _rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def _config(size, kinds):
+    sensors = {}
+    for i in range(size):
+        kind = i % kinds
+        sensors["plant {}".format(i)] = {
+            "mac": "00:00:00:00:{:02X}:{:02X}".format(i // 256, i % 256),
+            "wellbeing_range": {
+                "moisture": {"min": 15 + kind, "max": 60},
+                "temperature": {"min": 10, "max": 35},
+                "light": {"min": 1000 + 100 * kind},
+                "conductivity": {"min": 350, "max": 2000},
+                "battery": {"min": 10},
+            }
+        }
+    return {"telegram": {"token": "123:ABC", "channel": "-100"}, "sensors": sensors}
+
+
+def _build(settings, backend):
+    sensors = settings["sensors"]
+    # as in plantcare.main(), the evaluators and the message render share one boundary table
+    table = BoundaryTable(settings["alerts"]["hysteresis"])
+    render = AlertMessageRender(sensors, settings["message_templates"], table)
+    evaluators = {
+        name: plantcare._new_evaluator(name, sensor, settings["alerts"]["hysteresis"], None, table)
+        for name, sensor in sensors.items()
+    }
+    queue = [PlantSensor("hci0", name, sensor["mac"], backend=backend) for name, sensor in sensors.items()]
+    return render, evaluators, queue
+
+
+def _run(size, args):
+    os.environ["CONFIG"] = json.dumps(_config(size, args.kinds))
+    config.reload()
+    settings = plantcare._read_config(daemon=True)
+    # a few sensors are dry, so alerts are opened and kept open
+    macs = [sensor["mac"] for sensor in settings["sensors"].values()]
+    backend = simulated_backend(readings={mac: {"moisture": 5} for mac in macs[::10]})
+    rss = []
+    state = []
+    stop = Event()
+
+    def after_cycle():
+        if len(rss) == 0:
+            # the first cycle creates the pollers and fills the cache of every sensor, they keep that from then on
+            gc.collect()
+            state.append(sum(stat.size for stat in tracemalloc.take_snapshot().statistics("filename")))
+            tracemalloc.stop()
+        rss.append(_rss_kb())
+        if len(rss) >= args.cycles:
+            stop.set()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gc.collect()
+        tracemalloc.start()
+        alerts = AlertState(os.path.join(tmp, "alerts.json"))
+        render, evaluators, queue = _build(settings, backend)
+        plantcare.run_daemon(
+            queue, {name: _INTERVAL for name in evaluators}, 1, ReplayMessenger(render), evaluators, stop,
+            [api.LatestReadings()], after_cycle, alerts
+        )
+    return state[0], rss
+
+
+def main(args):
+    logging.basicConfig(level=logging.CRITICAL)
+    print("{:>8} {:>10} {:>14} {:>10} {:>10} {:>10}".format(
+        "sensors", "state KB", "per sensor B", "RSS MB", "peak MB", "growth KB"))
+    for size in args.sizes:
+        state, rss = _run(size, args)
+        print("{:>8} {:>10.0f} {:>14.0f} {:>10.1f} {:>10.1f} {:>10}".format(
+            size, state / 1024, state / size, rss[-1] / 1024, max(rss) / 1024, rss[-1] - rss[1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Daemon mode memory with simulated sensors")
+    parser.add_argument("--cycles", type=int, default=20, help="daemon cycles to run")
+    parser.add_argument("--kinds", type=int, default=10, help="distinct wellbeing ranges among the sensors")
+    parser.add_argument("sizes", type=int, nargs="*", default=[500])
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""A year of hourly readings of a fleet replayed through the evaluators, alert state and message templates.
+
+Readings are a daily moisture cycle with some noise, written to a ReadingStore first and then streamed from it
+(the "store" column), or generated on the fly (the "memory" column, i.e. the replay alone). Half of the sensors
+have a max_rate rule, so they use the streaming evaluator. Peak RSS is printed to show memory doesn't grow with
+the data.
+
+    python3 benchmarks/bench_replay.py [sizes...]
+"""
+import math
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+import replay  # noqa: E402
+from readingstore import ReadingStore  # noqa: E402
+
+_HOUR = 3600
+_HOURS = 365 * 24
+_T0 = 1700006400
+
+
+def _settings(size):
+    sensors = {}
+    for i in range(size):
+        moisture = {"min": 25, "max": 60}
+        if i % 2 == 0:
+            moisture["max_rate"] = 20
+        sensors["s{}".format(i)] = {
+            "mac": "00:00:00:00:{:02X}:{:02X}".format(i // 256, i % 256),
+            "wellbeing_range": {"moisture": moisture, "temperature": {"min": 12, "max": 32}}
+        }
+    templates = config.get_message_templates()
+    config.get_alerts()
+    return {
+        "sensors": sensors, "message_templates": templates,
+        "alerts": {"enabled": True, "renotify_interval": 86400, "recovery_message": True, "hysteresis": {"moisture": 2}}
+    }
+
+
+def _records(size):
+    rnd = random.Random(1)
+    for hour in range(_HOURS):
+        for i in range(size):
+            phase = 2 * math.pi * (hour % 24) / 24
+            yield "s{}".format(i), _T0 + hour * _HOUR, {
+                "moisture": round(40 + 20 * math.sin(phase + i) + rnd.gauss(0, 3)),
+                "temperature": round(20 + 8 * math.sin(phase) + rnd.gauss(0, 1), 1),
+                "light": 0, "conductivity": 300,
+            }
+
+
+def _replay(records, settings):
+    started = time.perf_counter()
+    counts = replay.replay(records, settings)
+    return time.perf_counter() - started, sum(c["alerts"] for c in counts.values())
+
+
+def main(sizes):
+    print("{:>8} {:>10} {:>10} {:>10} {:>12} {:>8} {:>8}".format(
+        "sensors", "records", "memory s", "store s", "records/s", "alerts", "RSS MB"))
+    for size in sizes:
+        settings = _settings(size)
+        memory, alerts = _replay(_records(size), settings)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = ReadingStore(tmp)
+            for name, timestamp, readings in _records(size):
+                store.append(name, readings, timestamp)
+            store.close()
+            stored, stored_alerts = _replay(ReadingStore(tmp).stream(), settings)
+        records = size * _HOURS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print("{:>8} {:>10} {:>10.2f} {:>10.2f} {:>12.0f} {:>8} {:>8.0f}".format(
+            size, records, memory, stored, records / stored, stored_alerts, rss))
+
+
+if __name__ == '__main__':
+    main([int(s) for s in sys.argv[1:]] or [10, 100])
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""Startup time of a fresh interpreter: importing plantcare, validating the config (--check-config path), and,
+for comparison, importing the Bluetooth and Telegram stacks plantcare defers until they are needed.
+
+Fails (exit code 1) if plantcare or the config check pull in any of the heavy modules, or if importing
+plantcare takes longer than the budget.
+
+    python3 benchmarks/bench_startup.py [--budget ms] [--runs n]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("telegram", "bluepy", "btlewrap", "miflora", "numpy")
+_CONFIG = {
+    "telegram": {"token": "123:ABC", "channel": "-100"},
+    "sensors": {"Rose": {"mac": "10:EA:BA:58:10:B8", "wellbeing_range": {"moisture": {"min": 40}}}}
+}
+_SCRIPT = """
+import sys
+from time import perf_counter
+start = perf_counter()
+{}
+elapsed = perf_counter() - start
+print(elapsed, " ".join(m for m in {!r} if m in sys.modules))
+"""
+_CASES = {
+    "import plantcare": "import plantcare",
+    "check config": "import plantcare\nplantcare.check_config()",
+    "bluetooth + telegram": "import plantcare\nimport miflorapoller\nimport telegram",
+}
+
+
+def measure(code, runs=5):
+    times = []
+    heavy = set()
+    env = dict(os.environ, CONFIG=json.dumps(_CONFIG))
+    env.pop("CONFIG_FILE", None)
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _SCRIPT.format(code, HEAVY)], cwd=ROOT, env=env, check=True,
+            stdout=subprocess.PIPE, universal_newlines=True
+        ).stdout.split()
+        times.append(float(out[0]))
+        heavy.update(out[1:])
+    return statistics.median(times), sorted(heavy)
+
+
+def main(args):
+    failed = False
+    print("{:>22} {:>10}  {}".format("", "median ms", "heavy modules"))
+    for name, code in _CASES.items():
+        elapsed, heavy = measure(code, args.runs)
+        print("{:>22} {:>10.1f}  {}".format(name, elapsed * 1000, " ".join(heavy) or "-"))
+        if name == "bluetooth + telegram":
+            continue
+        if len(heavy) > 0:
+            print("  FAIL: '{}' imports {}".format(name, ", ".join(heavy)))
+            failed = True
+        if name == "import plantcare" and elapsed * 1000 > args.budget:
+            print("  FAIL: 'import plantcare' is over the {} ms budget".format(args.budget))
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup time and import budget")
+    parser.add_argument("--budget", type=float, default=150, help="import plantcare budget in ms")
+    parser.add_argument("--runs", type=int, default=5)
+    sys.exit(main(parser.parse_args()))
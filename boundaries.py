@@ -0,0 +1,73 @@
+import sys
+
+from parameters import INDEX, PARAMETERS
+
+# open ends of a wellbeing range
+_LOWEST = ~sys.maxsize
+_HIGHEST = sys.maxsize
+
+
+def render(p_min, p_max):
+    if p_min is not None and p_max is not None:
+        return "[{}, {}]".format(p_min, p_max)
+    elif p_min is not None:
+        return "≥ {}".format(p_min)
+    elif p_max is not None:
+        return "≤ {}".format(p_max)
+    return ""
+
+
+class Boundary(object):
+    # a parameter's wellbeing range: open ends are the lowest and highest ints, a value is back within it once it's
+    # within [recovery_min, recovery_max], which is narrower by the hysteresis; text is how messages show it
+    __slots__ = ("min", "max", "recovery_min", "recovery_max", "text")
+
+    def __init__(self, p_min, p_max, hysteresis=0):
+        self.min = p_min if p_min is not None else _LOWEST
+        self.max = p_max if p_max is not None else _HIGHEST
+        self.recovery_min = self.min + hysteresis
+        self.recovery_max = self.max - hysteresis
+        self.text = render(p_min, p_max)
+
+
+class BoundaryTable(object):
+    # the wellbeing ranges of every sensor, shared by the evaluators and the message render. A sensor's row is a tuple
+    # of Boundary in PARAMETERS order (None for parameters without a range), and sensors of the same ranges share one
+    # row, so a fleet of a few plant kinds keeps a few rows whatever the number of sensors
+    def __init__(self, hysteresis=None):
+        self._hysteresis = hysteresis or {}
+        self._rows = {}
+        self._interned = {}
+
+    def row(self, wellbeing_range):
+        key = tuple(
+            (wellbeing_range[p]["min"], wellbeing_range[p]["max"]) if p in wellbeing_range else None
+            for p in PARAMETERS
+        )
+        row = self._interned.get(key)
+        if row is None:
+            row = self._interned[key] = tuple(
+                Boundary(*b, self._hysteresis.get(p, 0)) if b is not None else None for p, b in zip(PARAMETERS, key)
+            )
+        return row
+
+    def set_hysteresis(self, hysteresis):
+        # rows made from then on are of the new hysteresis, sensors' rows are to be set again
+        self._hysteresis = hysteresis or {}
+        self._interned = {}
+
+    def set_sensor(self, name, sensor_config):
+        self._rows[name] = self.row(sensor_config["wellbeing_range"])
+
+    def remove_sensor(self, name):
+        self._rows.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def boundary(self, name, param):
+        # None if the parameter has no range
+        return self._rows[name][INDEX[param]]
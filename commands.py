@@ -0,0 +1,201 @@
+import logging
+import time
+from threading import Event, Thread
+
+import api
+import metrics
+
+_LOGGER = logging.getLogger(__name__)
+_DAY = 86400
+_MAX_BACKOFF = 300
+_HELP = (
+    "/status - the latest readings of every plant\n"
+    "/status <plant> - the latest readings of a plant, with its open alerts\n"
+    "/history <plant> - the plant's readings over the last 24 hours\n"
+    "/refresh [<plant>] - check the plant (or every plant) right away"
+)
+
+
+def _number(value):
+    return "{:g}".format(round(value, 1))
+
+
+def _age(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return "{} min ago".format(int(seconds // 60))
+    if seconds < _DAY:
+        return "{} h ago".format(int(seconds // 3600))
+    return "{} days ago".format(int(seconds // _DAY))
+
+
+def format_status(status, details=False):
+    # a sensor status of api.sensor_status as text; with details, open alerts are listed too
+    name = status["name"]
+    if status["readings"] is None:
+        return "{}: no readings yet".format(name)
+    readings = ", ".join(
+        "{} {}".format(p, _number(v)) for p, v in status["readings"].items() if v is not None
+    )
+    lines = ["{}: {} ({})".format(name, readings, _age(status["age"]))]
+    problems = ["{} is out of range".format(p) for p in status["out_of_range"]]
+    problems += ["{} looks wrong ({})".format(p, rule) for p, rule in sorted(status["anomalies"].items())]
+    if len(problems) > 0:
+        lines.append("  " + ", ".join(problems))
+    if details:
+        now = time.time()
+        for param, alert in sorted((status["alerts"] or {}).items()):
+            lines.append("  {} alert open since {}, last value {}".format(
+                param, _age(now - alert["since"]), _number(alert["value"])))
+    return "\n".join(lines)
+
+
+def format_history(name, rows):
+    # rows are the raw readings of ReadingStore.query
+    import numpy as np
+    from readingstore import FIELDS
+    if len(rows) == 0:
+        return "{}: no readings in the last 24 hours".format(name)
+    lines = ["{}, last 24 hours ({} readings):".format(name, len(rows))]
+    for i, param in enumerate(FIELDS):
+        values = rows["values"][:, i]
+        values = values[~np.isnan(values)]
+        if len(values) > 0:
+            lines.append("{} {}..{}, mean {}, now {}".format(
+                param, _number(values.min()), _number(values.max()), _number(values.mean()), _number(values[-1])))
+    return "\n".join(lines)
+
+
+class CommandBot(object):
+    # answers /status, /status <plant>, /history <plant> and /refresh [<plant>] from the chats it's allowed to (ids
+    # or @usernames), polling Telegram for them from its own thread. Answers come from the latest readings, alert
+    # state and the reading store, Bluetooth is never touched here: /refresh asks the daemon to check the sensors
+    # (refresh None disables it) and answers once they're checked, or after refresh_timeout
+    def __init__(self, messenger, chats, latest, evaluators, alerts=None, store=None, refresh=None, refresh_timeout=60,
+                 poll_timeout=30, backoff=5):
+        self._messenger = messenger
+        self._chats = {str(chat) for chat in chats}
+        self._latest = latest
+        self._evaluators = evaluators
+        self._alerts = alerts
+        self._store = store
+        self._refresh = refresh
+        self._refresh_timeout = refresh_timeout
+        self._poll_timeout = poll_timeout
+        self._backoff = backoff
+        self._stop = Event()
+        self._thread = Thread(target=self._run, name="commands", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        # a long poll in progress isn't waited for, the thread ends after it; its updates are fetched again next time
+        self._stop.set()
+
+    def _run(self):
+        from telegram.error import TelegramError
+        offset = None
+        failures = 0
+        while not self._stop.is_set():
+            try:
+                updates = self._messenger.get_updates(offset, self._poll_timeout)
+            except TelegramError as e:
+                failures += 1
+                delay = min(self._backoff * 2 ** (failures - 1), _MAX_BACKOFF)
+                _LOGGER.warning("Polling Telegram for commands failed, retrying in {}s: {}".format(delay, e))
+                self._stop.wait(delay)
+                continue
+            failures = 0
+            for update_id, chat_id, username, text in updates:
+                offset = update_id + 1
+                if text is None or not text.startswith("/"):
+                    continue
+                if str(chat_id) not in self._chats and "@{}".format(username) not in self._chats:
+                    _LOGGER.warning("Ignoring command from chat {} which isn't allowed".format(chat_id))
+                    continue
+                # a failing command (e.g. a damaged store file) is logged and doesn't stop the polling
+                try:
+                    self.handle(chat_id, text)
+                except Exception:
+                    _LOGGER.exception("Answering '{}' from chat {} failed".format(text, chat_id))
+
+    def handle(self, chat_id, text):
+        parts = text.split(maxsplit=1)
+        # in groups commands may come as /status@botname
+        command = parts[0].split("@")[0].lower()
+        argument = parts[1].strip() if len(parts) > 1 else None
+        handler = {"/status": self._status, "/history": self._history, "/refresh": self._refresh_command}.get(command)
+        if handler is None:
+            self._reply(chat_id, _HELP)
+            return
+        metrics.inc("commands", command=command[1:])
+        answer = handler(chat_id, argument)
+        if answer is not None:
+            self._reply(chat_id, answer)
+
+    def _reply(self, chat_id, text):
+        from telegram.error import TelegramError
+        try:
+            self._messenger.reply(chat_id, text)
+        except TelegramError as e:
+            _LOGGER.error("Answering a command failed", exc_info=e)
+
+    def _find(self, argument):
+        # the plant's name, matched case-insensitively if there's no exact match
+        if argument in self._evaluators:
+            return argument
+        matches = [name for name in list(self._evaluators) if name.lower() == argument.lower()]
+        return matches[0] if len(matches) == 1 else None
+
+    def _unknown(self, argument):
+        return "Unknown plant '{}', the plants are: {}".format(argument, ", ".join(sorted(self._evaluators)))
+
+    def _status(self, chat_id, argument):
+        if argument is None:
+            statuses = [
+                format_status(api.sensor_status(name, self._latest, evaluator, self._alerts))
+                for name, evaluator in sorted(list(self._evaluators.items()))
+            ]
+            return "\n".join(statuses) if len(statuses) > 0 else "No plants are configured"
+        name = self._find(argument)
+        if name is None:
+            return self._unknown(argument)
+        return format_status(api.sensor_status(name, self._latest, self._evaluators[name], self._alerts), True)
+
+    def _history(self, chat_id, argument):
+        if argument is None:
+            return "Which plant? /history <plant>"
+        name = self._find(argument)
+        if name is None:
+            return self._unknown(argument)
+        if self._store is None:
+            return "History needs the reading store, it's kept with 'store : enabled'"
+        now = time.time()
+        return format_history(name, self._store.query(now - _DAY, now + 1, name=name))
+
+    def _refresh_command(self, chat_id, argument):
+        if self._refresh is None:
+            return "/refresh is disabled"
+        if argument is None:
+            names = sorted(self._evaluators)
+        else:
+            name = self._find(argument)
+            if name is None:
+                return self._unknown(argument)
+            names = [name]
+        # sensors which are being refreshed already share the pending check
+        events = [self._refresh.request(name) for name in names]
+        Thread(target=self._answer_refresh, args=(chat_id, names, events), name="refresh", daemon=True).start()
+        return "Checking {}...".format(", ".join(names))
+
+    def _answer_refresh(self, chat_id, names, events):
+        deadline = time.monotonic() + self._refresh_timeout
+        for event in events:
+            event.wait(max(deadline - time.monotonic(), 0))
+        self._reply(chat_id, "\n".join(
+            format_status(api.sensor_status(name, self._latest, self._evaluators[name], self._alerts))
+            for name in names if name in self._evaluators
+        ))
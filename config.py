@@ -1,25 +1,112 @@
 import json
 import logging
 import os
+from copy import deepcopy
 
-from plantsensor import PARAMETERS
+from parameters import PARAMETERS
 
 _LOGGER = logging.getLogger(__name__)
 _config = {
     "_loaded": False,
     "loglevel": "INFO",
     "adapter": "hci0",
+    "adapters": [],
     "max_attempts": 5,
+    "cycle_timeout": 0,
+    "interval": 3600,
+    "adaptive": {
+        "enabled": False,
+        "min_interval": 600,
+        "max_interval": 21600,
+        "history": 5
+    },
+    "data_dir": "data",
+    "firmware_check_ttl": 604800,
+    "freshness": {
+        "monitored_only": False,
+        "ttl": {}
+    },
+    "passive": {
+        "enabled": False,
+        "window": 10
+    },
+    "health": {
+        "enabled": False,
+        "threshold": 3,
+        "probe_interval": 3600,
+        "max_probe_interval": 86400
+    },
+    "discovery": {
+        "enabled": False,
+        "window": 5,
+        "ttl": 600,
+        "unseen_attempts": 1
+    },
+    "metrics": {
+        "enabled": False,
+        "address": "0.0.0.0",
+        "port": 9101,
+        "textfile": None
+    },
+    "api": {
+        "enabled": False,
+        "address": "127.0.0.1",
+        "port": 9102,
+        "refresh_timeout": 60
+    },
+    "commands": {
+        "enabled": False,
+        "chats": [],
+        "refresh": False,
+        "refresh_timeout": 60,
+        "poll_timeout": 30
+    },
+    "mqtt": {
+        "enabled": False,
+        "host": "localhost",
+        "port": 1883,
+        "username": None,
+        "password": None,
+        "client_id": "plantcare",
+        "topic_prefix": "plantcare",
+        "discovery_prefix": "homeassistant",
+        "qos": 1,
+        "queue_size": 10000
+    },
+    "store": {
+        "enabled": False,
+        "raw_retention": 30,
+        "hourly_retention": 365
+    },
+    "history": {
+        "enabled": False,
+        "interval": 86400,
+        "clear": False
+    },
     "telegram": {
         "token": None,
         "channel": None,
+        "coalesce": False,
+        "queue_size": 100,
         "message": {
             "parse_mode": "MarkdownV2",
-            **{param: "{plant}: '" + param + "' parameter is out of boundaries '{boundaries}'" for param in PARAMETERS}
+            **{param: "{plant}: '" + param + "' parameter is out of boundaries '{boundaries}'" for param in PARAMETERS},
+            "recovered": "{plant}: '{parameter}' parameter is back within boundaries '{boundaries}'",
+            "rate": "{plant}: '{parameter}' parameter changes too fast, it's '{value}' now",
+            "stuck": "{plant}: '{parameter}' parameter is stuck at '{value}'",
+            "zscore": "{plant}: '{parameter}' parameter is unusual, it's '{value}' now",
+            "dark": "{plant}: the sensor doesn't respond since {last_success}, the last error is {error}"
         }
     },
+    "alerts": {
+        "enabled": False,
+        "renotify_interval": 86400,
+        "recovery_message": False,
+        "hysteresis": {}
+    },
     "sensors": {}
 }
+_DEFAULTS = deepcopy(_config)
 
 
 def _update(a, b):
@@ -36,6 +123,13 @@ def _update(a, b):
 
 
 def _load_custom():
+    path = get_config_file()
+    if path is not None:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except OSError as e:
+            raise ValueError("Reading config file '{}' failed".format(path)) from e
     config = os.environ.get("CONFIG")
     if config is None or config.strip() == "":
         return {}
@@ -50,6 +144,36 @@ def _get_cfg():
     return _config
 
 
+def get_config_file():
+    path = os.environ.get("CONFIG_FILE")
+    if path is None or path.strip() == "":
+        return None
+    return path.strip()
+
+
+def get_config_mtime():
+    path = get_config_file()
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def reload():
+    # the config is read again on the next get_*(), the previous one is returned to be restore()d if the new one fails
+    global _config
+    previous = _config
+    _config = deepcopy(_DEFAULTS)
+    return previous
+
+
+def restore(previous):
+    global _config
+    _config = previous
+
+
 def get_all():
     config = _get_cfg()
     return {key: config[key] for key in config if key != "_loaded"}
@@ -65,6 +189,184 @@ def get_max_attempts():
         ) from e
 
 
+def get_cycle_timeout():
+    cycle_timeout = _get_cfg()["cycle_timeout"]
+    if cycle_timeout < 0:
+        raise ValueError("'cycle_timeout' is expected to be non-negative, but '{}' is given".format(cycle_timeout))
+    return cycle_timeout
+
+
+def get_interval():
+    return _to_interval(_get_cfg()["interval"], "'interval'")
+
+
+def get_adaptive():
+    adaptive = _get_cfg()["adaptive"]
+    min_interval = _to_interval(adaptive["min_interval"], "'adaptive : min_interval'")
+    max_interval = _to_interval(adaptive["max_interval"], "'adaptive : max_interval'")
+    if min_interval > max_interval:
+        raise ValueError(
+            "'adaptive : min_interval' is expected not to exceed 'adaptive : max_interval', but {} > {}".format(
+                min_interval, max_interval)
+        )
+    if adaptive["history"] < 2:
+        raise ValueError(
+            "'adaptive : history' is expected to be at least 2, but '{}' is given".format(adaptive["history"])
+        )
+    return dict(adaptive, min_interval=min_interval, max_interval=max_interval)
+
+
+def _to_interval(value, what):
+    try:
+        interval = int(value)
+    except (TypeError, ValueError) as e:
+        raise ValueError("{} is expected to be numerical, but '{}' is given".format(what, value)) from e
+    if interval <= 0:
+        raise ValueError("{} is expected to be positive, but '{}' is given".format(what, value))
+    return interval
+
+
+def get_data_dir():
+    return _get_non_empty("data_dir")
+
+
+def get_firmware_check_ttl():
+    ttl = _get_cfg()["firmware_check_ttl"]
+    if ttl < 0:
+        raise ValueError("'firmware_check_ttl' is expected to be non-negative, but '{}' is given".format(ttl))
+    return ttl
+
+
+def get_freshness():
+    freshness = _get_cfg()["freshness"]
+    for p, ttl in freshness["ttl"].items():
+        if p not in PARAMETERS:
+            raise ValueError("freshness ttl parameter {} is not in supported list {}".format(p, PARAMETERS))
+        if not isinstance(ttl, (int, float)) or ttl < 0:
+            raise ValueError("ttl for '{}' is expected to be a non-negative number, but '{}' is given".format(p, ttl))
+    return freshness
+
+
+def get_passive():
+    passive = _get_cfg()["passive"]
+    if passive["window"] <= 0:
+        raise ValueError("'passive : window' is expected to be positive, but '{}' is given".format(passive["window"]))
+    return passive
+
+
+def get_health():
+    health = _get_cfg()["health"]
+    if not isinstance(health["threshold"], int) or health["threshold"] < 1:
+        raise ValueError(
+            "'health : threshold' is expected to be a positive integer, but '{}' is given".format(health["threshold"])
+        )
+    probe_interval = _to_interval(health["probe_interval"], "'health : probe_interval'")
+    max_probe_interval = _to_interval(health["max_probe_interval"], "'health : max_probe_interval'")
+    if probe_interval > max_probe_interval:
+        raise ValueError(
+            "'health : probe_interval' is expected not to exceed 'health : max_probe_interval', but {} > {}".format(
+                probe_interval, max_probe_interval)
+        )
+    return dict(health, probe_interval=probe_interval, max_probe_interval=max_probe_interval)
+
+
+def get_discovery():
+    discovery = _get_cfg()["discovery"]
+    if discovery["window"] <= 0:
+        raise ValueError(
+            "'discovery : window' is expected to be positive, but '{}' is given".format(discovery["window"])
+        )
+    if discovery["unseen_attempts"] < 0:
+        raise ValueError("'discovery : unseen_attempts' is expected to be non-negative, but '{}' is given".format(
+            discovery["unseen_attempts"]))
+    return dict(discovery, ttl=_to_interval(discovery["ttl"], "'discovery : ttl'"))
+
+
+def get_metrics():
+    metrics = _get_cfg()["metrics"]
+    if not 0 < metrics["port"] < 65536:
+        raise ValueError("'metrics : port' is expected to be a port number, but '{}' is given".format(metrics["port"]))
+    if metrics["textfile"] is not None and not isinstance(metrics["textfile"], str):
+        raise ValueError("'metrics : textfile' is expected to be a path, but '{}' is given".format(metrics["textfile"]))
+    return metrics
+
+
+def get_api():
+    api = _get_cfg()["api"]
+    if not 0 < api["port"] < 65536:
+        raise ValueError("'api : port' is expected to be a port number, but '{}' is given".format(api["port"]))
+    return dict(api, refresh_timeout=_to_interval(api["refresh_timeout"], "'api : refresh_timeout'"))
+
+
+def get_commands():
+    commands = _get_cfg()["commands"]
+    for chat in commands["chats"]:
+        if isinstance(chat, bool) or not isinstance(chat, (str, int)) or chat == "":
+            raise ValueError("'commands : chats' is expected to be chat ids or @usernames, but '{}' is given".format(
+                chat))
+    return dict(
+        commands, refresh_timeout=_to_interval(commands["refresh_timeout"], "'commands : refresh_timeout'"),
+        poll_timeout=_to_interval(commands["poll_timeout"], "'commands : poll_timeout'")
+    )
+
+
+def get_mqtt():
+    mqtt = _get_cfg()["mqtt"]
+    if not 0 < mqtt["port"] < 65536:
+        raise ValueError("'mqtt : port' is expected to be a port number, but '{}' is given".format(mqtt["port"]))
+    if mqtt["qos"] not in (0, 1, 2):
+        raise ValueError("'mqtt : qos' is expected to be 0, 1 or 2, but '{}' is given".format(mqtt["qos"]))
+    for key in ("topic_prefix", "discovery_prefix"):
+        if mqtt[key] == "" or any(c in mqtt[key] for c in "+#"):
+            raise ValueError("'mqtt : {}' is expected to be a topic without wildcards, but '{}' is given".format(
+                key, mqtt[key]))
+    return dict(mqtt, queue_size=_to_interval(mqtt["queue_size"], "'mqtt : queue_size'"))
+
+
+def get_store():
+    store = _get_cfg()["store"]
+    for key in ("raw_retention", "hourly_retention"):
+        if store[key] <= 0:
+            raise ValueError("'store : {}' is expected to be positive, but '{}' is given".format(key, store[key]))
+    return store
+
+
+def get_history():
+    history = _get_cfg()["history"]
+    interval = _to_interval(history["interval"], "'history : interval'")
+    if history["enabled"] and not _get_cfg()["store"]["enabled"]:
+        raise ValueError("'history' needs the reading store, 'store : enabled' is expected to be true")
+    return dict(history, interval=interval)
+
+
+def get_alerts():
+    alerts = _get_cfg()["alerts"]
+    if alerts["renotify_interval"] < 0:
+        raise ValueError(
+            "'alerts : renotify_interval' is expected to be non-negative, but '{}' is given".format(
+                alerts["renotify_interval"])
+        )
+    for p, h in alerts["hysteresis"].items():
+        if p not in PARAMETERS:
+            raise ValueError("hysteresis parameter {} is not in supported list {}".format(p, PARAMETERS))
+        if not isinstance(h, (int, float)) or h < 0:
+            raise ValueError(
+                "hysteresis for '{}' is expected to be a non-negative number, but '{}' is given".format(p, h)
+            )
+    # values are back within a range once they're within it by the hysteresis, a hysteresis of half the range or more
+    # leaves nothing to recover into, so its alerts would never close
+    if len(alerts["hysteresis"]) > 0:
+        for name, sensor in get_sensors().items():
+            for p, b in sensor["wellbeing_range"].items():
+                h = alerts["hysteresis"].get(p, 0)
+                if h > 0 and b["min"] is not None and b["max"] is not None and 2 * h >= b["max"] - b["min"]:
+                    raise ValueError(
+                        "hysteresis for '{}' is expected to be less than half of '{}' range [{}, {}], but '{}' is "
+                        "given".format(p, name, b["min"], b["max"], h)
+                    )
+    return alerts
+
+
 def get_loglevel():
     config = _get_cfg()
     allowed = ["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"]
@@ -78,6 +380,36 @@ def get_adapter():
     return _get_non_empty("adapter")
 
 
+def _get_sensors_cfg():
+    # the shape every sensor getter relies on: {name: {...}}
+    sensors = _get_cfg()["sensors"]
+    if not isinstance(sensors, dict):
+        raise ValueError("'sensors' is expected to be a yaml mapping, but '{}' is given".format(sensors))
+    for name, item in sensors.items():
+        if not isinstance(item, dict):
+            raise ValueError("sensor '{}' is expected to be a yaml mapping, but '{}' is given".format(name, item))
+    return sensors
+
+
+def get_sensor_adapters():
+    default = get_adapter()
+    shards = _get_cfg()["adapters"]
+    if any(not isinstance(a, str) or a.strip() == "" for a in shards):
+        raise ValueError("'adapters' is expected to be a list of adapter names, but '{}' is given".format(shards))
+    shards = [a.strip() for a in shards] or [default]
+    result = {}
+    sharded = 0
+    for name, item in _get_sensors_cfg().items():
+        adapter = item.get("adapter")
+        if adapter is None or adapter == "":
+            adapter = shards[sharded % len(shards)]
+            sharded += 1
+        elif not isinstance(adapter, str):
+            raise ValueError("'adapter' is expected to be a string, but '{}' is given for '{}'".format(adapter, name))
+        result[name.strip()] = adapter.strip()
+    return result
+
+
 def get_telegram_token():
     return _get_non_empty("telegram", "token")
 
@@ -86,6 +418,17 @@ def get_telegram_channel():
     return _get_non_empty("telegram", "channel")
 
 
+def get_telegram_coalesce():
+    return _get_cfg()["telegram"]["coalesce"]
+
+
+def get_telegram_queue_size():
+    queue_size = _get_cfg()["telegram"]["queue_size"]
+    if queue_size <= 0:
+        raise ValueError("'telegram : queue_size' is expected to be positive, but '{}' is given".format(queue_size))
+    return queue_size
+
+
 def get_message_parse_mode():
     return _get_non_empty("telegram", "message", "parse_mode")
 
@@ -105,14 +448,19 @@ def get_message_templates():
 
 
 def get_sensors():
-    sensors = _get_cfg()["sensors"]
+    sensors = _get_sensors_cfg()
     if len(sensors) == 0:
         raise ValueError("No plant sensor found")
 
     result = {}
+    # equal ranges are one dict, a fleet of a few plant kinds keeps a few of them whatever the number of sensors; the
+    # settings are never changed once read
+    ranges = {}
     for name, item in sensors.items():
         if "mac" not in item or item["mac"] is None or item["mac"] == "":
             raise ValueError("'mac' is not defined for '{}'".format(name))
+        if not isinstance(item["mac"], str):
+            raise ValueError("'mac' is expected to be a string, but '{}' is given for '{}'".format(item["mac"], name))
         if "wellbeing_range" not in item:
             raise ValueError("'wellbeing_range' parameter is not defined for '{}'".format(name))
         wellbeing_range = item["wellbeing_range"]
@@ -126,16 +474,49 @@ def get_sensors():
         for p, r in wellbeing_range.items():
             if p not in PARAMETERS:
                 raise ValueError("parameter {} is not in supported list {} for '{}'".format(p, PARAMETERS, name))
+            if not isinstance(r, dict):
+                raise ValueError(
+                    "'{}' range is expected to be a yaml mapping, but '{}' is given for '{}'".format(p, r, name)
+                )
             try:
                 p_min = int(r["min"]) if "min" in r else None
                 p_max = int(r["max"]) if "max" in r else None
-            except ValueError as e:
+            except (TypeError, ValueError) as e:
                 raise ValueError(
                     "min and/or max are expected to be numerical for '{}' parameter for '{}'".format(p, name)
                 ) from e
             if p_min is not None and p_max is not None:
                 if p_min > p_max:
                     raise ValueError("Wrong '{}' parameter boundaries for '{}': [{},{}]".format(p, name, p_min, p_max))
-            val["wellbeing_range"][p] = {"min": p_min, "max": p_max}
+            boundary = {"min": p_min, "max": p_max}
+            boundary.update(_anomaly_rules(r, p, name))
+            val["wellbeing_range"][p] = ranges.setdefault(tuple(boundary.items()), boundary)
         result[name.strip()] = val
     return result
+
+
+def _anomaly_rules(boundary, param, name):
+    rules = {}
+    for rule in ("max_rate", "max_zscore"):
+        if rule in boundary:
+            if not isinstance(boundary[rule], (int, float)) or boundary[rule] <= 0:
+                raise ValueError("'{}' of '{}' parameter for '{}' is expected to be a positive number, but '{}' is "
+                                 "given".format(rule, param, name, boundary[rule]))
+            rules[rule] = boundary[rule]
+    if "stuck" in boundary:
+        if not isinstance(boundary["stuck"], int) or boundary["stuck"] < 2:
+            raise ValueError("'stuck' of '{}' parameter for '{}' is expected to be an integer of at least 2, but '{}' "
+                             "is given".format(param, name, boundary["stuck"]))
+        rules["stuck"] = boundary["stuck"]
+    return rules
+
+
+def get_sensor_intervals():
+    default = get_interval()
+    result = {}
+    for name, item in _get_sensors_cfg().items():
+        if "interval" in item:
+            result[name.strip()] = _to_interval(item["interval"], "'interval' for '{}'".format(name))
+        else:
+            result[name.strip()] = default
+    return result
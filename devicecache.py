@@ -0,0 +1,47 @@
+import logging
+import time
+from threading import Lock
+
+from storage import load_json, save_json
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeviceInfoCache(object):
+    # best effort: if the file can't be saved (e.g. a read-only data dir), entries are kept in memory only and the
+    # sensors are read as usual
+    def __init__(self, path, ttl):
+        self._path = path
+        self._ttl = ttl
+        self._entries = None
+        self._lock = Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = load_json(self._path, {})
+        return self._entries
+
+    def get(self, mac, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._load().get(mac.upper())
+        if entry is None or now - entry["verified"] > self._ttl:
+            return None
+        return entry
+
+    def put(self, mac, firmware, name, now=None):
+        entry = {"firmware": firmware, "name": name, "verified": time.time() if now is None else now}
+        with self._lock:
+            self._load()[mac.upper()] = entry
+            self._save()
+
+    def invalidate(self, mac):
+        with self._lock:
+            if self._load().pop(mac.upper(), None) is not None:
+                self._save()
+
+    def _save(self):
+        try:
+            save_json(self._path, self._entries)
+        except OSError as e:
+            _LOGGER.warning("Saving device info cache {} failed, it's kept in memory: {}".format(self._path, e))
@@ -0,0 +1,69 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+import advertisement
+import metrics
+from storage import load_json, save_json
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Discovery(object):
+    # which sensors the adapters hear and how well: a scan of every adapter, kept for ttl seconds (also between runs).
+    # While nothing is known, e.g. every scan failed, all sensors count as seen on the adapters they have.
+    # Sensors no adapter hears get unseen_attempts attempts, 0 skips them
+    def __init__(self, path, adapters, window, ttl, unseen_attempts=1, scan=None):
+        self.unseen_attempts = unseen_attempts
+        self._path = path
+        self._adapters = sorted(set(adapters))
+        self._window = window
+        self._ttl = ttl
+        self._scan = scan if scan is not None else advertisement.discover
+        self._state = load_json(path, None)
+        self._lock = Lock()
+
+    def refresh(self, macs, now=None):
+        # scans again if the last scan is too old or didn't look for all the macs; the macs looked for before are
+        # looked for again, in the daemon mode only the sensors due are given
+        now = time.time() if now is None else now
+        macs = {mac.upper() for mac in macs}
+        with self._lock:
+            state = self._state
+        if state is not None and now - state["at"] < self._ttl and macs <= set(state["macs"]):
+            return
+        macs = sorted(macs | set(state["macs"] if state is not None else ()))
+        with metrics.timer("discovery"):
+            with ThreadPoolExecutor(max_workers=len(self._adapters), thread_name_prefix="discovery") as executor:
+                results = list(executor.map(lambda adapter: self._scan(adapter, self._window, macs), self._adapters))
+        seen = {}
+        for adapter, heard in zip(self._adapters, results):
+            for mac, rssi in (heard or {}).items():
+                seen.setdefault(mac, {})[adapter] = rssi
+        if all(heard is None for heard in results):
+            _LOGGER.warning("Discovery scan failed on every adapter, all sensors are tried")
+            # an expired scan isn't known anymore, sensors it didn't hear aren't put last for good
+            if state is not None and now - state["at"] >= self._ttl:
+                with self._lock:
+                    self._state = None
+            return
+        _LOGGER.info("Discovery scan heard {}/{} sensors".format(len(seen), len(macs)))
+        with self._lock:
+            self._state = {"at": now, "macs": macs, "seen": seen}
+            try:
+                save_json(self._path, self._state)
+            except OSError as e:
+                _LOGGER.error("Saving discovery scan failed", exc_info=e)
+
+    def is_seen(self, mac):
+        with self._lock:
+            return self._state is None or mac.upper() in self._state["seen"]
+
+    def best_adapter(self, mac):
+        # the adapter which hears the sensor best, None if none hears it
+        with self._lock:
+            heard = self._state["seen"].get(mac.upper()) if self._state is not None else None
+        if not heard:
+            return None
+        return max(sorted(heard), key=lambda adapter: heard[adapter])
@@ -0,0 +1,40 @@
+import numpy as np
+
+from parameters import PARAMETERS
+
+
+class FleetRangeEvaluator(object):
+    # the same check as RangeCheckerEvaluator, but for all sensors at once:
+    # boundaries are (sensors x parameters) matrices, open boundaries are infinities
+    def __init__(self, sensors_config):
+        self.names = list(sensors_config)
+        self.parameters = tuple(PARAMETERS)
+        self._columns = {param: j for j, param in enumerate(self.parameters)}
+        self.min = np.full((len(self.names), len(self.parameters)), -np.inf)
+        self.max = np.full((len(self.names), len(self.parameters)), np.inf)
+        for i, name in enumerate(self.names):
+            for p, b in sensors_config[name]["wellbeing_range"].items():
+                if b["min"] is not None:
+                    self.min[i, self._columns[p]] = b["min"]
+                if b["max"] is not None:
+                    self.max[i, self._columns[p]] = b["max"]
+
+    def to_matrix(self, readings):
+        # None (and a missing sensor or parameter) becomes NaN
+        missing = {}
+        return np.array(
+            [[readings.get(name, missing).get(p) for p in self.parameters] for name in self.names], dtype=np.float64
+        )
+
+    def need_to_notify(self, values):
+        # NaN stands for a parameter which wasn't read, it never needs a notification
+        with np.errstate(invalid="ignore"):
+            return (values < self.min) | (values > self.max)
+
+    def evaluate(self, readings):
+        values = self.to_matrix(readings)
+        rows, columns = np.nonzero(self.need_to_notify(values))
+        return [
+            (self.names[i], self.parameters[j], readings[self.names[i]][self.parameters[j]])
+            for i, j in zip(rows.tolist(), columns.tolist())
+        ]
@@ -0,0 +1,83 @@
+import logging
+import time
+from threading import Lock
+
+import metrics
+from storage import load_json, save_json
+
+_LOGGER = logging.getLogger(__name__)
+_RECORD_SIZE = 16
+# what the sensor returns for a record which was never written
+_INVALID_RECORDS = (
+    b"\xff" * _RECORD_SIZE, b"\x00" * _RECORD_SIZE, bytes.fromhex("aabbccddeeff99887766554433221110")
+)
+
+
+# an hourly history record: device time (seconds since the sensor's start), temperature, light, moisture and
+# conductivity; battery isn't logged. None for an invalid record
+def decode_record(record):
+    if len(record) < _RECORD_SIZE or record[:_RECORD_SIZE] in _INVALID_RECORDS:
+        return None
+    device_time = int.from_bytes(record[0:4], "little")
+    return device_time, {
+        "temperature": int.from_bytes(record[4:6], "little", signed=True) / 10.0,
+        "light": int.from_bytes(record[7:10], "little"),
+        "moisture": record[11],
+        "conductivity": int.from_bytes(record[12:14], "little")
+    }
+
+
+class HistorySync(object):
+    # downloads the sensors' on-device history logs into the reading store every interval; a cursor per mac keeps the
+    # number of records synced and the device time of the last one, so only new records are read. With clear the log
+    # is cleared once its records are stored, records which are stored already are never stored again
+    def __init__(self, path, store, interval, clear=False):
+        self._path = path
+        self._store = store
+        self._interval = interval
+        self._clear = clear
+        self._cursors = load_json(path, {})
+        self._lock = Lock()
+
+    def due(self, mac, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            cursor = self._cursors.get(mac.upper())
+        return cursor is None or now - cursor["synced_at"] >= self._interval
+
+    def sync(self, sensor, now=None):
+        # the number of records stored, raises PlantSensorException if the sensor can't be read
+        mac = sensor.mac.upper()
+        with self._lock:
+            cursor = dict(self._cursors.get(mac, {"index": 0, "last_time": None, "stored_until": 0}))
+        stored = []
+
+        def commit(records, offset, count):
+            last_time = cursor["last_time"]
+            stored_until = cursor["stored_until"]
+            for record in records:
+                decoded = decode_record(record)
+                if decoded is None:
+                    continue
+                last_time = decoded[0]
+                timestamp = int(round(decoded[0] + offset))
+                if timestamp > cursor["stored_until"]:
+                    self._store.append(sensor.name, decoded[1], timestamp)
+                    stored_until = max(stored_until, timestamp)
+                    stored.append(timestamp)
+            self._save(mac, {
+                "index": 0 if self._clear else count, "last_time": last_time, "stored_until": stored_until,
+                "synced_at": time.time() if now is None else now
+            })
+            return True
+
+        sensor.read_history(cursor["index"], cursor["last_time"], commit, self._clear)
+        metrics.inc("history_records", len(stored), sensor=sensor.name)
+        _LOGGER.info("{} sensor history is synced, {} new record{}".format(
+            sensor.name, len(stored), "" if len(stored) == 1 else "s"))
+        return len(stored)
+
+    def _save(self, mac, cursor):
+        with self._lock:
+            self._cursors[mac] = cursor
+            save_json(self._path, self._cursors)
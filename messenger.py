@@ -1,56 +1,252 @@
-import sys
+import logging
+import queue
+import time
+from threading import Event, Lock, Thread
+from types import MappingProxyType
 
-from telegram import Bot
+import metrics
+from boundaries import BoundaryTable
+from parameters import INDEX, PARAMETERS
+
+_LOGGER = logging.getLogger(__name__)
+_MESSAGE_LIMIT = 4096
+_STOP = object()
 
 
 class Messenger(object):
-    def __init__(self, token, channel, parser_mode, render):
-        self._bot = Bot(token)
-        self._channel = channel
+    # python-telegram-bot is imported when the first message is sent, most checks don't send any
+    def __init__(self, token, channel, parser_mode, render, base_url=None):
+        self._token = token
+        self._base_url = base_url
+        self._bot = None
+        self.channel = channel
         self._parser_mode = parser_mode
-        self._render = render
+        self.render = render
+
+    def send(self, name, param, value):
+        self.send_text(self.render.prepare(name, param, value))
+
+    def send_recovered(self, name, param, value):
+        self.send_text(self.render.prepare_recovered(name, param, value))
+
+    def send_anomaly(self, name, param, value, rule):
+        self.send_text(self.render.prepare_anomaly(name, param, value, rule))
+
+    def send_dark(self, name, health):
+        self.send_text(self.render.prepare_dark(name, health))
+
+    def send_text(self, text):
+        with metrics.timer("phase", phase="send"):
+            self._get_bot().send_message(self.channel, text, parse_mode=self._parser_mode)
+
+    def reply(self, chat_id, text):
+        # a plain text answer to a command, readings and plant names aren't escaped for the parse mode
+        self._get_bot().send_message(chat_id, text)
+
+    def get_updates(self, offset=None, timeout=0):
+        # (update id, chat id, chat username, text) of new messages and channel posts, waits for them up to timeout
+        # seconds (long polling)
+        updates = []
+        for update in self._get_bot().get_updates(offset, timeout=timeout, allowed_updates=["message", "channel_post"]):
+            message = update.effective_message
+            if message is None:
+                updates.append((update.update_id, None, None, None))
+            else:
+                updates.append((update.update_id, message.chat.id, message.chat.username, message.text))
+        return updates
+
+    def _get_bot(self):
+        if self._bot is None:
+            from telegram import Bot
+            self._bot = Bot(self._token, base_url=self._base_url)
+        return self._bot
+
+
+def _join(texts, limit=_MESSAGE_LIMIT):
+    messages = []
+    for text in texts:
+        if len(messages) > 0 and len(messages[-1]) + 2 + len(text) <= limit:
+            messages[-1] += "\n\n" + text
+        else:
+            messages.append(text)
+    return messages
+
+
+class Dispatcher(object):
+    # sends messenger's messages from a background thread, so a slow or rate limiting Telegram API
+    # never stalls sensor polling; with coalesce, messages of one cycle are joined into one per channel
+    def __init__(self, messenger, queue_size=100, coalesce=False, max_attempts=5, backoff=1.0):
+        self._messenger = messenger
+        self._coalesce = coalesce
+        self._max_attempts = max_attempts
+        self._backoff = backoff
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, name="dispatcher", daemon=True)
+        self._thread.start()
 
     def send(self, name, param, value):
-        self._bot.send_message(
-            self._channel,
-            self._render.prepare(name, param, value),
-            parse_mode=self._parser_mode
-        )
+        self._submit(self._messenger.render.prepare(name, param, value))
+
+    def send_recovered(self, name, param, value):
+        self._submit(self._messenger.render.prepare_recovered(name, param, value))
+
+    def send_anomaly(self, name, param, value, rule):
+        self._submit(self._messenger.render.prepare_anomaly(name, param, value, rule))
+
+    def send_dark(self, name, health):
+        self._submit(self._messenger.render.prepare_dark(name, health))
+
+    def send_text(self, text):
+        self._submit(text)
 
+    def _submit(self, text):
+        if self._coalesce:
+            with self._lock:
+                self._pending.setdefault(self._messenger.channel, []).append(text)
+        else:
+            self._enqueue(text)
 
-def _render_boundaries(boundary):
-    if boundary["min"] is not None and boundary["max"] is not None:
-        return "[{}, {}]".format(boundary["min"], boundary["max"])
-    elif boundary["min"] is not None:
-        return "≥ {}".format(boundary["min"])
-    elif boundary["max"] is not None:
-        return "≤ {}".format(boundary["max"])
-    return ""
+    def end_cycle(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = {}
+        for texts in pending.values():
+            for text in _join(texts):
+                self._enqueue(text)
+
+    def close(self, timeout=None):
+        # queued messages are sent first; if the queue stays full for timeout seconds (the sender waits out a
+        # rate limit), the sender stops after its current message and the rest are dropped
+        self.end_cycle()
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            _LOGGER.warning("Message queue is still full, {} queued messages are dropped".format(self._queue.qsize()))
+            self._stopped.set()
+        self._thread.join(timeout)
+
+    def _enqueue(self, text):
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            metrics.inc("messages", result="dropped")
+            _LOGGER.error("Message queue is full, dropping message: {}".format(text))
+
+    def _run(self):
+        while not self._stopped.is_set():
+            text = self._queue.get()
+            if text is _STOP:
+                return
+            self._deliver(text)
+
+    def _deliver(self, text):
+        from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+        for attempt in range(1, self._max_attempts + 1):
+            try:
+                self._messenger.send_text(text)
+                metrics.inc("messages", result="sent")
+                return
+            except RetryAfter as e:
+                error, delay = e, e.retry_after
+            except BadRequest as e:
+                metrics.inc("messages", result="rejected")
+                _LOGGER.error("Telegram rejected message: {}".format(text), exc_info=e)
+                return
+            except NetworkError as e:
+                error, delay = e, self._backoff * 2 ** (attempt - 1)
+            except TelegramError as e:
+                metrics.inc("messages", result="failed")
+                _LOGGER.error("Sending message failed: {}".format(text), exc_info=e)
+                return
+            if attempt < self._max_attempts:
+                metrics.inc("message_retries")
+                _LOGGER.warning("Sending message failed ({}), retrying in {}s".format(error, delay))
+                time.sleep(delay)
+        metrics.inc("messages", result="failed")
+        _LOGGER.error("Giving up sending message after {} attempts: {}".format(self._max_attempts, text))
 
 
 class AlertMessageRender(object):
-    def __init__(self, sensors_config, templates_config):
+    # boundaries come from the table shared with the evaluators, a table of its own without one
+    def __init__(self, sensors_config, templates_config, table=None):
         self.templates = templates_config
-        self.boundaries = {}
+        self.table = table if table is not None else BoundaryTable()
         for name, s in sensors_config.items():
-            self.boundaries[name] = {}
-            for p, b in s["wellbeing_range"].items():
-                self.boundaries[name][p] = _render_boundaries(b)
+            self.set_sensor(name, s)
+
+    def set_sensor(self, name, sensor_config):
+        self.table.set_sensor(name, sensor_config)
+
+    def remove_sensor(self, name):
+        self.table.remove_sensor(name)
+
+    def _boundaries(self, name, param):
+        return self.table.boundary(name, param).text
 
     def prepare(self, name, param, value):
-        return self.templates[param].format(plant=name, boundaries=self.boundaries[name][param], value=value)
+        with metrics.timer("phase", phase="render", sensor=name):
+            return self.templates[param].format(plant=name, boundaries=self._boundaries(name, param), value=value)
+
+    def prepare_recovered(self, name, param, value):
+        with metrics.timer("phase", phase="render", sensor=name):
+            return self.templates["recovered"].format(
+                plant=name, parameter=param, boundaries=self._boundaries(name, param), value=value
+            )
+
+    def prepare_anomaly(self, name, param, value, rule):
+        with metrics.timer("phase", phase="render", sensor=name):
+            return self.templates[rule].format(
+                plant=name, parameter=param, boundaries=self._boundaries(name, param), value=value
+            )
+
+    def prepare_dark(self, name, health):
+        # health is the sensor's SensorHealth record
+        last_success = health["last_success"]
+        with metrics.timer("phase", phase="render", sensor=name):
+            return self.templates["dark"].format(
+                plant=name, failures=health["failures"], error=health["last_error"],
+                last_success="never" if last_success is None else time.strftime(
+                    "%Y-%m-%d %H:%M", time.localtime(last_success))
+            )
 
 
 class RangeCheckerEvaluator(object):
-    def __init__(self, sensor_config):
-        self.boundaries = {}
-        for p, b in sensor_config["wellbeing_range"].items():
-            self.boundaries[p] = {
-                "min": b["min"] if b["min"] is not None else ~sys.maxsize,
-                "max": b["max"] if b["max"] is not None else sys.maxsize
-            }
+    # what the last update() found besides the boundaries, {parameter: rule}; boundaries alone never find anything, so
+    # it's one read-only empty mapping for all of them
+    anomalies = MappingProxyType({})
 
-    def need_to_notify(self, param, value):
-        if param not in self.boundaries:
+    def __init__(self, sensor_config, hysteresis=None, table=None):
+        if table is None:
+            table = BoundaryTable(hysteresis)
+        # a row of the given table, which has the hysteresis then; sensors of the same ranges share it
+        self._row = table.row(sensor_config["wellbeing_range"])
+
+    @property
+    def boundaries(self):
+        # {parameter: {"min": ..., "max": ...}} of the parameters with a range, open ends are the lowest/highest ints
+        return {p: {"min": b.min, "max": b.max} for p, b in zip(PARAMETERS, self._row) if b is not None}
+
+    def _boundary(self, param):
+        i = INDEX.get(param)
+        return self._row[i] if i is not None else None
+
+    def update(self, readings, timestamp, ages=None):
+        pass
+
+    def out_of_range(self, param, value):
+        boundary = self._boundary(param)
+        if boundary is None:
             return False
-        return not self.boundaries[param]["min"] <= value <= self.boundaries[param]["max"]
+        return not boundary.min <= value <= boundary.max
+
+    def need_to_notify(self, param, value):
+        return self.out_of_range(param, value)
+
+    def is_recovered(self, param, value):
+        boundary = self._boundary(param)
+        if boundary is None:
+            return True
+        return boundary.recovery_min <= value <= boundary.recovery_max
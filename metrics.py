@@ -0,0 +1,150 @@
+import logging
+import os
+from contextlib import nullcontext
+from threading import Lock, Thread
+from time import perf_counter
+
+_LOGGER = logging.getLogger(__name__)
+_PREFIX = "plantcare_"
+_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+_DISABLED = nullcontext()
+# instrumentation calls are no-ops until enable() is called, so disabled metrics cost a global lookup per call
+_registry = None
+
+
+class Registry(object):
+    def __init__(self):
+        self._lock = Lock()
+        self._counters = {}
+        self._timings = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            timing = self._timings.setdefault(key, [0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, _labels(labels)), 0)
+
+    def timing(self, name, **labels):
+        return tuple(self._timings.get((name, _labels(labels)), (0, 0.0)))
+
+    def render(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timings = sorted(self._timings.items())
+        lines = []
+        family = None
+        for (name, labels), value in counters:
+            if name != family:
+                family = name
+                lines.append("# TYPE {}{}_total counter".format(_PREFIX, name))
+            lines.append("{}{}_total{} {}".format(_PREFIX, name, _render_labels(labels), value))
+        family = None
+        for (name, labels), (count, total) in timings:
+            if name != family:
+                family = name
+                lines.append("# TYPE {}{}_seconds summary".format(_PREFIX, name))
+            lines.append("{}{}_seconds_count{} {}".format(_PREFIX, name, _render_labels(labels), count))
+            lines.append("{}{}_seconds_sum{} {:.6f}".format(_PREFIX, name, _render_labels(labels), total))
+        return "\n".join(lines) + "\n"
+
+
+class _Timer(object):
+    __slots__ = ("_registry", "_name", "_labels", "_start")
+
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._registry.observe(self._name, self._labels, perf_counter() - self._start)
+        return False
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _render_labels(labels):
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for k, v in labels
+    ) + "}"
+
+
+def enable():
+    global _registry
+    _registry = Registry()
+    return _registry
+
+
+def disable():
+    global _registry
+    _registry = None
+
+
+def inc(name, amount=1, **labels):
+    if _registry is not None:
+        _registry.inc(name, _labels(labels), amount)
+
+
+def timer(name, **labels):
+    if _registry is None:
+        return _DISABLED
+    return _Timer(_registry, name, _labels(labels))
+
+
+def render():
+    return _registry.render() if _registry is not None else ""
+
+
+def write_textfile(path):
+    # for node_exporter's textfile collector, which must never see a half written file
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(render())
+    os.replace(tmp, path)
+
+
+def serve(address, port):
+    # http.server is imported only when metrics are served, it's a noticeable part of the startup time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", _CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    _LOGGER.info("Serving metrics on http://{}:{}/metrics".format(address, server.server_port))
+    return server
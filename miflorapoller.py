@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from threading import Lock
+from time import time
+
+from bluepy.btle import BTLEException
+from btlewrap import BluepyBackend, BluetoothBackendException
+from miflora.miflora_poller import MiFloraPoller
+
+_adapter_locks = {}
+_HANDLE_READ_VERSION_BATTERY = 0x38
+_HANDLE_READ_SENSOR_DATA = 0x35
+_HANDLE_WRITE_MODE_CHANGE = 0x33
+_DATA_MODE_CHANGE = bytes([0xA0, 0x1F])
+_HANDLE_DEVICE_TIME = 0x41
+_HANDLE_HISTORY_CONTROL = 0x3e
+_HANDLE_HISTORY_READ = 0x3c
+_CMD_HISTORY_READ_INIT = b'\xa0\x00\x00'
+_CMD_HISTORY_READ_SUCCESS = b'\xa2\x00\x00'
+_CMD_HISTORY_READ_RECORD = b'\xa1'
+BLE_ERRORS = (IOError, BluetoothBackendException, BTLEException, RuntimeError, BrokenPipeError)
+DEFAULT_BACKEND = BluepyBackend
+
+
+class _AdapterBluetoothInterface(object):
+    # btlewrap's BluetoothInterface serialises all connections of the process behind one lock,
+    # here connections are serialised per adapter, so sensors on different adapters can be read in parallel
+    def __init__(self, backend, adapter):
+        self._backend = backend(adapter=adapter)
+        self._lock = _adapter_locks.setdefault(adapter, Lock())
+
+    @contextmanager
+    def connect(self, mac):
+        with self._lock:
+            self._backend.connect(mac)
+            try:
+                yield self._backend
+            finally:
+                self._backend.disconnect()
+
+
+class AdapterMiFloraPoller(MiFloraPoller):
+    def __init__(self, mac, backend, adapter):
+        super().__init__(mac=mac, backend=backend, adapter=adapter)
+        self._bt_interface = _AdapterBluetoothInterface(backend, adapter)
+
+    def read_all(self, read_data=True, read_battery=True):
+        # sensor data and version/battery characteristics over one connection: up to 3 GATT operations,
+        # a characteristic which is not read is None
+        data = version_battery = None
+        operations = 0
+        with self._bt_interface.connect(self._mac) as connection:
+            if read_data:
+                connection.write_handle(_HANDLE_WRITE_MODE_CHANGE, _DATA_MODE_CHANGE)
+                data = connection.read_handle(_HANDLE_READ_SENSOR_DATA)
+                operations += 2
+            if read_battery:
+                version_battery = connection.read_handle(_HANDLE_READ_VERSION_BATTERY)
+                operations += 1
+        return data, version_battery, operations
+
+    def read_history(self, start, last_time, commit, clear=False):
+        # the device time and the history log records from start on over one connection: 3 GATT operations and 2 per
+        # record. If the record before start is not the one synced last (last_time is its device time), the log was
+        # cleared or wrapped and it's read from its beginning. commit(records, time_offset, count) gets the raw records
+        # and the offset of the device time from the wall time, the log is cleared only if it returns True
+        operations = 0
+        with self._bt_interface.connect(self._mac) as connection:
+            device_time = int.from_bytes(connection.read_handle(_HANDLE_DEVICE_TIME)[:4], "little")
+            offset = time() - device_time
+            connection.write_handle(_HANDLE_HISTORY_CONTROL, _CMD_HISTORY_READ_INIT)
+            count = int.from_bytes(connection.read_handle(_HANDLE_HISTORY_READ)[:2], "little")
+            operations += 3
+            if start > count:
+                start = 0
+            elif start > 0:
+                previous = self._read_record(connection, start - 1)
+                operations += 2
+                if int.from_bytes(previous[:4], "little") != last_time:
+                    start = 0
+            records = []
+            for index in range(start, count):
+                records.append(self._read_record(connection, index))
+                operations += 2
+            if commit(records, offset, count) and clear and count > 0:
+                connection.write_handle(_HANDLE_HISTORY_CONTROL, _CMD_HISTORY_READ_SUCCESS)
+                operations += 1
+        return operations
+
+    @staticmethod
+    def _read_record(connection, index):
+        connection.write_handle(_HANDLE_HISTORY_CONTROL, _CMD_HISTORY_READ_RECORD + index.to_bytes(2, "little"))
+        return connection.read_handle(_HANDLE_HISTORY_READ)
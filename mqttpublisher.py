@@ -0,0 +1,173 @@
+import json
+import logging
+import re
+from collections import deque
+from threading import Event, Lock, Thread
+
+import metrics
+
+_LOGGER = logging.getLogger(__name__)
+# Home Assistant sensor settings of the parameters
+_DISCOVERY = {
+    "light": {"device_class": "illuminance", "unit_of_measurement": "lx"},
+    "temperature": {"device_class": "temperature", "unit_of_measurement": "°C"},
+    "moisture": {"device_class": "moisture", "unit_of_measurement": "%"},
+    "conductivity": {"unit_of_measurement": "µS/cm", "icon": "mdi:flower"},
+    "battery": {"device_class": "battery", "unit_of_measurement": "%", "entity_category": "diagnostic"},
+}
+_MAX_RECONNECT_DELAY = 120
+
+
+def object_id(name):
+    # a sensor name as a topic level and Home Assistant id
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "sensor"
+
+
+class MqttPublisher(object):
+    # a readings listener which publishes every reading to an MQTT broker, over one connection kept (and re-established)
+    # by paho's network thread. Readings of a cycle are queued at the end of it and published from a background
+    # thread, so sensor polling never waits for the broker; while it's unreachable up to queue_size readings are
+    # kept, the oldest are dropped. A sensor parameter gets its Home Assistant discovery config when it's first
+    # published over a connection
+    def __init__(self, host, port, topic_prefix="plantcare", discovery_prefix="homeassistant", queue_size=10000, qos=1,
+                 client_id="plantcare", username=None, password=None, keepalive=60, reconnect_delay=1):
+        # paho is imported only when readings are published
+        import paho.mqtt.client as mqtt
+        self._mqtt = mqtt
+        self._topic_prefix = topic_prefix
+        self._discovery_prefix = discovery_prefix
+        self._qos = qos
+        self._status_topic = "{}/status".format(topic_prefix)
+        self._pending = []
+        self._queue = deque(maxlen=queue_size)
+        self._announced = set()
+        self._connected = False
+        self._closing = False
+        self._lock = Lock()
+        self._wake = Event()
+        self._online = Event()
+        self._client = mqtt.Client(client_id=client_id)
+        if username is not None:
+            self._client.username_pw_set(username, password)
+        self._client.will_set(self._status_topic, "offline", qos, retain=True)
+        self._client.reconnect_delay_set(reconnect_delay, max(reconnect_delay, _MAX_RECONNECT_DELAY))
+        self._client.on_connect = self._on_connect
+        self._client.on_disconnect = self._on_disconnect
+        self._client.connect_async(host, port, keepalive)
+        self._client.loop_start()
+        self._thread = Thread(target=self._run, name="mqtt", daemon=True)
+        self._thread.start()
+
+    @property
+    def connected(self):
+        with self._lock:
+            return self._connected
+
+    def state_topic(self, name):
+        return "{}/{}/state".format(self._topic_prefix, object_id(name))
+
+    def on_readings(self, name, readings, timestamp):
+        with self._lock:
+            self._pending.append((name, dict(readings), timestamp))
+
+    def end_cycle(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+            dropped = max(len(self._queue) + len(batch) - self._queue.maxlen, 0)
+            self._queue.extend(batch)
+        if dropped > 0:
+            metrics.inc("mqtt_messages", dropped, result="dropped")
+            _LOGGER.warning("MQTT queue is full, {} oldest readings are dropped".format(dropped))
+        self._wake.set()
+
+    def close(self, timeout=None):
+        # publishes what's queued, once the broker is connected if it isn't yet (e.g. right after a one-off check),
+        # then disconnects
+        self.end_cycle()
+        with self._lock:
+            queued = len(self._queue) > 0
+        if queued:
+            self._online.wait(timeout)
+        self._closing = True
+        self._wake.set()
+        self._thread.join(timeout)
+        if self.connected:
+            # a graceful disconnect doesn't publish the last will; the status is queued after the readings, so they're
+            # acknowledged by then
+            try:
+                self._client.publish(self._status_topic, "offline", self._qos, retain=True).wait_for_publish(timeout)
+            except (RuntimeError, ValueError):
+                pass
+        self._client.disconnect()
+        self._client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            _LOGGER.error("MQTT broker refused the connection: {}".format(self._mqtt.connack_string(rc)))
+            return
+        _LOGGER.info("Connected to MQTT broker")
+        client.publish(self._status_topic, "online", self._qos, retain=True)
+        with self._lock:
+            self._connected = True
+            self._announced = set()
+        self._online.set()
+        self._wake.set()
+
+    def _on_disconnect(self, client, userdata, rc):
+        with self._lock:
+            self._connected = False
+        self._online.clear()
+        if rc != 0:
+            _LOGGER.warning("Lost MQTT broker connection, reconnecting")
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self._flush()
+            if self._closing:
+                return
+
+    def _flush(self):
+        while True:
+            with self._lock:
+                if not self._connected or len(self._queue) == 0:
+                    return
+                name, readings, timestamp = self._queue.popleft()
+                new = [(name, p) for p in readings if (name, p) not in self._announced]
+                self._announced.update(new)
+            messages = [self._discovery(n, p) for n, p in new if p in _DISCOVERY]
+            state = {p: v for p, v in readings.items() if v is not None}
+            state["timestamp"] = timestamp
+            messages.append((self.state_topic(name), json.dumps(state), False))
+            for topic, payload, retain in messages:
+                info = self._client.publish(topic, payload, self._qos, retain)
+                if info.rc != self._mqtt.MQTT_ERR_SUCCESS:
+                    self._requeue(name, readings, timestamp, new)
+                    return
+            metrics.inc("mqtt_messages", result="published")
+
+    def _requeue(self, name, readings, timestamp, new):
+        # the connection is lost in the middle of publishing, the readings go back to the head of the queue
+        with self._lock:
+            self._announced.difference_update(new)
+            if len(self._queue) < self._queue.maxlen:
+                self._queue.appendleft((name, readings, timestamp))
+                return
+        metrics.inc("mqtt_messages", result="dropped")
+
+    def _discovery(self, name, param):
+        # a retained Home Assistant discovery config of a sensor parameter
+        node = object_id(name)
+        payload = dict(
+            _DISCOVERY[param],
+            name="{} {}".format(name, param),
+            unique_id="plantcare_{}_{}".format(node, param),
+            state_topic=self.state_topic(name),
+            value_template="{{{{ value_json.{} }}}}".format(param),
+            availability_topic=self._status_topic,
+            device={"identifiers": ["plantcare_{}".format(node)], "name": name, "manufacturer": "Xiaomi",
+                    "model": "Mi Flora"},
+        )
+        topic = "{}/sensor/{}/{}/config".format(self._discovery_prefix, node, param)
+        return topic, json.dumps(payload), True
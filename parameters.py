@@ -0,0 +1,5 @@
+# sensor parameter aliases, in the order they are stored; kept apart from plantsensor, so the configuration
+# can be validated without importing the Bluetooth stack
+PARAMETERS = ("light", "temperature", "moisture", "conductivity", "battery")
+# a parameter's position in PARAMETERS, compact records (see reading and boundaries) are tuples in that order
+INDEX = {p: i for i, p in enumerate(PARAMETERS)}
@@ -1,69 +1,634 @@
 #!/usr/bin/env python3
+import argparse
 import logging
-from time import sleep
+import os
+import random
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from time import monotonic, time
 
+import advertisement
+import api
 import config
-from messenger import Messenger, AlertMessageRender, RangeCheckerEvaluator
+from adaptive import AdaptiveIntervals
+import metrics
+from alertstate import AlertState
+from anomaly import RULES, AnomalyState, StreamingEvaluator
+from boundaries import BoundaryTable
+from commands import CommandBot
+from devicecache import DeviceInfoCache
+from discovery import Discovery
+from historysync import HistorySync
+from parameters import PARAMETERS
+from messenger import Messenger, AlertMessageRender, Dispatcher, RangeCheckerEvaluator
+from mqttpublisher import MqttPublisher
 from plantsensor import PlantSensor, PlantSensorException
+from readingstore import ReadingStore
+from scheduler import Scheduler
+from sensorhealth import SensorHealth
 
 _LOGGER = logging.getLogger(__name__)
 _SLEEP = 5
+_MAX_BACKOFF = 60
+_JITTER = 0.2
+_SHUTDOWN_TIMEOUT = 60
+_RELOAD_POLL = 5
+_REFRESH_POLL = 1
 
 
-def main():
+def main(daemon=False):
     try:
-        max_attempts = config.get_max_attempts()
-        adapter = config.get_adapter()
-        telegram_token = config.get_telegram_token()
-        telegram_channel = config.get_telegram_channel()
-        sensors = config.get_sensors()
-        message_parser_mode = config.get_message_parse_mode()
-        message_templates = config.get_message_templates()
+        settings = _read_config(daemon)
     except ValueError as e:
         _LOGGER.exception("Reading configuration failed", exc_info=e)
         exit(1)
     else:
+        sensors = settings["sensors"]
+        data_dir = settings["data_dir"]
+        store_config = settings["store"]
+        metrics_config = settings["metrics"]
         _LOGGER.info("Configured sensors: {}".format(sensors))
-        message_render = AlertMessageRender(sensors, message_templates)
-        messenger = Messenger(telegram_token, telegram_channel, message_parser_mode, message_render)
-        evaluators = {name: RangeCheckerEvaluator(sensor) for name, sensor in sensors.items()}
-        queue = [PlantSensor(adapter, name, sensor["mac"]) for name, sensor in sensors.items()]
-        success = check_sensors(queue, max_attempts, messenger, evaluators)
-        _LOGGER.info("Done. {}/{} are successfully processed".format(success, len(sensors)))
-
-
-def check_sensors(queue, max_attempts, messenger, evaluators):
-    lap = 1
-    total_size = len(queue)
-    to_retry = len(queue)
-    while len(queue) > 0 and lap <= max_attempts:
-        sensor = queue.pop(0)
-        to_retry -= 1
+        metrics_server = None
+        if metrics_config["enabled"]:
+            metrics.enable()
+            if daemon:
+                metrics_server = metrics.serve(metrics_config["address"], metrics_config["port"])
+        # one table of wellbeing ranges for the evaluators and messages
+        boundaries = BoundaryTable(settings["alerts"]["hysteresis"])
+        message_render = AlertMessageRender(sensors, settings["message_templates"], boundaries)
+        messenger = Dispatcher(
+            Messenger(
+                settings["telegram_token"], settings["telegram_channel"], settings["message_parse_mode"],
+                message_render
+            ),
+            settings["telegram_queue_size"], settings["telegram_coalesce"]
+        )
+        anomalies = AnomalyState(os.path.join(data_dir, "anomalies.json"))
+        evaluators = {
+            name: _new_evaluator(name, sensor, settings["alerts"]["hysteresis"], anomalies, boundaries)
+            for name, sensor in sensors.items()
+        }
+        alerts = None
+        if settings["alerts"]["enabled"]:
+            alerts = AlertState(
+                os.path.join(data_dir, "alerts.json"), settings["alerts"]["renotify_interval"],
+                settings["alerts"]["recovery_message"]
+            )
+        device_cache = None
+        if settings["firmware_check_ttl"] > 0:
+            device_cache = DeviceInfoCache(os.path.join(data_dir, "devices.json"), settings["firmware_check_ttl"])
+        queue = [_new_sensor(name, sensor, settings, device_cache) for name, sensor in sensors.items()]
+        listeners = []
+        store = None
+        if store_config["enabled"]:
+            store = ReadingStore(os.path.join(data_dir, "readings"))
+            listeners.append(store)
+        history = None
+        if settings["history"]["enabled"]:
+            history = HistorySync(
+                os.path.join(data_dir, "history.json"), store, settings["history"]["interval"],
+                settings["history"]["clear"]
+            )
+        publisher = None
+        if settings["mqtt"]["enabled"]:
+            publisher = _new_publisher(settings["mqtt"])
+            listeners.append(publisher)
+        passive_window = settings["passive"]["window"] if settings["passive"]["enabled"] else 0
+        health = None
+        if settings["health"]["enabled"]:
+            health = SensorHealth(
+                os.path.join(data_dir, "health.json"), settings["health"]["threshold"],
+                settings["health"]["probe_interval"], settings["health"]["max_probe_interval"]
+            )
+        discovery = None
+        if settings["discovery"]["enabled"]:
+            discovery = Discovery(
+                os.path.join(data_dir, "discovery.json"), settings["adapters"].values(),
+                settings["discovery"]["window"], settings["discovery"]["ttl"], settings["discovery"]["unseen_attempts"]
+            )
+        if daemon:
+            stop = Event()
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *_: stop.set())
+            adaptive = None
+            if settings["adaptive"]["enabled"]:
+                adaptive = AdaptiveIntervals(
+                    settings["adaptive"]["min_interval"], settings["adaptive"]["max_interval"],
+                    settings["adaptive"]["history"]
+                )
+                listeners.append(adaptive)
+            reload = None
+            if config.get_config_file() is not None:
+                reload = ConfigReloader(
+                    settings, queue, evaluators, message_render, device_cache, anomalies, adaptive
+                )
+            api_server = command_bot = latest = refresh = None
+            commands_config = settings["commands"]
+            if settings["api"]["enabled"] or commands_config["enabled"]:
+                # the API and the commands answer from the same latest readings and share pending refreshes
+                latest = api.LatestReadings()
+                listeners.append(latest)
+            if settings["api"]["enabled"] or (commands_config["enabled"] and commands_config["refresh"]):
+                refresh = api.RefreshRequests()
+            if settings["api"]["enabled"]:
+                api_server = api.serve(
+                    settings["api"]["address"], settings["api"]["port"], latest, evaluators, alerts, refresh,
+                    settings["api"]["refresh_timeout"]
+                )
+            if commands_config["enabled"]:
+                command_bot = CommandBot(
+                    Messenger(
+                        settings["telegram_token"], settings["telegram_channel"], settings["message_parse_mode"],
+                        message_render
+                    ),
+                    commands_config["chats"] or [settings["telegram_channel"]], latest, evaluators, alerts, store,
+                    refresh if commands_config["refresh"] else None, commands_config["refresh_timeout"],
+                    commands_config["poll_timeout"]
+                ).start()
+            run_daemon(
+                queue, settings["intervals"], settings["max_attempts"], messenger, evaluators, stop, listeners,
+                lambda: _after_cycle(messenger, store, store_config, alerts, anomalies, health, publisher), alerts,
+                settings["cycle_timeout"], passive_window, reload, adaptive, history, refresh, discovery, health
+            )
+            if api_server is not None:
+                api_server.shutdown()
+            if command_bot is not None:
+                command_bot.stop()
+            _LOGGER.info("Stopped")
+        else:
+            success = check_sensors(
+                queue, settings["max_attempts"], messenger, evaluators, listeners=listeners, alerts=alerts,
+                cycle_timeout=settings["cycle_timeout"], passive_window=passive_window, history=history,
+                discovery=discovery, health=health
+            )
+            _LOGGER.info("Done. {}/{} are successfully processed".format(success, len(sensors)))
+            _after_cycle(messenger, store, store_config, alerts, anomalies, health, publisher)
+        if store is not None:
+            store.close()
+        if publisher is not None:
+            publisher.close(_SHUTDOWN_TIMEOUT)
+        messenger.close(_SHUTDOWN_TIMEOUT)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+        elif metrics_config["enabled"]:
+            try:
+                metrics.write_textfile(metrics_config["textfile"] or os.path.join(data_dir, "plantcare.prom"))
+            except OSError as e:
+                _LOGGER.error("Writing metrics failed", exc_info=e)
+
+
+def check_config():
+    try:
+        settings = _read_config(daemon=True)
+    except ValueError as e:
+        _LOGGER.error("Configuration is not valid: {}".format(e))
+        return False
+    _LOGGER.info("Configuration is valid, {} sensor{} configured".format(
+        len(settings["sensors"]), "s" if len(settings["sensors"]) > 1 else ""))
+    return True
+
+
+def _read_config(daemon=False):
+    # every setting is read (and so validated) at once, so a configuration is either fully valid or rejected
+    return {
+        "max_attempts": config.get_max_attempts(),
+        "adapters": config.get_sensor_adapters(),
+        "telegram_token": config.get_telegram_token(),
+        "telegram_channel": config.get_telegram_channel(),
+        "telegram_coalesce": config.get_telegram_coalesce(),
+        "telegram_queue_size": config.get_telegram_queue_size(),
+        "sensors": config.get_sensors(),
+        "message_parse_mode": config.get_message_parse_mode(),
+        "message_templates": config.get_message_templates(),
+        "intervals": config.get_sensor_intervals() if daemon else None,
+        "adaptive": config.get_adaptive(),
+        "data_dir": config.get_data_dir(),
+        "firmware_check_ttl": config.get_firmware_check_ttl(),
+        "freshness": config.get_freshness(),
+        "store": config.get_store(),
+        "alerts": config.get_alerts(),
+        "cycle_timeout": config.get_cycle_timeout(),
+        "passive": config.get_passive(),
+        "discovery": config.get_discovery(),
+        "health": config.get_health(),
+        "metrics": config.get_metrics(),
+        "api": config.get_api(),
+        "mqtt": config.get_mqtt(),
+        "commands": config.get_commands(),
+        "history": config.get_history()
+    }
+
+
+def _new_sensor(name, sensor, settings, device_cache=None):
+    freshness = settings["freshness"]
+    return PlantSensor(
+        settings["adapters"][name], name, sensor["mac"], device_cache=device_cache,
+        parameters=_sensor_parameters(sensor, freshness), ttls=freshness["ttl"]
+    )
+
+
+def _new_publisher(mqtt):
+    return MqttPublisher(
+        mqtt["host"], mqtt["port"], mqtt["topic_prefix"], mqtt["discovery_prefix"], mqtt["queue_size"], mqtt["qos"],
+        mqtt["client_id"], mqtt["username"], mqtt["password"]
+    )
+
+
+def _new_evaluator(name, sensor, hysteresis, anomalies, table=None):
+    # sensors without anomaly rules don't need any statistics; with a boundary table, it has the hysteresis
+    if any(rule in boundary for boundary in sensor["wellbeing_range"].values() for rule in RULES):
+        return StreamingEvaluator(name, sensor, anomalies, hysteresis, table)
+    return RangeCheckerEvaluator(sensor, hysteresis, table)
+
+
+def _sensor_parameters(sensor, freshness):
+    # in the monitored only mode, parameters without a wellbeing range are not read at all
+    if not freshness["monitored_only"]:
+        return PARAMETERS
+    return tuple(p for p in PARAMETERS if p in sensor["wellbeing_range"])
+
+
+class ConfigReloader(object):
+    # reloads the config file when it's changed and rebuilds only the sensors, evaluators and message boundaries
+    # which changed, so pollers of unchanged sensors are kept; a new config which is not valid is rejected
+    # and the current one keeps running
+    _RELOADED = ("sensors", "adapters", "intervals", "message_templates", "alerts")
+
+    def __init__(self, settings, sensors, evaluators, render, device_cache=None, anomalies=None, adaptive=None):
+        self._settings = settings
+        self._sensors = {sensor.name: sensor for sensor in sensors}
+        self._evaluators = evaluators
+        self._render = render
+        self._device_cache = device_cache
+        if anomalies is None:
+            anomalies = AnomalyState(os.path.join(settings["data_dir"], "anomalies.json"))
+        self._anomalies = anomalies
+        self._adaptive = adaptive
+        self._mtime = config.get_config_mtime()
+
+    def __call__(self):
+        mtime = config.get_config_mtime()
+        if mtime == self._mtime:
+            return None
+        self._mtime = mtime
+        previous = config.reload()
+        try:
+            settings = _read_config(daemon=True)
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            # getters validate what they know of, a config of some other wrong shape fails in them however it fails
+            config.restore(previous)
+            _LOGGER.error("Changed configuration is rejected, the current one is kept", exc_info=e)
+            return None
+        _LOGGER.info("Configuration is reloaded")
+        return self._apply(settings)
+
+    def _apply(self, settings):
+        old = self._settings
+        hysteresis = settings["alerts"]["hysteresis"]
+        hysteresis_changed = hysteresis != old["alerts"]["hysteresis"]
+        if hysteresis_changed:
+            self._render.table.set_hysteresis(hysteresis)
+        for name in set(old["sensors"]) - set(settings["sensors"]):
+            _LOGGER.info("{} sensor is removed".format(name))
+            del self._sensors[name]
+            del self._evaluators[name]
+            self._render.remove_sensor(name)
+            self._anomalies.forget(name)
+            if self._adaptive is not None:
+                self._adaptive.forget(name)
+        for name, sensor in settings["sensors"].items():
+            previous = old["sensors"].get(name)
+            adapter = settings["adapters"][name]
+            if previous is None or previous["mac"] != sensor["mac"] or old["adapters"][name] != adapter:
+                _LOGGER.info("{} sensor is {}".format(name, "added" if previous is None else "changed"))
+                self._sensors[name] = _new_sensor(name, sensor, dict(settings, freshness=old["freshness"]),
+                                                  self._device_cache)
+            if previous is None or previous["wellbeing_range"] != sensor["wellbeing_range"] or hysteresis_changed:
+                self._evaluators[name] = _new_evaluator(name, sensor, hysteresis, self._anomalies, self._render.table)
+                self._render.set_sensor(name, sensor)
+                self._sensors[name].parameters = _sensor_parameters(sensor, old["freshness"])
+        self._render.templates = settings["message_templates"]
+        # only the hysteresis of alerts is reloaded, the rest of the settings needs a restart
+        ignored = [key for key in settings if key not in self._RELOADED and settings[key] != old[key]]
+        if dict(settings["alerts"], hysteresis=hysteresis) != dict(old["alerts"], hysteresis=hysteresis):
+            ignored.append("alerts")
+        for key in ignored:
+            settings[key] = old[key]
+        settings["alerts"] = dict(old["alerts"], hysteresis=hysteresis)
+        if len(ignored) > 0:
+            _LOGGER.warning("Changes of {} are applied on restart only".format(", ".join(sorted(ignored))))
+        self._settings = settings
+        return list(self._sensors.values()), settings["intervals"]
+
+
+def _after_cycle(messenger, store, store_config, alerts, anomalies=None, health=None, publisher=None):
+    messenger.end_cycle()
+    if publisher is not None:
+        publisher.end_cycle()
+    for state, what in ((alerts, "alert state"), (anomalies, "anomaly statistics"), (health, "sensor health")):
+        if state is not None:
+            try:
+                state.save()
+            except OSError as e:
+                _LOGGER.error("Saving {} failed".format(what), exc_info=e)
+    if store is not None:
+        try:
+            store.rollup(
+                raw_retention=store_config["raw_retention"], hourly_retention=store_config["hourly_retention"]
+            )
+        except (OSError, ValueError) as e:
+            _LOGGER.error("Rolling up stored readings failed", exc_info=e)
+
+
+def run_daemon(sensors, intervals, max_attempts, messenger, evaluators, stop, listeners=(), after_cycle=None,
+               alerts=None, cycle_timeout=0, passive_window=0, reload=None, adaptive=None, history=None, refresh=None,
+               discovery=None, health=None):
+    def interval(name):
+        if adaptive is None:
+            return intervals[name]
+        return adaptive.next_interval(name, evaluators[name].boundaries, intervals[name])
+
+    by_name = {sensor.name: sensor for sensor in sensors}
+    last_checked = {}
+    scheduler = Scheduler()
+    now = monotonic()
+    for name in by_name:
+        scheduler.schedule(name, now)
+    while not stop.is_set():
+        now = monotonic()
+        reloaded = reload() if reload is not None else None
+        if reloaded is not None:
+            sensors, intervals = reloaded
+            by_name = _reschedule(scheduler, by_name, sensors, last_checked, now, interval)
+        requested = refresh.take() if refresh is not None else {}
+        for name in list(requested):
+            if name in by_name:
+                scheduler.schedule(name, now)
+            else:
+                requested.pop(name).set()
+        due = scheduler.pop_due(now)
+        if len(due) == 0:
+            timeout = scheduler.next_time() - now
+            if reload is not None:
+                # a changed config is picked up within _RELOAD_POLL, however long the sensors' intervals are
+                timeout = min(timeout, _RELOAD_POLL)
+            if refresh is not None:
+                timeout = min(timeout, _REFRESH_POLL)
+            stop.wait(timeout)
+            continue
+        with metrics.timer("cycle"):
+            success = check_sensors(
+                [by_name[name] for name in due], max_attempts, messenger, evaluators, stop, listeners, alerts,
+                cycle_timeout, passive_window, history, discovery, health
+            )
+        _LOGGER.info("Cycle done. {}/{} are successfully processed".format(success, len(due)))
+        for event in requested.values():
+            event.set()
+        if after_cycle is not None:
+            after_cycle()
+        for name in due:
+            last_checked[name] = now
+            next_interval = interval(name)
+            _LOGGER.debug("{} sensor is checked again in {:.0f}s".format(name, next_interval))
+            scheduler.schedule(name, now + next_interval)
+
+
+def _reschedule(scheduler, by_name, sensors, last_checked, now, interval):
+    reloaded_by_name = {sensor.name: sensor for sensor in sensors}
+    for name in by_name:
+        if name not in reloaded_by_name:
+            scheduler.remove(name)
+            last_checked.pop(name, None)
+    for name, sensor in reloaded_by_name.items():
+        if name in last_checked and by_name.get(name) is sensor:
+            scheduler.schedule(name, last_checked[name] + interval(name))
+        else:
+            # new and rebuilt sensors are checked right away
+            scheduler.schedule(name, now)
+    return reloaded_by_name
+
+
+def check_sensors(queue, max_attempts, messenger, evaluators, stop=None, listeners=(), alerts=None, cycle_timeout=0,
+                  passive_window=0, history=None, discovery=None, health=None):
+    stop = Event() if stop is None else stop
+    deadline = monotonic() + cycle_timeout if cycle_timeout > 0 else None
+    success = 0
+    if passive_window > 0:
+        unheard = _check_passive(queue, passive_window, messenger, evaluators, listeners, alerts, history, health)
+        success = len(queue) - len(unheard)
+        queue = unheard
+    unseen = []
+    if discovery is not None and len(queue) > 0:
+        queue, unseen = _plan(queue, discovery)
+    success += _check_shards(
+        queue, max_attempts, messenger, evaluators, stop, listeners, alerts, deadline, history, health
+    )
+    if len(unseen) > 0 and discovery.unseen_attempts > 0 and not stop.is_set():
+        success += _check_shards(
+            unseen, discovery.unseen_attempts, messenger, evaluators, stop, listeners, alerts, deadline, history,
+            health
+        )
+    return success
+
+
+def _plan(queue, discovery):
+    # sensors move to the adapter which hears them best, the ones no adapter hears are checked after all the others
+    discovery.refresh([sensor.mac for sensor in queue])
+    seen = []
+    unseen = []
+    for sensor in queue:
+        if not discovery.is_seen(sensor.mac):
+            _LOGGER.info("{} sensor isn't heard by any adapter, it's checked last".format(sensor.name))
+            metrics.inc("unseen", sensor=sensor.name)
+            unseen.append(sensor)
+            continue
+        adapter = discovery.best_adapter(sensor.mac)
+        if adapter is not None and adapter != sensor.adapter:
+            _LOGGER.info("{} sensor is heard best by {}, it's moved from {}".format(
+                sensor.name, adapter, sensor.adapter))
+            sensor.set_adapter(adapter)
+        seen.append(sensor)
+    return seen, unseen
+
+
+def _check_shards(queue, max_attempts, messenger, evaluators, stop, listeners, alerts, deadline, history, health):
+    shards = {}
+    for sensor in queue:
+        shards.setdefault(sensor.adapter, []).append(sensor)
+    if len(shards) <= 1:
+        return _check_shard(
+            queue, max_attempts, messenger, evaluators, stop, listeners, alerts, deadline, history, health
+        )
+    with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="adapter") as executor:
+        futures = [
+            executor.submit(
+                _check_shard, shard, max_attempts, messenger, evaluators, stop, listeners, alerts, deadline, history,
+                health
+            )
+            for shard in shards.values()
+        ]
+        return sum(future.result() for future in futures)
+
+
+def _check_passive(queue, window, messenger, evaluators, listeners, alerts, history=None, health=None):
+    # one scan per adapter hears all the sensors at once, only the sensors which didn't advertise everything needed
+    # are left to be read over a connection
+    adapters = sorted({sensor.adapter for sensor in queue})
+    macs = [sensor.mac for sensor in queue]
+    heard = {}
+    with ThreadPoolExecutor(max_workers=len(adapters), thread_name_prefix="scan") as executor:
+        for readings in executor.map(lambda adapter: advertisement.scan(adapter, window, macs), adapters):
+            for mac, values in readings.items():
+                heard.setdefault(mac, {}).update(values)
+    unheard = []
+    for sensor in queue:
+        readings = heard.get(sensor.mac.upper(), {})
+        required = tuple(p for p in advertisement.PARAMETERS if p in sensor.parameters)
+        if "battery" in evaluators[sensor.name].boundaries:
+            required += ("battery",)
+        if any(param not in readings for param in required):
+            _LOGGER.debug("{} sensor isn't heard from completely, it will be connected to".format(sensor.name))
+            unheard.append(sensor)
+            continue
+        metrics.inc("readings", sensor=sensor.name, source="advertisement")
+        _process_readings(sensor.name, readings, evaluators[sensor.name], messenger, listeners, alerts)
+        _record_success(sensor, health)
+        _sync_history(sensor, history)
+    _LOGGER.info("{}/{} sensors are read from advertisements".format(len(queue) - len(unheard), len(queue)))
+    return unheard
+
+
+def _backoff(attempt):
+    delay = min(_SLEEP * 2 ** (attempt - 1), _MAX_BACKOFF)
+    return delay * random.uniform(1 - _JITTER, 1 + _JITTER)
+
+
+def _check_shard(queue, max_attempts, messenger, evaluators, stop, listeners, alerts, deadline=None, history=None,
+                 health=None):
+    # every sensor is retried on its own backoff, so sensors which are fine never wait for a failing one;
+    # dark sensors get one attempt when they're due to be probed, none otherwise
+    sensors = {sensor.name: sensor for sensor in queue}
+    attempts = dict.fromkeys(sensors, 0)
+    limits = {
+        name: health.attempts(name, max_attempts) if health is not None else max_attempts for name in sensors
+    }
+    scheduler = Scheduler()
+    now = monotonic()
+    for name in sensors:
+        if limits[name] > 0:
+            scheduler.schedule(name, now)
+        else:
+            metrics.inc("dark_skips", sensor=name)
+            _LOGGER.info("{} sensor is dark, it's not probed yet".format(name))
+    success = 0
+    while len(scheduler) > 0 and not stop.is_set():
+        at = scheduler.next_time()
+        if deadline is not None and at > deadline:
+            _LOGGER.warning("Cycle time is over, {} sensor{} left unread".format(
+                len(scheduler), "s" if len(scheduler) > 1 else ""))
+            break
+        now = monotonic()
+        if at > now:
+            stop.wait(at - now)
+            continue
+        sensor = sensors[scheduler.pop()]
+        attempts[sensor.name] += 1
+        attempt = attempts[sensor.name]
         try:
-            _check_sensor(sensor, evaluators[sensor.name], messenger)
+            _check_sensor(sensor, evaluators[sensor.name], messenger, listeners, alerts)
+            success += 1
+            _record_success(sensor, health)
+            _sync_history(sensor, history)
         except PlantSensorException as e:
-            queue.append(sensor)
-            if lap < max_attempts:
+            cause = type(e.__cause__ or e).__name__
+            limit = limits[sensor.name]
+            metrics.inc("read_failures", sensor=sensor.name, cause=cause)
+            if attempt < limit:
+                metrics.inc("retries", sensor=sensor.name)
                 _LOGGER.info(
                     "{} sensor reading failed, {}/{} attempt{} left ".format(
-                        sensor.name, max_attempts - lap, max_attempts, "s" if max_attempts - lap > 1 else "")
+                        sensor.name, limit - attempt, limit, "s" if limit - attempt > 1 else "")
                 )
+                scheduler.schedule(sensor.name, monotonic() + _backoff(attempt))
             else:
+                metrics.inc("given_up", sensor=sensor.name)
                 _LOGGER.error("{} sensor reading failed".format(sensor.name), exc_info=e)
-        if to_retry == 0:
-            to_retry = len(queue)
-            lap += 1
-            sleep(_SLEEP)
-    return total_size - len(queue)
+                if health is not None and health.failure(sensor.name, cause):
+                    _LOGGER.warning("{} sensor has gone dark".format(sensor.name))
+                    messenger.send_dark(sensor.name, health.get(sensor.name))
+    return success
+
 
+def _record_success(sensor, health):
+    if health is not None and health.success(sensor.name):
+        _LOGGER.info("{} sensor is back".format(sensor.name))
 
-def _check_sensor(sensor, evaluator, messenger):
+
+def _check_sensor(sensor, evaluator, messenger, listeners=(), alerts=None):
     readings = sensor.read()
-    _LOGGER.info("{} sensor readings: {}".format(sensor.name, readings))
-    for param, value in readings.items():
-        if evaluator.need_to_notify(param, value):
-            _LOGGER.info("{}'s '{}'={} is out of the boundaries".format(sensor.name, param, value))
-            messenger.send(sensor.name, param, value)
+    metrics.inc("readings", sensor=sensor.name, source="gatt")
+    _process_readings(sensor.name, readings, evaluator, messenger, listeners, alerts, sensor.ages)
+
+
+def _sync_history(sensor, history):
+    # a failed sync doesn't fail the check, the records are still on the device for the next one
+    if history is None or not history.due(sensor.mac):
+        return
+    try:
+        history.sync(sensor)
+    except (PlantSensorException, OSError) as e:
+        metrics.inc("history_failures", sensor=sensor.name)
+        _LOGGER.warning("{} sensor history sync failed".format(sensor.name), exc_info=e)
+
+
+def _process_readings(name, readings, evaluator, messenger, listeners=(), alerts=None, ages=None, timestamp=None):
+    timestamp = time() if timestamp is None else timestamp
+    # formatting the readings costs more than evaluating them, a replay runs with INFO off
+    if _LOGGER.isEnabledFor(logging.INFO):
+        cached = {p: int(age) for p, age in (ages or {}).items() if age > 0}
+        if len(cached) > 0:
+            _LOGGER.info("{} sensor readings: {} (cached, seconds old: {})".format(name, readings, cached))
+        else:
+            _LOGGER.info("{} sensor readings: {}".format(name, readings))
+    # cached values were passed on when they were read, listeners only get the parameters which are read now
+    fresh = readings if not ages else {p: v for p, v in readings.items() if ages.get(p, 0) <= 0}
+    for listener in (listeners if len(fresh) > 0 else ()):
+        try:
+            listener.on_readings(name, fresh, timestamp)
+        except Exception as e:
+            _LOGGER.error("Passing {} readings to {} failed".format(name, type(listener).__name__), exc_info=e)
+    with metrics.timer("phase", phase="evaluate", sensor=name):
+        evaluator.update(readings, timestamp, ages)
+        for param, value in readings.items():
+            out_of_range = evaluator.need_to_notify(param, value)
+            if alerts is None:
+                if out_of_range:
+                    _LOGGER.info("{}'s '{}'={} is out of the boundaries".format(name, param, value))
+                    metrics.inc("alerts", sensor=name, parameter=param, action="send")
+                    _send_alert(name, param, value, evaluator, messenger)
+                continue
+            action = alerts.update(
+                name, param, out_of_range, evaluator.is_recovered(param, value), value, timestamp
+            )
+            if action is not None:
+                metrics.inc("alerts", sensor=name, parameter=param, action=action)
+            if action == AlertState.OPEN or action == AlertState.RENOTIFY:
+                _LOGGER.info("{}'s '{}'={} is out of the boundaries ({})".format(name, param, value, action))
+                _send_alert(name, param, value, evaluator, messenger)
+            elif action == AlertState.CLOSE:
+                _LOGGER.info("{}'s '{}'={} is back within the boundaries".format(name, param, value))
+                if alerts.notify_recovery:
+                    messenger.send_recovered(name, param, value)
+
+
+def _send_alert(name, param, value, evaluator, messenger):
+    # a value out of its boundaries gets the parameter's message even if it's an anomaly too
+    if evaluator.out_of_range(param, value):
+        messenger.send(name, param, value)
+    else:
+        _LOGGER.info("{}'s '{}'={} is an anomaly: {}".format(name, param, value, evaluator.anomalies[param]))
+        messenger.send_anomaly(name, param, value, evaluator.anomalies[param])
 
 
 def evaluate(name, parameter, min_value, max_value, values):
@@ -75,7 +640,25 @@ def evaluate(name, parameter, min_value, max_value, values):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Xiaomi Mi Flora plant sensor telegram notifier")
+    parser.add_argument(
+        "--daemon", action="store_true", help="keep running and check sensors on their configured intervals"
+    )
+    parser.add_argument(
+        "--check-config", action="store_true", help="only validate the configuration, without any Bluetooth or Telegram"
+    )
+    parser.add_argument(
+        "--replay", metavar="SOURCE",
+        help="only count the alerts the configuration would send for the readings recorded in SOURCE, a JSON lines "
+             "file or a reading store directory, without any Bluetooth or Telegram"
+    )
+    args = parser.parse_args()
     loglevel = config.get_loglevel()
     logging.basicConfig(level=loglevel, format='%(asctime)s [%(name)-24s] %(levelname)-8s %(message)s')
     _LOGGER.debug("Effective config: {}".format(config.get_all()))
-    main()
+    if args.check_config:
+        exit(0 if check_config() else 1)
+    if args.replay is not None:
+        import replay
+        exit(0 if replay.main(args.replay) else 1)
+    main(args.daemon)
@@ -1,57 +1,154 @@
 import logging
+from struct import error as StructError, unpack
+from time import monotonic
 
-from bluepy.btle import BTLEException
-from btlewrap import BluepyBackend, BluetoothBackendException
-from miflora.miflora_poller import MiFloraPoller, MI_BATTERY, MI_CONDUCTIVITY, MI_LIGHT, MI_MOISTURE, MI_TEMPERATURE
+import metrics
+from parameters import INDEX, PARAMETERS
+from reading import Reading
 
-_param_map = {
-    "light": MI_LIGHT, "temperature": MI_TEMPERATURE, "moisture": MI_MOISTURE,
-    "conductivity": MI_CONDUCTIVITY, "battery": MI_BATTERY
-}
-PARAMETERS = _param_map.keys()
 _LOGGER = logging.getLogger(__name__)
+# all of them come in one characteristic, battery comes in another one, along with the firmware version
+_DATA_PARAMETERS = ("light", "temperature", "moisture", "conductivity")
 
 
 class PlantSensorException(Exception):
     pass
 
 
-class PlantSensor(object):
-    _CACHE_TIMEOUT = 5
+def _decode(data, version_battery):
+    values = {}
+    if data is not None:
+        temperature, light, moisture, conductivity = unpack("<hxIBhxxxxxx", data)
+        if moisture > 100 or sum(data[10:]) == 0:
+            raise ValueError("invalid sensor data: {}".format(data.hex()))
+        values.update(light=light, temperature=temperature / 10.0, moisture=moisture, conductivity=conductivity)
+    if version_battery is not None:
+        values["battery"] = version_battery[0]
+    return values
+
+
+def _firmware_number(firmware):
+    return int(firmware.replace(".", ""))
+
 
-    def __init__(self, adapter, name, mac):
+class PlantSensor(object):
+    # bluepy, btlewrap and miflora are imported on the first connection only, backend None is btlewrap's bluepy one;
+    # only the given parameters are read, and only when their cached values are older than their ttls (seconds)
+    def __init__(self, adapter, name, mac, backend=None, device_cache=None, parameters=PARAMETERS, ttls=None):
         self.name = name
-        self._mac = mac
-        self._adapter = adapter
+        self.adapter = adapter
+        self.mac = mac
+        self.parameters = tuple(parameters)
+        self.gatt_operations = 0
+        self.ages = Reading()
+        self._backend = backend
+        self._device_cache = device_cache
+        self._ttls = ttls or {}
+        # cached values and the times they were read at, in PARAMETERS order
+        self._values = [None] * len(PARAMETERS)
+        self._read_at = [None] * len(PARAMETERS)
         self._poller = None
 
+    def set_adapter(self, adapter):
+        # the next connection is made with the new adapter
+        if adapter != self.adapter:
+            self.adapter = adapter
+            self._poller = None
+
     def _get_poller(self):
         if self._poller is None:
-            self._poller = MiFloraPoller(
-                mac=self._mac, backend=BluepyBackend, cache_timeout=self._CACHE_TIMEOUT, adapter=self._adapter
-            )
+            from miflorapoller import AdapterMiFloraPoller, BLE_ERRORS, DEFAULT_BACKEND
+            backend = self._backend if self._backend is not None else DEFAULT_BACKEND
+            self._poller = AdapterMiFloraPoller(mac=self.mac, backend=backend, adapter=self.adapter)
+            device = self._device_cache.get(self.mac) if self._device_cache is not None else None
+            if device is not None:
+                _LOGGER.debug("Device info (cached): name={}, mac={}, firmware_version={}".format(
+                    device["name"], self.mac, device["firmware"]))
+                return self._poller
             try:
-                firmware = self._poller.firmware_version()
-                if firmware is None or int(firmware.replace(".", "")) < 319:
-                    self._fail("Sensor firmware version must not be before 3.1.9, however {} detected".format(firmware))
-            except (IOError, BluetoothBackendException, BTLEException, RuntimeError, BrokenPipeError) as e:
+                with metrics.timer("phase", phase="firmware_check", sensor=self.name):
+                    firmware = self._poller.firmware_version()
+                    if firmware is None or _firmware_number(firmware) < 319:
+                        self._fail(
+                            "Sensor firmware version must not be before 3.1.9, however {} detected".format(firmware)
+                        )
+                    device_name = self._poller.name()
+            except BLE_ERRORS as e:
                 self._fail("Connection to {} failed".format(self.name), e)
             else:
                 _LOGGER.info("Connected to {}".format(self.name))
                 _LOGGER.debug(
-                    "Device info: name={}, mac={}, firmware_version={})".format(self._poller.name(), self._mac,
-                                                                                firmware)
+                    "Device info: name={}, mac={}, firmware_version={})".format(device_name, self.mac, firmware)
                 )
+                if self._device_cache is not None:
+                    self._device_cache.put(self.mac, firmware, device_name)
         return self._poller
 
-    def _read(self, param):
+    def read(self):
+        # fresh cached values are returned as they are, their ages (in seconds) are in ages
+        now = monotonic()
+        read_at = self._read_at
+        stale = [
+            p for p in self.parameters if read_at[INDEX[p]] is None or now - read_at[INDEX[p]] >= self._ttls.get(p, 0)
+        ]
+        read_data = any(p in _DATA_PARAMETERS for p in stale)
+        read_battery = "battery" in stale
+        self.gatt_operations = 0
+        if read_data or read_battery:
+            for param, value in self._read(read_data, read_battery).items():
+                self._values[INDEX[param]] = value
+                read_at[INDEX[param]] = now
+        else:
+            _LOGGER.debug("{} sensor readings are fresh, it's not connected to".format(self.name))
+        ages = [None] * len(PARAMETERS)
+        values = [None] * len(PARAMETERS)
+        for p in self.parameters:
+            i = INDEX[p]
+            if read_at[i] is not None:
+                ages[i] = now - read_at[i]
+                values[i] = self._values[i]
+        self.ages = Reading.from_values(ages)
+        return Reading.from_values(values)
+
+    def _read(self, read_data, read_battery):
+        from miflorapoller import BLE_ERRORS
         try:
-            return self._get_poller().parameter_value(param)
-        except (IOError, BluetoothBackendException, BTLEException, RuntimeError, BrokenPipeError) as e:
-            self._fail("Failed reading '{}' parameter from {}".format(param, self.name), e)
+            poller = self._get_poller()
+            with metrics.timer("phase", phase="read", sensor=self.name):
+                data, version_battery, self.gatt_operations = poller.read_all(read_data, read_battery)
+        except BLE_ERRORS as e:
+            self._fail("Failed reading parameters from {}".format(self.name), e)
+        try:
+            values = _decode(data, version_battery)
+            if version_battery is not None:
+                self._check_firmware(version_battery[2:].decode("ascii"))
+        except (TypeError, ValueError, IndexError, StructError) as e:
+            self._invalidate_device()
+            self._fail("Failed decoding parameters from {}".format(self.name), e)
+        return values
 
-    def read(self):
-        return {param_name: self._read(param_key) for (param_name, param_key) in _param_map.items()}
+    def read_history(self, start, last_time, commit, clear=False):
+        # see AdapterMiFloraPoller.read_history(), it's one connection whatever the number of records
+        from miflorapoller import BLE_ERRORS
+        try:
+            poller = self._get_poller()
+            with metrics.timer("phase", phase="history", sensor=self.name):
+                self.gatt_operations = poller.read_history(start, last_time, commit, clear)
+        except BLE_ERRORS as e:
+            self._fail("Failed reading history from {}".format(self.name), e)
+
+    def _check_firmware(self, firmware):
+        device = self._device_cache.get(self.mac) if self._device_cache is not None else None
+        if device is None or device["firmware"] == firmware:
+            return
+        if _firmware_number(firmware) < _firmware_number(device["firmware"]):
+            self._invalidate_device()
+            self._fail("Firmware of {} is downgraded from {} to {}".format(self.name, device["firmware"], firmware))
+        self._device_cache.put(self.mac, firmware, device["name"])
+
+    def _invalidate_device(self):
+        if self._device_cache is not None:
+            self._device_cache.invalidate(self.mac)
 
     def _fail(self, msg, e=None):
         self._poller = None
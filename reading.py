@@ -0,0 +1,46 @@
+from collections.abc import Mapping
+
+from parameters import INDEX, PARAMETERS
+
+
+class Reading(Mapping):
+    # a sensor's readings {parameter: value} as a read-only mapping on a tuple of values in PARAMETERS order (None where
+    # a parameter isn't read), a fraction of a dict's size; readings are never changed once read, so a Reading is
+    # passed to every listener and kept as it is
+    __slots__ = ("_values",)
+
+    def __init__(self, readings=()):
+        if isinstance(readings, Reading):
+            self._values = readings._values
+            return
+        values = [None] * len(PARAMETERS)
+        for param, value in dict(readings).items():
+            values[INDEX[param]] = value
+        self._values = tuple(values)
+
+    @classmethod
+    def from_values(cls, values):
+        # values are in PARAMETERS order
+        reading = cls.__new__(cls)
+        reading._values = tuple(values)
+        return reading
+
+    def __getitem__(self, param):
+        value = self._values[INDEX[param]]
+        if value is None:
+            raise KeyError(param)
+        return value
+
+    def get(self, param, default=None):
+        i = INDEX.get(param)
+        value = self._values[i] if i is not None else None
+        return default if value is None else value
+
+    def __iter__(self):
+        return (p for p, value in zip(PARAMETERS, self._values) if value is not None)
+
+    def __len__(self):
+        return len(self._values) - self._values.count(None)
+
+    def __repr__(self):
+        return repr(dict(self))
@@ -0,0 +1,249 @@
+import logging
+import os
+import time
+from struct import Struct
+from threading import Lock
+
+from parameters import PARAMETERS
+from storage import load_json, save_json
+
+_LOGGER = logging.getLogger(__name__)
+FIELDS = tuple(PARAMETERS)
+# timestamp, sensor id, one float per parameter (NaN if not read)
+_RAW = Struct("<IH{}f".format(len(FIELDS)))
+_RAW_DIR = "raw"
+_HOURLY_DIR = "hourly"
+_DAILY_DIR = "daily"
+_DAY = 86400
+_HOUR = 3600
+# records read at once by stream()
+_STREAM_CHUNK = 4096
+
+
+def _raw_dtype():
+    import numpy as np
+    return np.dtype([("ts", "<u4"), ("sensor", "<u2"), ("values", "<f4", (len(FIELDS),))])
+
+
+def _rollup_dtype():
+    import numpy as np
+    return np.dtype([
+        ("ts", "<u4"), ("sensor", "<u2"), ("count", "<u2"),
+        ("min", "<f4", (len(FIELDS),)), ("mean", "<f4", (len(FIELDS),)), ("max", "<f4", (len(FIELDS),))
+    ])
+
+
+def _day(timestamp):
+    return time.strftime("%Y%m%d", time.gmtime(timestamp))
+
+
+def _month(timestamp):
+    return time.strftime("%Y%m", time.gmtime(timestamp))
+
+
+class ReadingStore(object):
+    # numpy is only needed to read the store back and to roll it up, appending is plain struct packing
+    def __init__(self, path):
+        self._path = path
+        self._sensors = load_json(os.path.join(path, "sensors.json"), {})
+        self._lock = Lock()
+        self._segment_name = None
+        self._segment = None
+
+    def on_readings(self, name, readings, timestamp):
+        self.append(name, readings, timestamp)
+
+    def append(self, name, readings, timestamp):
+        nan = float("nan")
+        with self._lock:
+            record = _RAW.pack(
+                int(timestamp), self._sensor_id(name),
+                *[nan if readings.get(p) is None else float(readings[p]) for p in FIELDS]
+            )
+            self._open_segment(_day(timestamp)).write(record)
+            self._segment.flush()
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._segment.close()
+                self._segment = None
+                self._segment_name = None
+
+    def sensor_id(self, name):
+        return self._sensors.get(name)
+
+    def sensor_names(self):
+        return {i: name for name, i in self._sensors.items()}
+
+    def _sensor_id(self, name):
+        if name not in self._sensors:
+            self._sensors[name] = len(self._sensors)
+            save_json(os.path.join(self._path, "sensors.json"), self._sensors)
+        return self._sensors[name]
+
+    def _open_segment(self, day):
+        if self._segment_name != day:
+            if self._segment is not None:
+                self._segment.close()
+            os.makedirs(os.path.join(self._path, _RAW_DIR), exist_ok=True)
+            self._segment = open(os.path.join(self._path, _RAW_DIR, day + ".bin"), "ab")
+            self._segment_name = day
+        return self._segment
+
+    def query(self, start, end, name=None, resolution="raw"):
+        import numpy as np
+        if resolution == "raw":
+            directory, dtype, key = _RAW_DIR, _raw_dtype(), _day
+        elif resolution == "hourly":
+            directory, dtype, key = _HOURLY_DIR, _rollup_dtype(), _day
+        elif resolution == "daily":
+            directory, dtype, key = _DAILY_DIR, _rollup_dtype(), _month
+        else:
+            raise ValueError("Unknown resolution '{}'".format(resolution))
+        sensor = None
+        if name is not None:
+            sensor = self.sensor_id(name)
+            if sensor is None:
+                return np.empty(0, dtype=dtype)
+        chunks = []
+        for segment in self._segments(directory, key(start), key(end)):
+            data = _map(segment, dtype)
+            if data is None:
+                continue
+            mask = (data["ts"] >= start) & (data["ts"] < end)
+            if sensor is not None:
+                mask &= data["sensor"] == sensor
+            chunks.append(data[mask])
+        if len(chunks) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.concatenate(chunks)
+
+    def stream(self, start=0, end=2 ** 32):
+        # (name, timestamp, readings) of the raw readings, day after day and in the order they were stored within a day;
+        # segments are read in chunks, so memory doesn't grow with the data, and numpy isn't needed
+        names = self.sensor_names()
+        for segment in self._segments(_RAW_DIR, _day(start), _day(end - 1)):
+            with open(segment, "rb") as f:
+                while True:
+                    chunk = f.read(_RAW.size * _STREAM_CHUNK)
+                    # a truncated record at the end of a segment is skipped
+                    chunk = chunk[:len(chunk) - len(chunk) % _RAW.size]
+                    if len(chunk) == 0:
+                        break
+                    for record in _RAW.iter_unpack(chunk):
+                        if start <= record[0] < end:
+                            yield names.get(record[1]), record[0], {
+                                p: v for p, v in zip(FIELDS, record[2:]) if v == v
+                            }
+
+    def _segments(self, directory, first, last):
+        try:
+            names = sorted(os.listdir(os.path.join(self._path, directory)))
+        except FileNotFoundError:
+            return []
+        return [
+            os.path.join(self._path, directory, n) for n in names
+            if n.endswith(".bin") and first <= n[:-4] <= last
+        ]
+
+    def rollup(self, now=None, raw_retention=30, hourly_retention=365):
+        now = time.time() if now is None else now
+        today = _day(now)
+        state_path = os.path.join(self._path, "rollup.json")
+        state = load_json(state_path, {})
+        months = set()
+        for segment in self._segments(_RAW_DIR, "", today):
+            day = os.path.basename(segment)[:-4]
+            mtime = os.stat(segment).st_mtime_ns
+            if day == today or state.get(day) == mtime:
+                continue
+            _LOGGER.debug("Rolling up readings of {}".format(day))
+            self._rollup_day(segment, day)
+            state[day] = mtime
+            months.add(day[:6])
+        for month in sorted(months):
+            self._rollup_month(month)
+        raw_before = _day(now - raw_retention * _DAY)
+        self._expire(_RAW_DIR, raw_before, state)
+        self._expire(_HOURLY_DIR, _day(now - hourly_retention * _DAY))
+        kept = {day: mtime for day, mtime in state.items() if day >= raw_before}
+        if len(months) > 0 or len(kept) != len(state):
+            save_json(state_path, kept)
+
+    def _rollup_day(self, segment, day):
+        data = _map(segment, _raw_dtype())
+        os.makedirs(os.path.join(self._path, _HOURLY_DIR), exist_ok=True)
+        hourly = _aggregate(data, _HOUR) if data is not None else _aggregate_empty()
+        _write(os.path.join(self._path, _HOURLY_DIR, day + ".bin"), hourly)
+
+    def _rollup_month(self, month):
+        import numpy as np
+        chunks = [
+            _map(segment, _raw_dtype())
+            for segment in self._segments(_RAW_DIR, month + "00", month + "99")
+        ]
+        chunks = [c for c in chunks if c is not None]
+        path = os.path.join(self._path, _DAILY_DIR, month + ".bin")
+        previous = _map(path, _rollup_dtype())
+        daily = _aggregate(np.concatenate(chunks), _DAY) if len(chunks) > 0 else _aggregate_empty()
+        if previous is not None:
+            # keep the days whose raw segments are already expired
+            rolled = np.isin(previous["ts"], daily["ts"])
+            daily = np.concatenate([previous[~rolled], daily])
+            daily = daily[np.argsort(daily["ts"], kind="stable")]
+        os.makedirs(os.path.join(self._path, _DAILY_DIR), exist_ok=True)
+        _write(path, daily)
+
+    def _expire(self, directory, before, rolled=None):
+        for segment in self._segments(directory, "", before):
+            day = os.path.basename(segment)[:-4]
+            if day == before or (rolled is not None and day not in rolled):
+                continue
+            _LOGGER.debug("Removing expired segment {}".format(segment))
+            os.remove(segment)
+
+
+def _map(path, dtype):
+    import numpy as np
+    try:
+        count = os.path.getsize(path) // dtype.itemsize
+    except FileNotFoundError:
+        return None
+    if count == 0:
+        return None
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+
+def _write(path, data):
+    tmp = path + ".tmp"
+    data.tofile(tmp)
+    os.replace(tmp, path)
+
+
+def _aggregate_empty():
+    import numpy as np
+    return np.empty(0, dtype=_rollup_dtype())
+
+
+def _aggregate(data, bucket):
+    import numpy as np
+    if len(data) == 0:
+        return _aggregate_empty()
+    start = (data["ts"] // bucket) * bucket
+    keys = start.astype(np.int64) * 65536 + data["sensor"]
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = data["values"][order].astype(np.float64)
+    _, first = np.unique(keys, return_index=True)
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid, first, axis=0)
+    result = np.empty(len(first), dtype=_rollup_dtype())
+    result["ts"] = start[order][first]
+    result["sensor"] = data["sensor"][order][first]
+    result["count"] = np.diff(np.append(first, len(keys)))
+    result["min"] = np.fmin.reduceat(values, first, axis=0)
+    result["max"] = np.fmax.reduceat(values, first, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result["mean"] = np.add.reduceat(np.where(valid, values, 0), first, axis=0) / counts
+    return result
@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+from collections import Counter
+from tempfile import TemporaryDirectory
+
+import config
+import plantcare
+from alertstate import AlertState
+from anomaly import AnomalyState
+from boundaries import BoundaryTable
+from messenger import AlertMessageRender
+from readingstore import ReadingStore
+
+_LOGGER = logging.getLogger(__name__)
+_COLUMNS = ("readings", "alerts", "anomalies", "recoveries")
+
+
+class ReplayMessenger(object):
+    # stands in for the Dispatcher: every message is rendered as if it was sent, and counted per sensor and parameter
+    def __init__(self, render):
+        self.render = render
+        self.counts = {}
+
+    def send(self, name, param, value):
+        self.render.prepare(name, param, value)
+        self._count(name, param, "alerts")
+
+    def send_anomaly(self, name, param, value, rule):
+        self.render.prepare_anomaly(name, param, value, rule)
+        self._count(name, param, "anomalies")
+
+    def send_recovered(self, name, param, value):
+        self.render.prepare_recovered(name, param, value)
+        self._count(name, param, "recoveries")
+
+    def _count(self, name, param, what, amount=1):
+        counts = self.counts.setdefault((name, param), dict.fromkeys(_COLUMNS, 0))
+        counts[what] += amount
+
+
+def read_records(source):
+    # (name, timestamp, readings) from a JSON lines file of {"name": ..., "timestamp": ..., "readings": {...}} or from a
+    # reading store directory, one at a time
+    if os.path.isdir(source):
+        yield from ReadingStore(source).stream()
+        return
+    with open(source) as f:
+        for number, line in enumerate(f, 1):
+            if line.strip() == "":
+                continue
+            try:
+                record = json.loads(line)
+                name, timestamp, readings = record["name"], record["timestamp"], record["readings"]
+                # values are numbers, null ones weren't read
+                readings = {p: value for p, value in readings.items() if value is not None}
+                if not all(_is_number(value) for value in [timestamp, *readings.values()]):
+                    raise TypeError("timestamp and readings are expected to be numbers")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                raise ValueError("Line {} of {} is not a reading record".format(number, source)) from e
+            yield name, timestamp, readings
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def replay(records, settings):
+    # streams the records through the configured evaluators, alert state and message templates, without Bluetooth or
+    # Telegram; records of sensors which aren't configured are skipped. Returns {(sensor, parameter): counts}.
+    # Memory depends on the number of sensors only
+    hysteresis = settings["alerts"]["hysteresis"]
+    table = BoundaryTable(hysteresis)
+    render = AlertMessageRender(settings["sensors"], settings["message_templates"], table)
+    messenger = ReplayMessenger(render)
+    # plantcare logs every reading
+    level = plantcare._LOGGER.level
+    plantcare._LOGGER.setLevel(logging.WARNING)
+    try:
+        with TemporaryDirectory() as tmp:
+            # state files are never saved, they only keep the replay from reading the live ones
+            anomalies = AnomalyState(os.path.join(tmp, "anomalies.json"))
+            alerts = None
+            if settings["alerts"]["enabled"]:
+                alerts = AlertState(
+                    os.path.join(tmp, "alerts.json"), settings["alerts"]["renotify_interval"],
+                    settings["alerts"]["recovery_message"]
+                )
+            evaluators = {
+                name: plantcare._new_evaluator(name, sensor, hysteresis, anomalies, table)
+                for name, sensor in settings["sensors"].items()
+            }
+            seen = {name: Counter() for name in evaluators}
+            skipped = 0
+            for name, timestamp, readings in records:
+                evaluator = evaluators.get(name)
+                if evaluator is None:
+                    skipped += 1
+                    continue
+                plantcare._process_readings(name, readings, evaluator, messenger, alerts=alerts, timestamp=timestamp)
+                seen[name].update(readings.keys())
+    finally:
+        plantcare._LOGGER.setLevel(level)
+    if skipped > 0:
+        _LOGGER.warning("{} records of sensors which aren't configured are skipped".format(skipped))
+    for name, params in seen.items():
+        for param, count in params.items():
+            messenger._count(name, param, "readings", count)
+    return messenger.counts
+
+
+def report(counts):
+    lines = ["{:<24} {:<14} {:>10} {:>8} {:>10} {:>11}".format("sensor", "parameter", *_COLUMNS)]
+    for (name, param), values in sorted(counts.items()):
+        lines.append("{:<24} {:<14} {:>10} {:>8} {:>10} {:>11}".format(name, param, *[values[c] for c in _COLUMNS]))
+    return "\n".join(lines)
+
+
+def main(source):
+    # the candidate configuration is read as usual (CONFIG or CONFIG_FILE), Telegram settings aren't needed
+    try:
+        settings = {
+            "sensors": config.get_sensors(),
+            "message_templates": config.get_message_templates(),
+            "alerts": config.get_alerts(),
+        }
+    except ValueError as e:
+        _LOGGER.error("Configuration is not valid: {}".format(e))
+        return False
+    try:
+        counts = replay(read_records(source), settings)
+    except (OSError, ValueError) as e:
+        _LOGGER.error("Replaying {} failed: {}".format(source, e))
+        return False
+    print(report(counts))
+    return True
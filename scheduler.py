@@ -0,0 +1,55 @@
+import heapq
+from itertools import count
+
+
+class Scheduler(object):
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, at):
+        self.remove(key)
+        entry = [at, next(self._counter), key, True]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[3] = False
+
+    def when(self, key):
+        entry = self._entries.get(key)
+        return None if entry is None else entry[0]
+
+    def next_time(self):
+        self._drop_removed()
+        return self._heap[0][0] if self._heap else None
+
+    def pop(self):
+        self._drop_removed()
+        entry = heapq.heappop(self._heap)
+        del self._entries[entry[2]]
+        self._drop_removed()
+        return entry[2]
+
+    def pop_due(self, now):
+        due = []
+        self._drop_removed()
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            del self._entries[entry[2]]
+            due.append(entry[2])
+            self._drop_removed()
+        return due
+
+    def _drop_removed(self):
+        while self._heap and not self._heap[0][3]:
+            heapq.heappop(self._heap)
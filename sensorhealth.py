@@ -0,0 +1,71 @@
+import time
+from threading import Lock
+
+from storage import load_json, save_json
+
+
+class SensorHealth(object):
+    # a health record per sensor, kept between runs: failed checks in a row, the last success and the last error.
+    # After threshold failed checks in a row a sensor is dark, it's only probed with one attempt, at intervals growing
+    # from probe_interval up to max_probe_interval, until a check succeeds
+    def __init__(self, path, threshold, probe_interval, max_probe_interval):
+        self._path = path
+        self._threshold = threshold
+        self._probe_interval = probe_interval
+        self._max_probe_interval = max_probe_interval
+        self._records = load_json(path, {})
+        self._dirty = False
+        self._lock = Lock()
+
+    def get(self, name):
+        with self._lock:
+            record = self._records.get(name)
+            return None if record is None else dict(record)
+
+    def is_dark(self, name):
+        with self._lock:
+            return self._is_dark(self._records.get(name))
+
+    def _is_dark(self, record):
+        return record is not None and record["failures"] >= self._threshold
+
+    def attempts(self, name, max_attempts, now=None):
+        # how many attempts the sensor gets now: all of them while it's fine, one if a dark one is due to be probed
+        now = time.time() if now is None else now
+        with self._lock:
+            record = self._records.get(name)
+            if not self._is_dark(record):
+                return max_attempts
+            return 1 if now >= record["next_probe"] else 0
+
+    def success(self, name, now=None):
+        # True if the sensor was dark
+        now = time.time() if now is None else now
+        with self._lock:
+            record = self._records.get(name)
+            was_dark = self._is_dark(record)
+            self._records[name] = {
+                "failures": 0, "last_success": now, "last_error": record["last_error"] if record else None,
+                "next_probe": None
+            }
+            self._dirty = True
+            return was_dark
+
+    def failure(self, name, error, now=None):
+        # a check which failed with all its attempts, True if the sensor has just gone dark
+        now = time.time() if now is None else now
+        with self._lock:
+            record = self._records.setdefault(name, {"failures": 0, "last_success": None, "next_probe": None})
+            record["failures"] += 1
+            record["last_error"] = error
+            if self._is_dark(record):
+                backoff = self._probe_interval * 2 ** (record["failures"] - self._threshold)
+                record["next_probe"] = now + min(backoff, self._max_probe_interval)
+            self._dirty = True
+            return record["failures"] == self._threshold
+
+    def save(self):
+        with self._lock:
+            if self._dirty:
+                save_json(self._path, self._records)
+                self._dirty = False
@@ -0,0 +1,26 @@
+import json
+import logging
+import os
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def load_json(path, default):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        _LOGGER.warning("Ignoring unreadable state file {}: {}".format(path, e))
+        return default
+
+
+def save_json(path, data):
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
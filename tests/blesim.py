@@ -0,0 +1,134 @@
+import time
+from random import Random
+from struct import pack
+from threading import Lock
+
+from btlewrap.base import AbstractBackend, BluetoothBackendException
+
+_HANDLE_NAME = 0x03
+_HANDLE_VERSION_BATTERY = 0x38
+_HANDLE_SENSOR_DATA = 0x35
+_HANDLE_DEVICE_TIME = 0x41
+_HANDLE_HISTORY_CONTROL = 0x3e
+_HANDLE_HISTORY_READ = 0x3c
+DEFAULT_READINGS = {"light": 1154, "temperature": 21.7, "moisture": 35, "conductivity": 269, "battery": 99}
+
+
+class SimulatedBackend(AbstractBackend):
+    # a btlewrap backend talking to simulated Mi Flora sensors, use simulated_backend() to configure one
+    connect_latency = 0.0
+    # out of range or dead sensors: connecting to them fails after connect_timeout
+    unreachable = frozenset()
+    connect_timeout = 0.0
+    read_latency = 0.0
+    failure_rate = 0.0
+    drop_rate = 0.0
+    firmware = "3.2.1"
+    readings = {}
+    # per mac: the device time and the history log, a list of (device time, readings) records
+    device_time = 100000
+    history = {}
+    random = Random(0)
+    sleep = staticmethod(time.sleep)
+    stats = None
+    _stats_lock = Lock()
+
+    def __init__(self, adapter="hci0", address_type="public", **kwargs):
+        super().__init__(adapter, address_type, **kwargs)
+        self._mac = None
+        self._drop = False
+        self._operations = 0
+        self._history_command = None
+
+    def connect(self, mac):
+        self.sleep(self.connect_latency)
+        self._count("connects")
+        if mac in self.unreachable:
+            self.sleep(self.connect_timeout)
+            self._count("failures")
+            raise BluetoothBackendException("Simulated sensor {} is out of range".format(mac))
+        if self._chance(self.failure_rate):
+            self._count("failures")
+            raise BluetoothBackendException("Simulated connection failure to {}".format(mac))
+        self._mac = mac
+        # a dropped connection fails on the second GATT operation, after something was already read
+        self._drop = self._chance(self.drop_rate)
+        self._operations = 0
+
+    def disconnect(self):
+        self._mac = None
+
+    def write_handle(self, handle, value):
+        self._operation()
+        if handle == _HANDLE_HISTORY_CONTROL:
+            if value == b"\xa2\x00\x00":
+                self.history.get(self._mac, []).clear()
+            self._history_command = value
+
+    def read_handle(self, handle):
+        self._operation()
+        values = dict(DEFAULT_READINGS, **self.readings.get(self._mac, {}))
+        if handle == _HANDLE_NAME:
+            return b"Flower care"
+        if handle == _HANDLE_VERSION_BATTERY:
+            return bytes([values["battery"], 0x2b]) + self.firmware.encode("ascii")
+        if handle == _HANDLE_SENSOR_DATA:
+            data = pack(
+                "<hxIBh", int(round(values["temperature"] * 10)), values["light"], values["moisture"],
+                values["conductivity"]
+            )
+            return data + bytes([0x02, 0x3c, 0, 0, 0, 0])
+        if handle == _HANDLE_DEVICE_TIME:
+            return self.device_time.to_bytes(4, "little") + bytes(12)
+        if handle == _HANDLE_HISTORY_READ:
+            return self._history_read()
+        raise BluetoothBackendException("Simulated sensor has no handle {:#04x}".format(handle))
+
+    def _history_read(self):
+        history = self.history.get(self._mac, [])
+        if self._history_command == b"\xa0\x00\x00":
+            return len(history).to_bytes(2, "little") + bytes(14)
+        if self._history_command is None or self._history_command[0] != 0xa1:
+            raise BluetoothBackendException("Simulated history read without a command")
+        index = int.from_bytes(self._history_command[1:3], "little")
+        if index >= len(history):
+            return b"\xff" * 16
+        device_time, values = history[index]
+        temperature = int(round(values["temperature"] * 10))
+        return (
+            device_time.to_bytes(4, "little") + temperature.to_bytes(2, "little", signed=True)
+            + b"\x00" + values["light"].to_bytes(3, "little") + b"\x00" + bytes([values["moisture"]])
+            + values["conductivity"].to_bytes(2, "little") + bytes(2)
+        )
+
+    def _operation(self):
+        if self._mac is None:
+            raise BluetoothBackendException("Not connected")
+        self.sleep(self.read_latency)
+        self._operations += 1
+        self._count("operations")
+        if self._drop and self._operations > 1:
+            self._mac = None
+            self._count("drops")
+            raise BluetoothBackendException("Simulated connection drop")
+
+    def _chance(self, rate):
+        return rate > 0 and self.random.random() < rate
+
+    @classmethod
+    def _count(cls, what):
+        with cls._stats_lock:
+            cls.stats[what] = cls.stats.get(what, 0) + 1
+
+    @staticmethod
+    def check_backend():
+        return True
+
+
+def simulated_backend(seed=0, **settings):
+    # every simulated backend class has its own settings, random generator and stats
+    settings.setdefault("readings", {})
+    settings.setdefault("history", {})
+    if "sleep" in settings:
+        settings["sleep"] = staticmethod(settings["sleep"])
+    return type("SimulatedBackend", (SimulatedBackend,), dict(settings, random=Random(seed), stats={}))
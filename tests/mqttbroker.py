@@ -0,0 +1,136 @@
+import socket
+from struct import unpack
+from threading import Condition, Thread
+
+_CONNECT = 1
+_PUBLISH = 3
+_SUBSCRIBE = 8
+_PINGREQ = 12
+_DISCONNECT = 14
+
+
+class LocalBroker(object):
+    # a stand-in for an MQTT 3.1.1 broker on a local port: it accepts any client, acknowledges everything and keeps
+    # what is published (and the last will of a client which is gone without a DISCONNECT) as (topic, payload, retain).
+    # stop() drops the clients and closes the port, start() opens the same port again
+    def __init__(self):
+        self.port = None
+        self.messages = []
+        self.connects = 0
+        self._server = None
+        self._clients = set()
+        self._condition = Condition()
+        self.start()
+
+    def start(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind(("127.0.0.1", self.port or 0))
+        self._server.listen(5)
+        self.port = self._server.getsockname()[1]
+        Thread(target=self._accept, args=(self._server,), daemon=True).start()
+
+    def stop(self):
+        with self._condition:
+            clients, self._clients = self._clients, set()
+        for client in [self._server] + list(clients):
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.close()
+
+    def wait_for(self, predicate, timeout=5):
+        # waits until predicate(messages) is true, returns it
+        with self._condition:
+            return self._condition.wait_for(lambda: predicate(self.messages), timeout)
+
+    def topics(self):
+        with self._condition:
+            return [topic for topic, _, _ in self.messages]
+
+    def _accept(self, server):
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            with self._condition:
+                self._clients.add(client)
+            Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client):
+        will = None
+        try:
+            while True:
+                packet_type, flags, body = _read_packet(client)
+                if packet_type == _CONNECT:
+                    will = _parse_will(body)
+                    with self._condition:
+                        self.connects += 1
+                    client.sendall(b"\x20\x02\x00\x00")
+                elif packet_type == _PUBLISH:
+                    (length,) = unpack(">H", body[:2])
+                    topic = body[2:2 + length].decode()
+                    payload = body[2 + length:]
+                    qos = (flags >> 1) & 3
+                    if qos > 0:
+                        packet_id = payload[:2]
+                        payload = payload[2:]
+                        client.sendall((b"\x40" if qos == 1 else b"\x50") + b"\x02" + packet_id)
+                    self._received(topic, payload.decode(), bool(flags & 1))
+                elif packet_type == _SUBSCRIBE:
+                    client.sendall(b"\x90\x03" + body[:2] + b"\x00")
+                elif packet_type == _PINGREQ:
+                    client.sendall(b"\xd0\x00")
+                elif packet_type == _DISCONNECT:
+                    will = None
+                    return
+        except (OSError, EOFError):
+            if will is not None:
+                self._received(*will)
+        finally:
+            client.close()
+
+    def _received(self, topic, payload, retain):
+        with self._condition:
+            self.messages.append((topic, payload, retain))
+            self._condition.notify_all()
+
+
+def _read_exactly(client, size):
+    data = b""
+    while len(data) < size:
+        chunk = client.recv(size - len(data))
+        if chunk == b"":
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def _read_packet(client):
+    header = _read_exactly(client, 1)[0]
+    length = 0
+    for shift in range(0, 28, 7):
+        byte = _read_exactly(client, 1)[0]
+        length += (byte & 0x7f) << shift
+        if byte & 0x80 == 0:
+            break
+    return header >> 4, header & 0x0f, _read_exactly(client, length)
+
+
+def _parse_will(body):
+    # (topic, payload, retain) of the CONNECT's last will, None without one
+    (length,) = unpack(">H", body[:2])
+    flags = body[2 + length + 1]
+    if not flags & 0x04:
+        return None
+    offset = 2 + length + 4
+    (length,) = unpack(">H", body[offset:offset + 2])
+    offset += 2 + length
+    fields = []
+    for _ in range(2):
+        (length,) = unpack(">H", body[offset:offset + 2])
+        fields.append(body[offset + 2:offset + 2 + length].decode())
+        offset += 2 + length
+    return fields[0], fields[1], bool(flags & 0x20)
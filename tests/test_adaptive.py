@@ -0,0 +1,59 @@
+from unittest import TestCase
+
+from adaptive import AdaptiveIntervals, time_to_boundary
+
+_HOUR = 3600
+
+
+class TestTimeToBoundary(TestCase):
+    def test_falling(self):
+        # 2 per hour down to 40
+        samples = [(0, 50), (_HOUR, 48), (2 * _HOUR, 46)]
+        self.assertAlmostEqual(time_to_boundary(samples, 40, 100), 3 * _HOUR)
+
+    def test_rising(self):
+        samples = [(0, 20), (_HOUR, 25)]
+        self.assertAlmostEqual(time_to_boundary(samples, 0, 30), _HOUR)
+
+    def test_stable(self):
+        self.assertEqual(time_to_boundary([(0, 50), (_HOUR, 50)], 40, 60), float("inf"))
+
+    def test_out_of_range(self):
+        self.assertEqual(time_to_boundary([(0, 39)], 40, 60), 0)
+
+    def test_no_trend(self):
+        self.assertIsNone(time_to_boundary([(0, 50)], 40, 60))
+
+
+class TestAdaptiveIntervals(TestCase):
+    def setUp(self):
+        self.adaptive = AdaptiveIntervals(600, 6 * _HOUR, history=3)
+        self.boundaries = {"moisture": {"min": 40, "max": 100}}
+
+    def test_default_without_history(self):
+        self.assertEqual(self.adaptive.next_interval("rose", self.boundaries, _HOUR), _HOUR)
+        self.adaptive.on_readings("rose", {"moisture": 60}, 0)
+        self.assertEqual(self.adaptive.next_interval("rose", self.boundaries, _HOUR), _HOUR)
+
+    def test_far_from_boundaries(self):
+        for i, value in enumerate([80, 80, 79]):
+            self.adaptive.on_readings("rose", {"moisture": value, "light": 1000 * i}, i * _HOUR)
+        self.assertEqual(self.adaptive.next_interval("rose", self.boundaries, _HOUR), 6 * _HOUR)
+
+    def test_near_boundary(self):
+        for i, value in enumerate([50, 47, 44]):
+            self.adaptive.on_readings("rose", {"moisture": value}, i * _HOUR)
+        # 4 left, 3 per hour: half of the 80 minutes
+        self.assertAlmostEqual(self.adaptive.next_interval("rose", self.boundaries, _HOUR), 40 * 60)
+
+    def test_out_of_boundaries(self):
+        self.adaptive.on_readings("rose", {"moisture": 30}, 0)
+        self.assertEqual(self.adaptive.next_interval("rose", self.boundaries, _HOUR), 600)
+
+    def test_history_window(self):
+        for i, value in enumerate([40, 90, 90, 90]):
+            self.adaptive.on_readings("rose", {"moisture": value}, i * _HOUR)
+        self.assertEqual(self.adaptive.next_interval("rose", self.boundaries, _HOUR), 6 * _HOUR)
+
+    def test_not_monitored(self):
+        self.assertEqual(self.adaptive.next_interval("rose", {}, _HOUR), 6 * _HOUR)
@@ -0,0 +1,98 @@
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+import advertisement
+from advertisement import AdvertisementListener, decode_mibeacon
+
+_MAC = "C4:7C:8D:6A:3E:51"
+# service data (0x16) of a Flower care advertising one parameter per frame
+_TEMPERATURE = bytes.fromhex("95fe7120980041513e6a8d7cc40d041002f400")
+_LIGHT = bytes.fromhex("95fe7120980042513e6a8d7cc40d071003820400")
+_MOISTURE = bytes.fromhex("95fe7120980043513e6a8d7cc40d08100123")
+_CONDUCTIVITY = bytes.fromhex("95fe7120980044513e6a8d7cc40d0910020d01")
+_BATTERY = bytes.fromhex("95fe7120980045513e6a8d7cc40d0a100163")
+_FROST = bytes.fromhex("95fe7120980046513e6a8d7cc40d041002ddff")
+_NO_OBJECT = bytes.fromhex("95fe3120980047513e6a8d7cc40d")
+
+
+def _entry(addr, service_data):
+    entry = Mock()
+    entry.addr = addr
+    entry.rssi = -70
+    entry.getValue.return_value = service_data
+    return entry
+
+
+class TestDecodeMiBeacon(TestCase):
+    def test_decode(self):
+        self.assertEqual(decode_mibeacon(_TEMPERATURE), {"temperature": 24.4})
+        self.assertEqual(decode_mibeacon(_LIGHT), {"light": 1154})
+        self.assertEqual(decode_mibeacon(_MOISTURE), {"moisture": 35})
+        self.assertEqual(decode_mibeacon(_CONDUCTIVITY), {"conductivity": 269})
+        self.assertEqual(decode_mibeacon(_BATTERY), {"battery": 99})
+
+    def test_decode_negative_temperature(self):
+        self.assertEqual(decode_mibeacon(_FROST), {"temperature": -3.5})
+
+    def test_decode_no_object(self):
+        self.assertEqual(decode_mibeacon(_NO_OBJECT), {})
+
+    def test_decode_truncated(self):
+        self.assertIsNone(decode_mibeacon(_LIGHT[:-1]))
+
+    def test_decode_encrypted(self):
+        self.assertIsNone(decode_mibeacon(b"\x95\xfe\x79" + _TEMPERATURE[3:]))
+
+    def test_decode_other_service(self):
+        self.assertIsNone(decode_mibeacon(b"\x0f\x18" + _TEMPERATURE[2:]))
+
+
+class TestAdvertisementListener(TestCase):
+    def test_collects_frames(self):
+        listener = AdvertisementListener([_MAC.lower()])
+        for frame in (_TEMPERATURE, _LIGHT, _MOISTURE, _FROST):
+            listener.handleDiscovery(_entry(_MAC.lower(), frame), False, True)
+        self.assertEqual(listener.readings[_MAC], {"temperature": -3.5, "light": 1154, "moisture": 35})
+
+    def test_ignores_others(self):
+        listener = AdvertisementListener([_MAC])
+        listener.handleDiscovery(_entry("10:ea:ba:58:10:b8", _TEMPERATURE), True, True)
+        listener.handleDiscovery(_entry(_MAC.lower(), None), True, True)
+        self.assertEqual(listener.readings, {_MAC: {}})
+
+    @patch("bluepy.btle.Scanner", create=True)
+    def test_scan(self, scanner):
+        def _scan(window, passive):
+            self.assertTrue(passive)
+            for frame in (_TEMPERATURE, _LIGHT):
+                delegate.handleDiscovery(_entry(_MAC.lower(), frame), False, True)
+
+        def _with_delegate(d):
+            nonlocal delegate
+            delegate = d
+            return scanner.return_value
+
+        delegate = None
+        scanner.return_value.withDelegate.side_effect = _with_delegate
+        scanner.return_value.scan.side_effect = _scan
+        self.assertEqual(
+            advertisement.scan("hci1", 10, [_MAC, "10:EA:BA:58:10:B8"]),
+            {_MAC: {"temperature": 24.4, "light": 1154}}
+        )
+        scanner.assert_called_once_with(iface=1)
+
+    @patch("bluepy.btle.Scanner", create=True)
+    def test_discover(self, scanner):
+        def _scan(window, passive):
+            delegate.handleDiscovery(_entry(_MAC.lower(), None), True, False)
+            delegate.handleDiscovery(_entry("00:00:00:00:00:01", None), True, False)
+
+        def _with_delegate(d):
+            nonlocal delegate
+            delegate = d
+            return scanner.return_value
+
+        delegate = None
+        scanner.return_value.withDelegate.side_effect = _with_delegate
+        scanner.return_value.scan.side_effect = _scan
+        self.assertEqual(advertisement.discover("hci0", 5, [_MAC, "10:EA:BA:58:10:B8"]), {_MAC: -70})
@@ -0,0 +1,52 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from alertstate import AlertState
+
+
+class TestAlertState(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "alerts.json")
+        self.state = AlertState(self.path, renotify_interval=100)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_in_range(self):
+        self.assertIsNone(self.state.update("a", "moisture", False, True, 50, now=0))
+        self.assertEqual(self.state.open_alerts(), {})
+
+    def test_open_once(self):
+        self.assertEqual(self.state.update("a", "moisture", True, False, 10, now=0), AlertState.OPEN)
+        self.assertIsNone(self.state.update("a", "moisture", True, False, 9, now=50))
+        self.assertEqual(self.state.get("a", "moisture"), {"since": 0, "notified": 0, "value": 9})
+
+    def test_renotify(self):
+        self.state.update("a", "moisture", True, False, 10, now=0)
+        self.assertEqual(self.state.update("a", "moisture", True, False, 10, now=100), AlertState.RENOTIFY)
+        self.assertIsNone(self.state.update("a", "moisture", True, False, 10, now=150))
+        self.assertEqual(self.state.update("a", "moisture", True, False, 10, now=200), AlertState.RENOTIFY)
+
+    def test_renotify_disabled(self):
+        state = AlertState(self.path, renotify_interval=0)
+        state.update("a", "moisture", True, False, 10, now=0)
+        self.assertIsNone(state.update("a", "moisture", True, False, 10, now=10 ** 9))
+
+    def test_hysteresis_band(self):
+        self.state.update("a", "moisture", True, False, 10, now=0)
+        self.assertIsNone(self.state.update("a", "moisture", False, False, 41, now=200))
+        self.assertIsNotNone(self.state.get("a", "moisture"))
+        self.assertEqual(self.state.update("a", "moisture", False, True, 45, now=300), AlertState.CLOSE)
+        self.assertIsNone(self.state.get("a", "moisture"))
+        self.assertEqual(self.state.open_alerts(), {})
+
+    def test_persistence(self):
+        self.state.update("a", "moisture", True, False, 10, now=0)
+        self.state.update("b", "light", True, False, 10, now=0)
+        self.state.save()
+        state = AlertState(self.path, renotify_interval=100)
+        self.assertIsNone(state.update("a", "moisture", True, False, 10, now=50))
+        self.assertEqual(sorted(state.open_alerts()), ["a", "b"])
+        self.assertEqual(list(state.open_alerts("b")["b"]), ["light"])
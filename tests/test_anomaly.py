@@ -0,0 +1,103 @@
+import os
+import statistics
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+import anomaly
+from anomaly import AnomalyState, StreamingEvaluator
+
+_HOUR = 3600
+
+
+def _evaluator(state, **rules):
+    return StreamingEvaluator("rose", {"wellbeing_range": {"moisture": dict({"min": 20, "max": None}, **rules)}}, state)
+
+
+class TestStatistics(TestCase):
+    def test_welford(self):
+        stats = anomaly._new_stats()
+        values = [30, 31, 29, 35, 28, 30, 33, 27]
+        for i, value in enumerate(values):
+            anomaly.update(stats, value, i * _HOUR, 3)
+        # the deviations from the moving average, each one from the average before the reading
+        ewma = values[0]
+        deviations = []
+        for value in values[1:]:
+            deviations.append(value - ewma)
+            ewma += anomaly._ALPHA * (value - ewma)
+        self.assertAlmostEqual(stats["ewma"], ewma)
+        self.assertEqual(stats["count"], len(deviations))
+        self.assertAlmostEqual(stats["mean"], statistics.mean(deviations))
+        self.assertAlmostEqual(stats["m2"] / (stats["count"] - 1), statistics.variance(deviations))
+        self.assertEqual(stats["deltas"], [[2, _HOUR], [3, _HOUR], [-6, _HOUR]])
+
+    def test_rate(self):
+        stats = anomaly._new_stats()
+        self.assertIsNone(anomaly.rate(stats))
+        for t, value in ((0, 40), (_HOUR, 38), (2 * _HOUR, 30), (2.5 * _HOUR, 27)):
+            anomaly.update(stats, value, t, 3)
+        self.assertAlmostEqual(anomaly.rate(stats), -13 / 2.5)
+
+
+class TestStreamingEvaluator(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "anomalies.json")
+        self.state = AnomalyState(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _feed(self, evaluator, values, start=0, step=_HOUR):
+        for i, value in enumerate(values):
+            evaluator.update({"moisture": value}, start + i * step)
+        return evaluator.anomalies
+
+    def test_no_rules(self):
+        evaluator = StreamingEvaluator("rose", {"wellbeing_range": {"moisture": {"min": 20, "max": None}}}, self.state)
+        self.assertEqual(self._feed(evaluator, [30, 30, 30, 30]), {})
+        self.assertTrue(evaluator.need_to_notify("moisture", 10))
+        self.state.save()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_rate(self):
+        evaluator = _evaluator(self.state, max_rate=5)
+        self.assertEqual(self._feed(evaluator, [40, 39, 37, 36]), {})
+        # a leaking pot
+        self.assertEqual(self._feed(evaluator, [22], start=4 * _HOUR), {"moisture": "rate"})
+        self.assertTrue(evaluator.need_to_notify("moisture", 22))
+        self.assertFalse(evaluator.out_of_range("moisture", 22))
+        self.assertFalse(evaluator.is_recovered("moisture", 22))
+
+    def test_stuck(self):
+        evaluator = _evaluator(self.state, stuck=4)
+        self.assertEqual(self._feed(evaluator, [35, 33, 33, 33]), {})
+        self.assertEqual(self._feed(evaluator, [33], start=4 * _HOUR), {"moisture": "stuck"})
+        self.assertEqual(self._feed(evaluator, [34], start=5 * _HOUR), {})
+        self.assertTrue(evaluator.is_recovered("moisture", 34))
+
+    def test_zscore(self):
+        evaluator = _evaluator(self.state, max_zscore=4)
+        values = [30, 31, 30, 29, 30, 31, 30, 29, 30, 31, 30, 29, 30]
+        self.assertEqual(self._feed(evaluator, values), {})
+        self.assertEqual(self._feed(evaluator, [45], start=len(values) * _HOUR), {"moisture": "zscore"})
+
+    def test_cached_values_are_not_new_readings(self):
+        evaluator = _evaluator(self.state, stuck=3)
+        evaluator.update({"moisture": 33}, 0)
+        for t in (_HOUR, 2 * _HOUR, 3 * _HOUR):
+            evaluator.update({"moisture": 33}, t, ages={"moisture": t})
+        self.assertEqual(evaluator.anomalies, {})
+
+    def test_persisted(self):
+        evaluator = _evaluator(self.state, stuck=3)
+        self._feed(evaluator, [33, 33])
+        self.state.save()
+        evaluator = _evaluator(AnomalyState(self.path), stuck=3)
+        self.assertEqual(self._feed(evaluator, [33], start=2 * _HOUR), {"moisture": "stuck"})
+
+    def test_forget(self):
+        evaluator = _evaluator(self.state, stuck=3)
+        self._feed(evaluator, [33, 33])
+        self.state.forget("rose")
+        self.assertEqual(self._feed(evaluator, [33], start=2 * _HOUR), {})
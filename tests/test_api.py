@@ -0,0 +1,110 @@
+import json
+from threading import Thread
+from time import sleep
+from unittest import TestCase
+from unittest.mock import Mock
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import api
+from messenger import RangeCheckerEvaluator
+
+_READINGS = {"light": 1154, "temperature": 21.7, "moisture": 15, "conductivity": 269, "battery": 99}
+
+
+class TestRefreshRequests(TestCase):
+    def test_coalesced(self):
+        refresh = api.RefreshRequests()
+        first = refresh.request("a")
+        self.assertIs(refresh.request("a"), first)
+        self.assertIsNot(refresh.request("b"), first)
+        self.assertEqual(set(refresh.take()), {"a", "b"})
+        self.assertEqual(refresh.take(), {})
+        self.assertIsNot(refresh.request("a"), first)
+
+
+class TestSensorStatus(TestCase):
+    def test_status(self):
+        latest = api.LatestReadings()
+        evaluator = RangeCheckerEvaluator({"wellbeing_range": {"moisture": {"min": 20, "max": None}}})
+        alerts = Mock()
+        alerts.open_alerts.return_value = {"a": {"moisture": {"since": 10, "notified": 10, "value": 15}}}
+        self.assertEqual(api.sensor_status("a", latest, evaluator, now=100)["readings"], None)
+        latest.on_readings("a", _READINGS, 90)
+        status = api.sensor_status("a", latest, evaluator, alerts, now=100)
+        self.assertEqual(status["readings"], _READINGS)
+        self.assertEqual(status["age"], 10)
+        self.assertEqual(status["out_of_range"], ["moisture"])
+        self.assertEqual(status["alerts"], {"moisture": {"since": 10, "notified": 10, "value": 15}})
+        alerts.open_alerts.assert_called_once_with("a")
+
+
+class TestLatestReadings(TestCase):
+    def test_cached_kept(self):
+        latest = api.LatestReadings()
+        latest.on_readings("a", _READINGS, 0)
+        latest.on_readings("a", {"moisture": 20}, 60)
+        self.assertEqual(latest.get("a"), (dict(_READINGS, moisture=20), 60))
+
+
+class TestServe(TestCase):
+    def setUp(self):
+        self.latest = api.LatestReadings()
+        self.refresh = api.RefreshRequests()
+        evaluators = {name: RangeCheckerEvaluator({"wellbeing_range": {}}) for name in ("a", "my plant")}
+        self.server = api.serve("127.0.0.1", 0, self.latest, evaluators, refresh=self.refresh, refresh_timeout=5)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self, path):
+        with urlopen(self.url + path) as response:
+            self.assertEqual(response.headers["Content-Type"], "application/json")
+            return json.loads(response.read())
+
+    def test_sensors(self):
+        self.latest.on_readings("a", _READINGS, 0)
+        sensors = self._get("/sensors")
+        self.assertEqual(set(sensors), {"a", "my plant"})
+        self.assertEqual(sensors["a"]["readings"], _READINGS)
+        self.assertIsNone(sensors["my plant"]["readings"])
+        self.assertEqual(self._get("/sensors/my%20plant")["name"], "my plant")
+        # no max_age, no refresh
+        self.assertEqual(self.refresh.take(), {})
+
+    def test_not_found(self):
+        for path in ("/", "/sensors/b", "/sensors/a/b"):
+            with self.assertRaises(HTTPError) as e:
+                urlopen(self.url + path)
+            self.assertEqual(e.exception.code, 404)
+
+    def test_wrong_max_age(self):
+        with self.assertRaises(HTTPError) as e:
+            urlopen(self.url + "/sensors/a?max_age=soon")
+        self.assertEqual(e.exception.code, 400)
+
+    def test_fresh_enough(self):
+        self.latest.on_readings("a", _READINGS, api.time())
+        self._get("/sensors/a?max_age=60")
+        self.assertEqual(self.refresh.take(), {})
+
+    def test_refresh(self):
+        self.latest.on_readings("a", dict(_READINGS, moisture=10), 0)
+        results = []
+        clients = [Thread(target=lambda: results.append(self._get("/sensors/a?max_age=60"))) for _ in range(5)]
+        for client in clients:
+            client.start()
+        # a daemon cycle once all the clients wait: every one of them is served by one refresh
+        sleep(0.5)
+        requested = self.refresh.take()
+        self.latest.on_readings("a", _READINGS, api.time())
+        for event in requested.values():
+            event.set()
+        for client in clients:
+            client.join(5)
+        self.assertEqual(set(requested), {"a"})
+        self.assertEqual(self.refresh.take(), {})
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(result["readings"] == _READINGS for result in results))
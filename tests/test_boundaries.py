@@ -0,0 +1,39 @@
+from unittest import TestCase
+
+from boundaries import BoundaryTable, render
+
+
+class TestBoundaryTable(TestCase):
+    def setUp(self):
+        self.table = BoundaryTable({"moisture": 3})
+        self.table.set_sensor("rose", {"wellbeing_range": {"moisture": {"min": 40, "max": 60}}})
+        self.table.set_sensor("tulip", {"wellbeing_range": {"moisture": {"min": 40, "max": 60, "stuck": 5}}})
+
+    def test_render(self):
+        self.assertEqual(render(0, 10), "[0, 10]")
+        self.assertEqual(render(3, None), "≥ 3")
+        self.assertEqual(render(None, 10), "≤ 10")
+        self.assertEqual(render(None, None), "")
+
+    def test_boundary(self):
+        boundary = self.table.boundary("rose", "moisture")
+        self.assertEqual((boundary.min, boundary.max), (40, 60))
+        self.assertEqual((boundary.recovery_min, boundary.recovery_max), (43, 57))
+        self.assertEqual(boundary.text, "[40, 60]")
+        self.assertIsNone(self.table.boundary("rose", "light"))
+
+    def test_shared_rows(self):
+        # anomaly rules aren't boundaries, sensors of the same ranges share a row
+        self.assertIs(self.table.boundary("rose", "moisture"), self.table.boundary("tulip", "moisture"))
+        self.table.set_sensor("lily", {"wellbeing_range": {"moisture": {"min": 30, "max": 60}}})
+        self.assertIsNot(self.table.boundary("lily", "moisture"), self.table.boundary("rose", "moisture"))
+        self.table.remove_sensor("tulip")
+        self.assertEqual(sorted(self.table), ["lily", "rose"])
+        self.assertNotIn("tulip", self.table)
+
+    def test_set_hysteresis(self):
+        self.table.set_hysteresis({"moisture": 5})
+        # rows are of the old hysteresis until sensors are set again
+        self.assertEqual(self.table.boundary("rose", "moisture").recovery_min, 43)
+        self.table.set_sensor("rose", {"wellbeing_range": {"moisture": {"min": 40, "max": 60}}})
+        self.assertEqual(self.table.boundary("rose", "moisture").recovery_min, 45)
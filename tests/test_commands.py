@@ -0,0 +1,169 @@
+import os
+import time
+from tempfile import TemporaryDirectory
+from threading import Event
+from unittest import TestCase
+from unittest.mock import Mock
+
+from telegram.error import NetworkError
+
+import api
+import commands
+from alertstate import AlertState
+from commands import CommandBot
+from messenger import RangeCheckerEvaluator
+from readingstore import ReadingStore
+
+
+def _evaluator(boundaries):
+    return RangeCheckerEvaluator({"wellbeing_range": boundaries})
+
+
+class TestFormat(TestCase):
+    def test_age(self):
+        self.assertEqual(commands._age(5), "just now")
+        self.assertEqual(commands._age(150), "2 min ago")
+        self.assertEqual(commands._age(7200), "2 h ago")
+        self.assertEqual(commands._age(3 * 86400), "3 days ago")
+
+    def test_format_status(self):
+        status = {
+            "name": "Rose", "readings": {"moisture": 15, "temperature": 21.700000762939453, "battery": None},
+            "timestamp": 0, "age": 120, "out_of_range": ["moisture"], "anomalies": {"temperature": "stuck"},
+            "alerts": {"moisture": {"since": time.time() - 3600, "notified": 0, "value": 15}}
+        }
+        self.assertEqual(
+            commands.format_status(status),
+            "Rose: moisture 15, temperature 21.7 (2 min ago)\n"
+            "  moisture is out of range, temperature looks wrong (stuck)"
+        )
+        self.assertEqual(
+            commands.format_status(status, True).splitlines()[-1], "  moisture alert open since 1 h ago, last value 15"
+        )
+        self.assertEqual(commands.format_status(dict(status, readings=None)), "Rose: no readings yet")
+
+
+class TestCommandBot(TestCase):
+    def setUp(self):
+        self.messenger = Mock()
+        self.latest = api.LatestReadings()
+        self.latest.on_readings("Rose", {"moisture": 15, "light": 1000}, time.time() - 30)
+        self.evaluators = {"Rose": _evaluator({"moisture": {"min": 20, "max": None}}), "Basil": _evaluator({})}
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.alerts = AlertState(os.path.join(self.tmp.name, "alerts.json"))
+        self.alerts.update("Rose", "moisture", True, False, 15)
+        self.refresh = api.RefreshRequests()
+        self.bot = CommandBot(
+            self.messenger, ["-100", "@plants"], self.latest, self.evaluators, self.alerts, refresh=self.refresh,
+            refresh_timeout=5
+        )
+
+    def _answer(self, text):
+        self.messenger.reply.reset_mock()
+        self.bot.handle(1, text)
+        self.messenger.reply.assert_called_once()
+        return self.messenger.reply.call_args[0][1]
+
+    def test_status(self):
+        self.assertEqual(
+            self._answer("/status"),
+            "Basil: no readings yet\nRose: light 1000, moisture 15 (just now)\n  moisture is out of range"
+        )
+
+    def test_status_plant(self):
+        answer = self._answer("/status@plantcare_bot rose")
+        self.assertTrue(answer.startswith("Rose: light 1000, moisture 15 (just now)"))
+        self.assertIn("moisture alert open since just now, last value 15", answer)
+        self.assertEqual(self._answer("/status Tulip"), "Unknown plant 'Tulip', the plants are: Basil, Rose")
+
+    def test_history(self):
+        self.assertEqual(
+            self._answer("/history Rose"), "History needs the reading store, it's kept with 'store : enabled'"
+        )
+        store = ReadingStore(os.path.join(self.tmp.name, "store"))
+        self.addCleanup(store.close)
+        now = time.time()
+        store.append("Rose", {"moisture": 40, "temperature": 20}, now - 2 * 86400)
+        store.append("Rose", {"moisture": 30, "temperature": 18.5}, now - 7200)
+        store.append("Rose", {"moisture": 20, "temperature": 21.5}, now - 60)
+        store.append("Basil", {"moisture": 50}, now - 60)
+        self.bot = CommandBot(self.messenger, [], self.latest, self.evaluators, store=store)
+        self.assertEqual(
+            self._answer("/history Rose"),
+            "Rose, last 24 hours (2 readings):\n"
+            "temperature 18.5..21.5, mean 20, now 21.5\n"
+            "moisture 20..30, mean 25, now 20"
+        )
+        self.assertEqual(self._answer("/history Tulip"), "Unknown plant 'Tulip', the plants are: Basil, Rose")
+
+    def test_refresh(self):
+        self.assertEqual(self._answer("/refresh rose"), "Checking Rose...")
+        requested = self.refresh.take()
+        self.assertEqual(list(requested), ["Rose"])
+        self.latest.on_readings("Rose", {"moisture": 25}, time.time())
+        answered = Event()
+        self.messenger.reply.side_effect = lambda chat_id, text: answered.set()
+        requested["Rose"].set()
+        self.assertTrue(answered.wait(5))
+        self.assertEqual(self.messenger.reply.call_args[0], (1, "Rose: light 1000, moisture 25 (just now)"))
+
+    def test_refresh_disabled(self):
+        self.bot = CommandBot(self.messenger, [], self.latest, self.evaluators)
+        self.assertEqual(self._answer("/refresh"), "/refresh is disabled")
+
+    def test_help(self):
+        self.assertTrue(self._answer("/start").startswith("/status - "))
+
+    def test_polling(self):
+        polled = Event()
+        updates = [
+            [(10, -100, None, "/status Basil"), (11, 5, "stranger", "/status"), (12, 6, "plants", "/status Basil")],
+            NetworkError("down"),
+            [(13, -100, None, "hello"), (14, None, None, None)],
+        ]
+
+        def get_updates(offset, timeout):
+            if len(updates) == 0:
+                polled.set()
+                self.bot.stop()
+                return []
+            update = updates.pop(0)
+            if isinstance(update, Exception):
+                raise update
+            return update
+
+        self.messenger.get_updates.side_effect = get_updates
+        self.bot = CommandBot(
+            self.messenger, ["-100", "@plants"], self.latest, self.evaluators, poll_timeout=30, backoff=0.01
+        )
+        self.bot.start()
+        self.assertTrue(polled.wait(5))
+        self.assertEqual(
+            [c[0] for c in self.messenger.get_updates.call_args_list], [(None, 30), (13, 30), (13, 30), (15, 30)]
+        )
+        # a chat which isn't allowed gets no answer
+        self.assertEqual(
+            [c[0] for c in self.messenger.reply.call_args_list],
+            [(-100, "Basil: no readings yet"), (6, "Basil: no readings yet")]
+        )
+
+    def test_failing_command(self):
+        polled = Event()
+        updates = [[(10, -100, None, "/history Rose")], [(11, -100, None, "/status Basil")]]
+
+        def get_updates(offset, timeout):
+            if len(updates) == 0:
+                polled.set()
+                self.bot.stop()
+                return []
+            return updates.pop(0)
+
+        store = Mock()
+        store.query.side_effect = OSError("truncated")
+        self.messenger.get_updates.side_effect = get_updates
+        self.bot = CommandBot(self.messenger, ["-100"], self.latest, self.evaluators, store=store)
+        with self.assertLogs("commands", level="ERROR"):
+            self.bot.start()
+            self.assertTrue(polled.wait(5))
+        self.assertEqual([c[0] for c in self.messenger.reply.call_args_list], [(-100, "Basil: no readings yet")])
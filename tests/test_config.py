@@ -1,7 +1,8 @@
+import os
+from tempfile import TemporaryDirectory
 from unittest import TestCase, mock
 
 import config
-import plantsensor
 
 
 class Test(TestCase):
@@ -201,3 +202,232 @@ class Test(TestCase):
                 }
             }
         )
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensors_wrong_shape(self, mock_get_cfg):
+        for sensors in (
+            {"s1": {"mac": "1", "wellbeing_range": {"moisture": 5}}},
+            {"s1": {"mac": "1", "wellbeing_range": {"moisture": {"min": [5]}}}},
+            {"s1": {"mac": 5, "wellbeing_range": {}}},
+            {"s1": "x"},
+            ["s1"],
+        ):
+            mock_get_cfg.return_value = {"sensors": sensors}
+            with self.assertRaises(ValueError):
+                config.get_sensors()
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensors_shared_ranges(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "sensors": {
+                "s1": {"mac": "1", "wellbeing_range": {"moisture": {"min": 20, "max": 60}, "battery": {"min": 10}}},
+                "s2": {"mac": "2", "wellbeing_range": {"moisture": {"min": "20", "max": 60}}},
+                "s3": {"mac": "3", "wellbeing_range": {"moisture": {"min": 20, "max": 60, "stuck": 5}}}
+            }
+        }
+        sensors = config.get_sensors()
+        self.assertIs(sensors["s1"]["wellbeing_range"]["moisture"], sensors["s2"]["wellbeing_range"]["moisture"])
+        self.assertIsNot(sensors["s1"]["wellbeing_range"]["moisture"], sensors["s3"]["wellbeing_range"]["moisture"])
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensor_intervals(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "interval": 600,
+            "sensors": {"s1": {"mac": "1", "interval": 60}, "s2": {"mac": "2"}}
+        }
+        self.assertEqual(config.get_sensor_intervals(), {"s1": 60, "s2": 600})
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensor_intervals_wrong(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"interval": 600, "sensors": {"s1": {"mac": "1", "interval": 0}}}
+        with self.assertRaises(ValueError):
+            config.get_sensor_intervals()
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensor_adapters_default(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"adapter": "hci0", "adapters": [], "sensors": {"s1": {}, "s2": {}}}
+        self.assertEqual(config.get_sensor_adapters(), {"s1": "hci0", "s2": "hci0"})
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensor_adapters_sharded(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "adapter": "hci0",
+            "adapters": ["hci1", "hci2"],
+            "sensors": {"s1": {}, "s2": {"adapter": "hci0"}, "s3": {}, "s4": {}}
+        }
+        self.assertEqual(config.get_sensor_adapters(), {"s1": "hci1", "s2": "hci0", "s3": "hci2", "s4": "hci1"})
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensor_adapters_wrong(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"adapter": "hci0", "adapters": ["hci1", ""], "sensors": {"s1": {}}}
+        with self.assertRaises(ValueError):
+            config.get_sensor_adapters()
+
+    @mock.patch("config._load_custom")
+    def test_get_data_dir_default(self, mock_load_custom):
+        mock_load_custom.return_value = {}
+        self.assertNotEqual(config.get_data_dir(), "")
+
+    @mock.patch("config._get_cfg")
+    def test_get_firmware_check_ttl_negative(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"firmware_check_ttl": -1}
+        with self.assertRaises(ValueError):
+            config.get_firmware_check_ttl()
+
+    @mock.patch("config._load_custom")
+    def test_get_alerts_default(self, mock_load_custom):
+        mock_load_custom.return_value = {}
+        self.assertFalse(config.get_alerts()["enabled"])
+
+    @mock.patch("config._get_cfg")
+    def test_get_alerts_wrong_hysteresis(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"alerts": {"renotify_interval": 0, "hysteresis": {"moisture": -1}}}
+        with self.assertRaises(ValueError):
+            config.get_alerts()
+
+    @mock.patch("config._get_cfg")
+    def test_get_alerts_wrong_parameter(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"alerts": {"renotify_interval": 0, "hysteresis": {"xyz": 1}}}
+        with self.assertRaises(ValueError):
+            config.get_alerts()
+
+    @mock.patch("config._get_cfg")
+    def test_get_alerts_hysteresis_too_wide(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "alerts": {"renotify_interval": 0, "hysteresis": {"moisture": 5}},
+            "sensors": {"s1": {"mac": "1", "wellbeing_range": {"moisture": {"min": 20, "max": 40}}}}
+        }
+        self.assertEqual(config.get_alerts()["hysteresis"], {"moisture": 5})
+        mock_get_cfg.return_value["sensors"]["s2"] = {
+            "mac": "2", "wellbeing_range": {"moisture": {"min": 20, "max": 30}}
+        }
+        with self.assertRaises(ValueError):
+            config.get_alerts()
+
+    @mock.patch("config._get_cfg")
+    def test_get_cycle_timeout_negative(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"cycle_timeout": -5}
+        with self.assertRaises(ValueError):
+            config.get_cycle_timeout()
+
+    @mock.patch("config._load_custom")
+    def test_get_passive_default(self, mock_load_custom):
+        mock_load_custom.return_value = {}
+        self.assertFalse(config.get_passive()["enabled"])
+
+    @mock.patch("config._get_cfg")
+    def test_get_passive_wrong_window(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"passive": {"enabled": True, "window": 0}}
+        with self.assertRaises(ValueError):
+            config.get_passive()
+
+    @mock.patch("config._get_cfg")
+    def test_get_sensors_anomaly_rules(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "sensors": {
+                "a": {"mac": "AA", "wellbeing_range": {"moisture": {"min": 20, "max_rate": 10, "stuck": 12}}}
+            }
+        }
+        self.assertEqual(
+            config.get_sensors()["a"]["wellbeing_range"]["moisture"],
+            {"min": 20, "max": None, "max_rate": 10, "stuck": 12}
+        )
+        for rules in ({"stuck": 1}, {"stuck": 2.5}, {"max_rate": 0}, {"max_zscore": "3"}):
+            mock_get_cfg.return_value["sensors"]["a"]["wellbeing_range"]["moisture"] = rules
+            with self.assertRaises(ValueError):
+                config.get_sensors()
+
+    @mock.patch("config._get_cfg")
+    def test_get_history_needs_store(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "history": {"enabled": True, "interval": 86400, "clear": False}, "store": {"enabled": False}
+        }
+        with self.assertRaises(ValueError):
+            config.get_history()
+        mock_get_cfg.return_value["store"]["enabled"] = True
+        self.assertEqual(config.get_history()["interval"], 86400)
+
+    @mock.patch("config._get_cfg")
+    def test_get_api_wrong_refresh_timeout(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"api": {"enabled": True, "port": 9102, "refresh_timeout": 0}}
+        with self.assertRaises(ValueError):
+            config.get_api()
+
+    @mock.patch("config._get_cfg")
+    def test_get_commands(self, mock_get_cfg):
+        commands = {"enabled": True, "chats": [-100, "@plants"], "refresh": True, "refresh_timeout": 60,
+                    "poll_timeout": 30}
+        mock_get_cfg.return_value = {"commands": commands}
+        self.assertEqual(config.get_commands(), commands)
+        for key, value in (("chats", [""]), ("chats", [[1]]), ("poll_timeout", 0), ("refresh_timeout", "soon")):
+            mock_get_cfg.return_value = {"commands": dict(commands, **{key: value})}
+            with self.assertRaises(ValueError):
+                config.get_commands()
+
+    @mock.patch("config._get_cfg")
+    def test_get_mqtt(self, mock_get_cfg):
+        mqtt = {"enabled": True, "port": 1883, "qos": 1, "topic_prefix": "plants", "discovery_prefix": "ha",
+                "queue_size": 100}
+        mock_get_cfg.return_value = {"mqtt": mqtt}
+        self.assertEqual(config.get_mqtt(), mqtt)
+        for key, value in (("port", 0), ("qos", 3), ("topic_prefix", "plants/#"), ("discovery_prefix", ""),
+                           ("queue_size", 0)):
+            mock_get_cfg.return_value = {"mqtt": dict(mqtt, **{key: value})}
+            with self.assertRaises(ValueError):
+                config.get_mqtt()
+
+    @mock.patch("config._get_cfg")
+    def test_get_health_wrong_intervals(self, mock_get_cfg):
+        mock_get_cfg.return_value = {
+            "health": {"enabled": True, "threshold": 3, "probe_interval": 600, "max_probe_interval": 60}
+        }
+        with self.assertRaises(ValueError):
+            config.get_health()
+
+    @mock.patch("config._get_cfg")
+    def test_get_discovery_wrong_ttl(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"discovery": {"enabled": True, "window": 5, "ttl": 0, "unseen_attempts": 1}}
+        with self.assertRaises(ValueError):
+            config.get_discovery()
+
+    @mock.patch("config._get_cfg")
+    def test_get_metrics_wrong_port(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"metrics": {"enabled": True, "port": 70000, "textfile": None}}
+        with self.assertRaises(ValueError):
+            config.get_metrics()
+
+    def test_load_config_file(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config.json")
+            with open(path, "w") as f:
+                f.write('{"max_attempts": 2}')
+            with mock.patch.dict(os.environ, {"CONFIG_FILE": path}):
+                self.assertEqual(config._load_custom(), {"max_attempts": 2})
+                self.assertIsNotNone(config.get_config_mtime())
+                os.remove(path)
+                self.assertIsNone(config.get_config_mtime())
+                with self.assertRaises(ValueError):
+                    config._load_custom()
+
+    @mock.patch("config._load_custom")
+    def test_reload_restore(self, mock_load_custom):
+        mock_load_custom.return_value = {"max_attempts": 2}
+        self.assertEqual(config.get_max_attempts(), 2)
+        mock_load_custom.return_value = {"max_attempts": 3}
+        previous = config.reload()
+        self.assertEqual(config.get_max_attempts(), 3)
+        config.restore(previous)
+        self.assertEqual(config.get_max_attempts(), 2)
+        config.reload()
+
+    @mock.patch("config._get_cfg")
+    def test_get_adaptive_wrong_intervals(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"adaptive": {"min_interval": 600, "max_interval": 60, "history": 5}}
+        with self.assertRaises(ValueError):
+            config.get_adaptive()
+
+    @mock.patch("config._get_cfg")
+    def test_get_freshness_wrong_ttl(self, mock_get_cfg):
+        mock_get_cfg.return_value = {"freshness": {"monitored_only": False, "ttl": {"battery": -1}}}
+        with self.assertRaises(ValueError):
+            config.get_freshness()
@@ -0,0 +1,49 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from devicecache import DeviceInfoCache
+
+
+class TestDeviceInfoCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "devices.json")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_get_missing(self):
+        self.assertIsNone(DeviceInfoCache(self.path, 100).get("AA"))
+
+    def test_put_get(self):
+        DeviceInfoCache(self.path, 100).put("aa:bb", "3.2.1", "Flower care", now=1000)
+        entry = DeviceInfoCache(self.path, 100).get("AA:BB", now=1050)
+        self.assertEqual(entry, {"firmware": "3.2.1", "name": "Flower care", "verified": 1000})
+
+    def test_get_expired(self):
+        cache = DeviceInfoCache(self.path, 100)
+        cache.put("AA", "3.2.1", "Flower care", now=1000)
+        self.assertIsNone(cache.get("AA", now=1101))
+
+    def test_invalidate(self):
+        cache = DeviceInfoCache(self.path, 100)
+        cache.put("AA", "3.2.1", "Flower care")
+        cache.invalidate("AA")
+        self.assertIsNone(DeviceInfoCache(self.path, 100).get("AA"))
+
+    def test_corrupted_file(self):
+        with open(self.path, "w") as f:
+            f.write("{not json")
+        self.assertIsNone(DeviceInfoCache(self.path, 100).get("AA"))
+
+    def test_unwritable(self):
+        # a file where the data dir is expected
+        open(self.path, "w").close()
+        cache = DeviceInfoCache(os.path.join(self.path, "devices.json"), 100)
+        with self.assertLogs("devicecache", level="WARNING"):
+            cache.put("AA", "3.2.1", "Flower care", now=1000)
+        self.assertEqual(cache.get("AA", now=1050)["firmware"], "3.2.1")
+        with self.assertLogs("devicecache", level="WARNING"):
+            cache.invalidate("AA")
+        self.assertIsNone(cache.get("AA", now=1050))
@@ -0,0 +1,86 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from discovery import Discovery
+
+_A = "10:EA:BA:58:10:B8"
+_B = "C4:7C:8D:6A:3E:51"
+
+
+class TestDiscovery(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "discovery.json")
+        self.heard = {"hci0": {_A: -80}, "hci1": {_A: -60}}
+        self.scans = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _scan(self, adapter, window, macs):
+        self.scans.append((adapter, window, macs))
+        return self.heard.get(adapter)
+
+    def _discovery(self):
+        return Discovery(self.path, ["hci1", "hci0", "hci1"], 5, 600, scan=self._scan)
+
+    def test_nothing_known(self):
+        discovery = self._discovery()
+        self.assertTrue(discovery.is_seen(_A))
+        self.assertIsNone(discovery.best_adapter(_A))
+
+    def test_refresh(self):
+        discovery = self._discovery()
+        discovery.refresh([_A.lower(), _B], now=1000)
+        self.assertEqual(sorted(self.scans), [("hci0", 5, [_A, _B]), ("hci1", 5, [_A, _B])])
+        self.assertTrue(discovery.is_seen(_A.lower()))
+        self.assertFalse(discovery.is_seen(_B))
+        self.assertEqual(discovery.best_adapter(_A), "hci1")
+        self.assertIsNone(discovery.best_adapter(_B))
+
+    def test_cached(self):
+        self._discovery().refresh([_A, _B], now=1000)
+        self.scans = []
+        # the scan is kept between runs, for the sensors it looked for
+        discovery = self._discovery()
+        discovery.refresh([_B], now=1599)
+        self.assertEqual(self.scans, [])
+        self.assertFalse(discovery.is_seen(_B))
+        discovery.refresh([_B], now=1600)
+        self.assertEqual(len(self.scans), 2)
+
+    def test_new_mac(self):
+        discovery = self._discovery()
+        discovery.refresh([_A], now=1000)
+        self.scans = []
+        discovery.refresh([_B], now=1001)
+        self.assertEqual(sorted(self.scans), [("hci0", 5, [_A, _B]), ("hci1", 5, [_A, _B])])
+
+    def test_failed_adapter(self):
+        self.heard["hci1"] = None
+        discovery = self._discovery()
+        discovery.refresh([_A], now=1000)
+        self.assertEqual(discovery.best_adapter(_A), "hci0")
+
+    def test_all_failed(self):
+        self.heard = {}
+        discovery = self._discovery()
+        discovery.refresh([_A], now=1000)
+        self.assertTrue(discovery.is_seen(_A))
+        self.scans = []
+        # a failed scan isn't cached
+        discovery.refresh([_A], now=1001)
+        self.assertEqual(len(self.scans), 2)
+
+    def test_all_failed_expired(self):
+        discovery = self._discovery()
+        discovery.refresh([_A, _B], now=1000)
+        self.assertFalse(discovery.is_seen(_B))
+        self.heard = {}
+        # a scan which isn't expired is kept, an expired one is forgotten
+        discovery.refresh([_A, _B, "00:00:00:00:00:01"], now=1001)
+        self.assertFalse(discovery.is_seen(_B))
+        discovery.refresh([_A, _B], now=1600)
+        self.assertTrue(discovery.is_seen(_B))
+        self.assertIsNone(discovery.best_adapter(_A))
@@ -0,0 +1,55 @@
+import random
+from unittest import TestCase
+
+import numpy as np
+
+from fleet import FleetRangeEvaluator
+from messenger import RangeCheckerEvaluator
+from parameters import PARAMETERS
+
+
+def _random_fleet(size, seed):
+    rnd = random.Random(seed)
+    sensors = {}
+    readings = {}
+    for i in range(size):
+        wellbeing_range = {}
+        for p in PARAMETERS:
+            if rnd.random() < 0.6:
+                low = rnd.randint(-10, 60) if rnd.random() < 0.8 else None
+                high = rnd.randint(60, 120) if rnd.random() < 0.8 else None
+                wellbeing_range[p] = {"min": low, "max": high}
+        sensors["s{}".format(i)] = {"mac": str(i), "wellbeing_range": wellbeing_range}
+        readings["s{}".format(i)] = {
+            p: rnd.choice([rnd.randint(-20, 130), rnd.uniform(-20, 130), 60, -10, 120]) for p in PARAMETERS
+        }
+    return sensors, readings
+
+
+class TestFleetRangeEvaluator(TestCase):
+    def test_matches_range_checker(self):
+        sensors, readings = _random_fleet(300, 1)
+        fleet = FleetRangeEvaluator(sensors)
+        expected = []
+        for name, sensor in sensors.items():
+            evaluator = RangeCheckerEvaluator(sensor)
+            for p, value in readings[name].items():
+                if evaluator.need_to_notify(p, value):
+                    expected.append((name, p, value))
+        self.assertEqual(sorted(fleet.evaluate(readings)), sorted(expected))
+
+    def test_boundaries_inclusive(self):
+        fleet = FleetRangeEvaluator({"a": {"wellbeing_range": {"moisture": {"min": 40, "max": 50}}}})
+        self.assertEqual(fleet.evaluate({"a": {"moisture": 40}}), [])
+        self.assertEqual(fleet.evaluate({"a": {"moisture": 50}}), [])
+        self.assertEqual(fleet.evaluate({"a": {"moisture": 50.5}}), [("a", "moisture", 50.5)])
+
+    def test_missing_readings(self):
+        fleet = FleetRangeEvaluator({
+            "a": {"wellbeing_range": {"moisture": {"min": 40, "max": None}}},
+            "b": {"wellbeing_range": {"light": {"min": None, "max": 10}}}
+        })
+        values = fleet.to_matrix({"b": {"light": 11, "moisture": None}})
+        self.assertTrue(np.isnan(values[0]).all())
+        self.assertEqual(fleet.need_to_notify(values).sum(), 1)
+        self.assertEqual(fleet.evaluate({"b": {"light": 11, "moisture": None}}), [("b", "light", 11)])
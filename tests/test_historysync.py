@@ -0,0 +1,125 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from historysync import HistorySync, decode_record
+from plantsensor import PlantSensor, PlantSensorException
+from tests.blesim import simulated_backend
+
+_MAC = "10:EA:BA:58:10:B8"
+_HOUR = 3600
+
+
+def _records(first, count):
+    return [
+        (first + i * _HOUR, {"temperature": 20.5 + i, "light": 1000 + i, "moisture": 30 + i, "conductivity": 200 + i})
+        for i in range(count)
+    ]
+
+
+class TestDecodeRecord(TestCase):
+    def test_decode(self):
+        record = bytes.fromhex("10270000cdff00e803000023c8000000")
+        self.assertEqual(
+            decode_record(record),
+            (10000, {"temperature": -5.1, "light": 1000, "moisture": 35, "conductivity": 200})
+        )
+
+    def test_invalid(self):
+        self.assertIsNone(decode_record(b"\xff" * 16))
+        self.assertIsNone(decode_record(b"\x00" * 16))
+        self.assertIsNone(decode_record(b"\x10\x27"))
+
+
+class TestHistorySync(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "history.json")
+        self.log = _records(100000 - 24 * _HOUR, 24)
+        self.backend = simulated_backend(device_time=100000, history={_MAC: self.log})
+        self.sensor = PlantSensor("hci0", "rose", _MAC, backend=self.backend)
+        self.sensor.read()
+        self.backend.stats.clear()
+        self.store = Mock()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _sync(self, clear=False):
+        return HistorySync(self.path, self.store, 86400, clear).sync(self.sensor)
+
+    def _stored(self):
+        return [(c.args[1], c.args[2]) for c in self.store.append.call_args_list]
+
+    def test_day_in_one_connection(self):
+        self.assertEqual(self._sync(), 24)
+        self.assertEqual(self.backend.stats["connects"], 1)
+        # device time, history init and count, 2 operations per record
+        self.assertEqual(self.sensor.gatt_operations, 3 + 2 * 24)
+        stored = self._stored()
+        self.assertEqual(stored[0][0], self.log[0][1])
+        self.assertEqual([t for _, t in stored], sorted(t for _, t in stored))
+        # device times are mapped to the wall time by the device's current time
+        self.assertAlmostEqual(stored[-1][1] - stored[0][1], 23 * _HOUR)
+
+    def test_only_new_records(self):
+        self._sync()
+        self.log.extend(_records(100000, 3))
+        self.store.reset_mock()
+        self.assertEqual(self._sync(), 3)
+        # the last synced record is read again to make sure the log wasn't replaced
+        self.assertEqual(self.sensor.gatt_operations, 3 + 2 + 2 * 3)
+        self.assertEqual([readings for readings, _ in self._stored()], [r for _, r in self.log[24:]])
+
+    def test_nothing_new(self):
+        self._sync()
+        self.store.reset_mock()
+        self.assertEqual(self._sync(), 0)
+        self.store.append.assert_not_called()
+
+    def test_replaced_log(self):
+        self._sync()
+        # e.g. the sensor's battery was changed: the log starts over, records already stored are skipped
+        self.log[:] = self.log[-2:] + _records(100000, 2)
+        self.store.reset_mock()
+        self.assertEqual(self._sync(), 2)
+        self.assertEqual([readings for readings, _ in self._stored()], [r for _, r in self.log[2:]])
+
+    def test_clear(self):
+        self.assertEqual(self._sync(clear=True), 24)
+        self.assertEqual(self.log, [])
+        self.log.extend(_records(100000, 2))
+        self.store.reset_mock()
+        self.assertEqual(self._sync(clear=True), 2)
+        self.assertEqual(self.log, [])
+
+    def test_not_cleared_when_store_fails(self):
+        self.store.append.side_effect = OSError("disk full")
+        with self.assertRaises(PlantSensorException):
+            self._sync(clear=True)
+        self.assertEqual(len(self.log), 24)
+
+    def test_cursor_persisted(self):
+        self._sync()
+        self.log.extend(_records(100000, 1))
+        self.store.reset_mock()
+        self.assertEqual(HistorySync(self.path, self.store, 86400).sync(self.sensor), 1)
+
+    def test_failure(self):
+        self.backend.failure_rate = 1.0
+        with self.assertRaises(PlantSensorException):
+            self._sync()
+        self.assertTrue(HistorySync(self.path, self.store, 86400).due(_MAC))
+
+    def test_due(self):
+        history = HistorySync(self.path, self.store, 86400)
+        self.assertTrue(history.due(_MAC, now=1000))
+        history.sync(self.sensor, now=1000)
+        self.assertFalse(history.due(_MAC.lower(), now=1000 + 86399))
+        self.assertTrue(history.due(_MAC, now=1000 + 86400))
+
+    def test_offset_is_device_clock(self):
+        with patch("miflorapoller.time", return_value=200000.0):
+            self._sync()
+        self.assertEqual(self._stored()[0][1], 200000 - 24 * _HOUR)
@@ -1,6 +1,9 @@
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Event, Thread
 from unittest import TestCase, mock
 
-from messenger import RangeCheckerEvaluator, AlertMessageRender
+from messenger import RangeCheckerEvaluator, AlertMessageRender, Dispatcher, Messenger, _join
 
 
 class TestRangeCheckerEvaluator(TestCase):
@@ -32,9 +35,27 @@ class TestRangeCheckerEvaluator(TestCase):
         e = RangeCheckerEvaluator({"wellbeing_range": {"moisture": {"min": None, "max": 10}}})
         self.assertTrue(e.need_to_notify("moisture", 20))
 
+    def test_is_recovered_hysteresis(self):
+        e = RangeCheckerEvaluator({"wellbeing_range": {"moisture": {"min": 40, "max": 60}}}, {"moisture": 3})
+        self.assertFalse(e.is_recovered("moisture", 42))
+        self.assertTrue(e.is_recovered("moisture", 43))
+        self.assertTrue(e.is_recovered("moisture", 57))
+        self.assertFalse(e.is_recovered("moisture", 58))
+
+    def test_is_recovered_open_range(self):
+        e = RangeCheckerEvaluator({"wellbeing_range": {"moisture": {"min": 40, "max": None}}}, {"moisture": 3})
+        self.assertTrue(e.is_recovered("moisture", 1000))
+        self.assertTrue(e.is_recovered("light", 0))
+
+    def test_no_anomalies(self):
+        e = RangeCheckerEvaluator({"wellbeing_range": {"moisture": {"min": 40, "max": None}}})
+        self.assertEqual(dict(e.anomalies), {})
+        with self.assertRaises(TypeError):
+            e.anomalies["moisture"] = "stuck"
+
 
 class TestAlertMessageRender(TestCase):
-    @mock.patch("messenger._render_boundaries")
+    @mock.patch("boundaries.render")
     def test_prepare(self, br):
         br.return_value = "boundaries"
         r = AlertMessageRender(
@@ -42,3 +63,172 @@ class TestAlertMessageRender(TestCase):
             {"moisture": "{plant}:{boundaries}:{value}"}
         )
         self.assertEqual(r.prepare("zzz", "moisture", 5), "zzz:boundaries:5")
+
+    def test_prepare_recovered(self):
+        r = AlertMessageRender(
+            {"zzz": {"wellbeing_range": {"moisture": {"min": 0, "max": 10}}}},
+            {"recovered": "{plant}:{parameter}:{boundaries}:{value}"}
+        )
+        self.assertEqual(r.prepare_recovered("zzz", "moisture", 5), "zzz:moisture:[0, 10]:5")
+
+    def test_prepare_dark(self):
+        r = AlertMessageRender({"zzz": {"wellbeing_range": {}}}, {"dark": "{plant}:{last_success}:{error}:{failures}"})
+        health = {"failures": 3, "last_success": None, "last_error": "BTLEException"}
+        self.assertEqual(r.prepare_dark("zzz", health), "zzz:never:BTLEException:3")
+
+    def test_prepare_anomaly(self):
+        r = AlertMessageRender(
+            {"zzz": {"wellbeing_range": {"moisture": {"min": None, "max": None, "stuck": 5}}}},
+            {"stuck": "{plant}:{parameter} is stuck at {value}"}
+        )
+        self.assertEqual(r.prepare_anomaly("zzz", "moisture", 5, "stuck"), "zzz:moisture is stuck at 5")
+
+
+class _FakeTelegram(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.requests.append((self.path, body))
+        status, payload = self.server.responses.pop(0) if self.server.responses else (200, None)
+        if payload is None:
+            payload = {
+                "ok": True,
+                "result": {"message_id": len(self.server.requests), "date": 0, "chat": {"id": 1, "type": "channel"}}
+            }
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestDispatcher(TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeTelegram)
+        self.server.requests = []
+        self.server.responses = []
+        Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        render = AlertMessageRender(
+            {"rose": {"wellbeing_range": {"moisture": {"min": 40, "max": None}, "light": {"min": 100, "max": None}}}},
+            {"moisture": "{plant} moisture {value}", "light": "{plant} light {value}", "recovered": "{plant} ok"}
+        )
+        self.messenger = Messenger(
+            "123:ABC", "-100", "MarkdownV2", render, base_url="http://127.0.0.1:{}/bot".format(self.server.server_port)
+        )
+        self.sleep = mock.patch("messenger.time.sleep").start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _texts(self):
+        return [body["text"] for _, body in self.server.requests]
+
+    def test_send(self):
+        dispatcher = Dispatcher(self.messenger)
+        dispatcher.send("rose", "moisture", 10)
+        dispatcher.send_recovered("rose", "light", 200)
+        dispatcher.close(5)
+        self.assertEqual(self._texts(), ["rose moisture 10", "rose ok"])
+        self.assertEqual(self.server.requests[0][0], "/bot123:ABC/sendMessage")
+        self.assertEqual(self.server.requests[0][1]["chat_id"], "-100")
+
+    def test_coalesce(self):
+        dispatcher = Dispatcher(self.messenger, coalesce=True)
+        dispatcher.send("rose", "moisture", 10)
+        dispatcher.send("rose", "light", 5)
+        dispatcher.end_cycle()
+        dispatcher.send("rose", "moisture", 11)
+        dispatcher.close(5)
+        self.assertEqual(self._texts(), ["rose moisture 10\n\nrose light 5", "rose moisture 11"])
+
+    def test_retry_after(self):
+        self.server.responses = [
+            (429, {
+                "ok": False, "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 7}
+            })
+        ]
+        dispatcher = Dispatcher(self.messenger)
+        dispatcher.send("rose", "moisture", 10)
+        dispatcher.close(5)
+        self.assertEqual(self._texts(), ["rose moisture 10", "rose moisture 10"])
+        self.sleep.assert_called_once_with(7)
+
+    def test_backoff(self):
+        error = {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+        self.server.responses = [(500, error), (500, error)]
+        dispatcher = Dispatcher(self.messenger, backoff=2)
+        dispatcher.send("rose", "moisture", 10)
+        dispatcher.close(5)
+        self.assertEqual(len(self._texts()), 3)
+        self.assertEqual([c[0][0] for c in self.sleep.call_args_list], [2, 4])
+
+    def test_give_up(self):
+        error = {"ok": False, "error_code": 500, "description": "Internal Server Error"}
+        self.server.responses = [(500, error)] * 2
+        dispatcher = Dispatcher(self.messenger, max_attempts=2)
+        dispatcher.send("rose", "moisture", 10)
+        dispatcher.send("rose", "light", 5)
+        dispatcher.close(5)
+        self.assertEqual(self._texts(), ["rose moisture 10", "rose moisture 10", "rose light 5"])
+
+    def test_bad_request_not_retried(self):
+        self.server.responses = [(400, {"ok": False, "error_code": 400, "description": "Bad Request"})]
+        dispatcher = Dispatcher(self.messenger)
+        dispatcher.send("rose", "moisture", 10)
+        dispatcher.close(5)
+        self.assertEqual(len(self._texts()), 1)
+
+    def test_queue_full(self):
+        messenger = mock.Mock()
+        sending = Event()
+        release = Event()
+        messenger.send_text.side_effect = lambda text: (sending.set(), release.wait(5))
+        dispatcher = Dispatcher(messenger, queue_size=1)
+        dispatcher.send_text("0")
+        sending.wait(5)
+        for i in range(1, 5):
+            dispatcher.send_text(str(i))
+        release.set()
+        dispatcher.close(5)
+        self.assertEqual([c[0][0] for c in messenger.send_text.call_args_list], ["0", "1"])
+
+    def test_close_queue_full(self):
+        messenger = mock.Mock()
+        sending = Event()
+        release = Event()
+        messenger.send_text.side_effect = lambda text: (sending.set(), release.wait(5))
+        dispatcher = Dispatcher(messenger, queue_size=1)
+        dispatcher.send_text("0")
+        sending.wait(5)
+        dispatcher.send_text("1")
+        with self.assertLogs("messenger", level="WARNING"):
+            dispatcher.close(0.1)
+        release.set()
+        dispatcher._thread.join(5)
+        self.assertFalse(dispatcher._thread.is_alive())
+        self.assertEqual([c[0][0] for c in messenger.send_text.call_args_list], ["0"])
+
+    def test_get_updates(self):
+        chat = {"id": -100, "type": "group", "title": "plants"}
+        self.server.responses = [(200, {"ok": True, "result": [
+            {"update_id": 7, "message": {"message_id": 1, "date": 0, "chat": chat, "text": "/status"}},
+            {"update_id": 8, "channel_post": {"message_id": 2, "date": 0, "chat": dict(chat, username="roses"),
+                                              "text": "/history Rose"}},
+        ]})]
+        self.assertEqual(
+            self.messenger.get_updates(5, timeout=0), [(7, -100, None, "/status"), (8, -100, "roses", "/history Rose")]
+        )
+        self.assertEqual(self.server.requests[0][0], "/bot123:ABC/getUpdates")
+        self.assertEqual(int(self.server.requests[0][1]["offset"]), 5)
+        self.messenger.reply(-100, "Rose: moisture 35")
+        self.assertEqual(self.server.requests[1][1]["text"], "Rose: moisture 35")
+        # answers are plain text
+        self.assertNotIn("parse_mode", self.server.requests[1][1])
+
+    def test_join(self):
+        self.assertEqual(_join(["a" * 3, "b" * 3, "c" * 3], limit=8), ["aaa\n\nbbb", "ccc"])
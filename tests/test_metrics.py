@@ -0,0 +1,73 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import metrics
+
+
+class TestMetrics(TestCase):
+    def tearDown(self):
+        metrics.disable()
+
+    def test_disabled(self):
+        metrics.inc("retries", sensor="rose")
+        with metrics.timer("phase", phase="read", sensor="rose"):
+            pass
+        self.assertEqual(metrics.render(), "")
+
+    def test_counters(self):
+        registry = metrics.enable()
+        metrics.inc("retries", sensor="rose")
+        metrics.inc("retries", sensor="rose")
+        metrics.inc("retries", sensor="tulip")
+        self.assertEqual(registry.counter("retries", sensor="rose"), 2)
+        self.assertEqual(
+            metrics.render(),
+            "# TYPE plantcare_retries_total counter\n"
+            "plantcare_retries_total{sensor=\"rose\"} 2\n"
+            "plantcare_retries_total{sensor=\"tulip\"} 1\n"
+        )
+
+    def test_timer(self):
+        registry = metrics.enable()
+        for _ in range(2):
+            with metrics.timer("phase", phase="read", sensor="rose"):
+                pass
+        with self.assertRaises(ValueError):
+            with metrics.timer("phase", phase="read", sensor="rose"):
+                raise ValueError()
+        count, total = registry.timing("phase", sensor="rose", phase="read")
+        self.assertEqual(count, 3)
+        self.assertGreaterEqual(total, 0)
+        self.assertIn("plantcare_phase_seconds_count{phase=\"read\",sensor=\"rose\"} 3\n", metrics.render())
+
+    def test_label_escaping(self):
+        metrics.enable()
+        metrics.inc("alerts", sensor="a \"rose\"\n")
+        self.assertIn("{sensor=\"a \\\"rose\\\"\\n\"}", metrics.render())
+
+    def test_write_textfile(self):
+        metrics.enable()
+        metrics.inc("given_up", sensor="rose")
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "textfile", "plantcare.prom")
+            metrics.write_textfile(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), metrics.render())
+            self.assertEqual(os.listdir(os.path.dirname(path)), ["plantcare.prom"])
+
+    def test_serve(self):
+        metrics.enable()
+        metrics.inc("retries", sensor="rose")
+        server = metrics.serve("127.0.0.1", 0)
+        try:
+            url = "http://127.0.0.1:{}".format(server.server_port)
+            with urlopen(url + "/metrics") as response:
+                self.assertEqual(response.read().decode(), metrics.render())
+            with self.assertRaises(HTTPError):
+                urlopen(url + "/")
+        finally:
+            server.shutdown()
+            server.server_close()
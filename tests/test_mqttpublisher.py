@@ -0,0 +1,134 @@
+import json
+import time
+from unittest import TestCase
+
+import metrics
+from mqttpublisher import MqttPublisher, object_id
+from tests.mqttbroker import LocalBroker
+
+_T0 = 1700006400
+
+
+def _states(messages):
+    return [json.loads(payload) for topic, payload, _ in messages if topic.endswith("/state")]
+
+
+class TestMqttPublisher(TestCase):
+    def setUp(self):
+        self.broker = LocalBroker()
+        self.addCleanup(self.broker.stop)
+        self.publisher = None
+
+    def tearDown(self):
+        if self.publisher is not None:
+            self.publisher.close(5)
+
+    def _publisher(self, **kwargs):
+        self.publisher = MqttPublisher("127.0.0.1", self.broker.port, reconnect_delay=0.1, **kwargs)
+        self.assertTrue(self.broker.wait_for(lambda m: ("plantcare/status", "online", True) in m))
+        return self.publisher
+
+    def _stop_broker(self):
+        self.broker.stop()
+        deadline = time.monotonic() + 5
+        while self.publisher.connected and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(self.publisher.connected)
+
+    def test_object_id(self):
+        self.assertEqual(object_id("Rose"), "rose")
+        self.assertEqual(object_id("Kitchen: Basil #2"), "kitchen_basil_2")
+        self.assertEqual(object_id("Ель"), "sensor")
+
+    def test_publish_cycle(self):
+        publisher = self._publisher()
+        publisher.on_readings("Rose", {"moisture": 35, "temperature": 21.5, "battery": None}, _T0)
+        publisher.on_readings("Basil", {"moisture": 50}, _T0 + 1)
+        # nothing is published until the cycle ends
+        self.assertFalse(self.broker.wait_for(lambda m: len(_states(m)) > 0, timeout=0.3))
+        publisher.end_cycle()
+        self.assertTrue(self.broker.wait_for(lambda m: len(_states(m)) == 2))
+        self.assertEqual(
+            _states(self.broker.messages),
+            [{"moisture": 35, "temperature": 21.5, "timestamp": _T0}, {"moisture": 50, "timestamp": _T0 + 1}]
+        )
+        self.assertIn("plantcare/rose/state", self.broker.topics())
+
+    def test_discovery(self):
+        publisher = self._publisher(discovery_prefix="ha")
+        publisher.on_readings("Rose", {"moisture": 35}, _T0)
+        publisher.end_cycle()
+        publisher.on_readings("Rose", {"moisture": 34, "light": 100}, _T0 + 60)
+        publisher.end_cycle()
+        self.assertTrue(self.broker.wait_for(lambda m: len(_states(m)) == 2))
+        configs = [(topic, json.loads(payload), retain) for topic, payload, retain in self.broker.messages
+                   if topic.endswith("/config")]
+        # once per parameter, before its first state
+        self.assertEqual(
+            [topic for topic, _, _ in configs], ["ha/sensor/rose/moisture/config", "ha/sensor/rose/light/config"]
+        )
+        topic, payload, retain = configs[0]
+        self.assertTrue(retain)
+        self.assertEqual(payload["state_topic"], "plantcare/rose/state")
+        self.assertEqual(payload["value_template"], "{{ value_json.moisture }}")
+        self.assertEqual(payload["unique_id"], "plantcare_rose_moisture")
+        self.assertEqual(payload["availability_topic"], "plantcare/status")
+        self.assertEqual(payload["device"]["identifiers"], ["plantcare_rose"])
+
+    def test_broker_unreachable(self):
+        publisher = self._publisher(queue_size=3)
+        self._stop_broker()
+        for i in range(5):
+            publisher.on_readings("Rose", {"moisture": i}, _T0 + i)
+            # never blocks on the broker
+            publisher.end_cycle()
+        self.broker.start()
+        # the oldest readings are dropped, the rest are published on reconnect, with the discovery configs again
+        self.assertTrue(self.broker.wait_for(lambda m: len(_states(m)) == 3, timeout=10))
+        self.assertEqual([state["moisture"] for state in _states(self.broker.messages)], [2, 3, 4])
+        self.assertIn("homeassistant/sensor/rose/moisture/config", self.broker.topics())
+
+    def test_reconnected(self):
+        publisher = self._publisher()
+        publisher.on_readings("Rose", {"moisture": 35}, _T0)
+        publisher.end_cycle()
+        self.assertTrue(self.broker.wait_for(lambda m: len(_states(m)) == 1))
+        self._stop_broker()
+        self.assertTrue(self.broker.wait_for(lambda m: m[-1] == ("plantcare/status", "offline", True)))
+        self.broker.start()
+        self.assertTrue(self.broker.wait_for(lambda m: m[-1] == ("plantcare/status", "online", True), timeout=10))
+        publisher.on_readings("Rose", {"moisture": 34}, _T0 + 60)
+        publisher.end_cycle()
+        self.assertTrue(self.broker.wait_for(lambda m: len(_states(m)) == 2))
+        self.assertEqual(self.broker.connects, 2)
+        self.assertEqual(self.broker.topics().count("homeassistant/sensor/rose/moisture/config"), 2)
+
+    def test_close_flushes(self):
+        publisher = self._publisher()
+        publisher.on_readings("Rose", {"moisture": 35}, _T0)
+        publisher.close(5)
+        self.publisher = None
+        self.assertEqual(len(_states(self.broker.messages)), 1)
+        self.assertEqual(self.broker.messages[-1], ("plantcare/status", "offline", True))
+
+    def test_metrics(self):
+        registry = metrics.enable()
+        self.addCleanup(metrics.disable)
+        publisher = self._publisher(queue_size=1)
+        self._stop_broker()
+        publisher.on_readings("Rose", {"moisture": 35}, _T0)
+        publisher.on_readings("Basil", {"moisture": 50}, _T0)
+        publisher.end_cycle()
+        self.broker.start()
+        self.assertTrue(self.broker.wait_for(lambda m: len(_states(m)) == 1, timeout=10))
+        rendered = registry.render()
+        self.assertIn('plantcare_mqtt_messages_total{result="dropped"} 1', rendered)
+
+    def test_close_waits_for_connection(self):
+        self.broker.stop()
+        self.publisher = MqttPublisher("127.0.0.1", self.broker.port, reconnect_delay=0.1)
+        self.publisher.on_readings("Rose", {"moisture": 35}, _T0)
+        self.broker.start()
+        self.publisher.close(5)
+        self.publisher = None
+        self.assertEqual(len(_states(self.broker.messages)), 1)
@@ -1,9 +1,41 @@
+import json
 import logging
+import os
+from tempfile import TemporaryDirectory
+from threading import Barrier, Event, Lock
 from unittest import TestCase
-from unittest.mock import Mock
+from unittest.mock import ANY, Mock, patch
 
+import api
+import config
+import metrics
 import plantcare
-from plantsensor import PlantSensorException
+from alertstate import AlertState
+from anomaly import AnomalyState
+from boundaries import BoundaryTable
+from discovery import Discovery
+from messenger import AlertMessageRender, RangeCheckerEvaluator
+from parameters import PARAMETERS
+from plantsensor import PlantSensor, PlantSensorException
+from sensorhealth import SensorHealth
+from tests.blesim import simulated_backend
+
+
+def _raise(e):
+    raise e
+
+
+def _raise_cause(e, cause):
+    def _read():
+        raise e from cause
+    return _read
+
+
+def _mock_sensor():
+    sensor = Mock()
+    sensor.parameters = PARAMETERS
+    sensor.ages = {}
+    return sensor
 
 
 def _mock_sensor_read_failed_recover():
@@ -13,6 +45,24 @@ def _mock_sensor_read_failed_recover():
         yield {}
 
 
+class _Clock(object):
+    def __init__(self, stop, until):
+        self.now = 0
+        self.waits = []
+        self._stop = stop
+        self._until = until
+        stop.wait = self.wait
+
+    def monotonic(self):
+        return self.now
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.now += timeout
+        if self.now >= self._until:
+            self._stop.set()
+
+
 class TestCheckSensors(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -24,8 +74,9 @@ class TestCheckSensors(TestCase):
         self.sensors = []
         self.evaluators = {}
         for n in names:
-            self.sensors.append(Mock())
+            self.sensors.append(_mock_sensor())
             self.sensors[-1].name = n
+            self.sensors[-1].adapter = "hci0"
             self.sensors[-1].read.return_value = {}
             self.evaluators[n] = Mock()
 
@@ -50,6 +101,374 @@ class TestCheckSensors(TestCase):
         self.assertEqual(plantcare.check_sensors(self.sensors, 5, Mock(), self.evaluators), 3)
         self.assertEqual(failed_sensor_readings.call_count, 3)
 
+    def test_check_sensors_history(self):
+        history = Mock()
+        history.due.side_effect = lambda mac: mac != "b"
+        history.sync.side_effect = lambda sensor: _raise(PlantSensorException()) if sensor.name == "c" else 1
+        for sensor in self.sensors:
+            sensor.mac = sensor.name
+        self.sensors[0].read.side_effect = PlantSensorException()
+        # a failed history sync doesn't fail the check
+        self.assertEqual(plantcare.check_sensors(self.sensors, 1, Mock(), self.evaluators, history=history), 2)
+        self.assertEqual([c.args[0].name for c in history.sync.call_args_list], ["c"])
+
+    def test_check_sensors_discovery(self):
+        for sensor in self.sensors:
+            sensor.mac = sensor.name.upper()
+        self.sensors[0].read.side_effect = PlantSensorException()
+        self.sensors[2].read.side_effect = PlantSensorException()
+        heard = {"hci0": {"B": -90, "C": -90}, "hci1": {"B": -50, "C": -95}}
+        with TemporaryDirectory() as tmp:
+            discovery = Discovery(
+                os.path.join(tmp, "discovery.json"), ["hci0", "hci1"], 5, 600,
+                scan=lambda adapter, window, macs: heard[adapter]
+            )
+            self.assertEqual(plantcare.check_sensors(self.sensors, 5, Mock(), self.evaluators, discovery=discovery), 1)
+        # "a" isn't heard at all, it's tried once after the others
+        self.assertEqual(self.sensors[0].read.call_count, 1)
+        self.assertEqual(self.sensors[2].read.call_count, 5)
+        self.sensors[1].set_adapter.assert_called_once_with("hci1")
+        self.sensors[2].set_adapter.assert_not_called()
+
+    def test_check_sensors_discovery_skip(self):
+        discovery = Mock()
+        discovery.unseen_attempts = 0
+        discovery.is_seen.side_effect = lambda mac: mac != "a"
+        discovery.best_adapter.return_value = None
+        for sensor in self.sensors:
+            sensor.mac = sensor.name
+        self.assertEqual(plantcare.check_sensors(self.sensors, 5, Mock(), self.evaluators, discovery=discovery), 2)
+        self.sensors[0].read.assert_not_called()
+
+    def test_check_sensors_health(self):
+        messenger = Mock()
+        self.sensors[0].read.side_effect = _raise_cause(PlantSensorException(), OSError())
+        with TemporaryDirectory() as tmp:
+            health = SensorHealth(os.path.join(tmp, "health.json"), 2, 3600, 86400)
+            for _ in range(2):
+                plantcare.check_sensors(self.sensors, 3, messenger, self.evaluators, health=health)
+            self.assertEqual(self.sensors[0].read.call_count, 6)
+            messenger.send_dark.assert_called_once_with("a", health.get("a"))
+            self.assertEqual(health.get("a")["last_error"], "OSError")
+            # dark: skipped until it's due to be probed, then probed once
+            self.assertEqual(plantcare.check_sensors(self.sensors, 3, messenger, self.evaluators, health=health), 2)
+            self.assertEqual(self.sensors[0].read.call_count, 6)
+            with patch("sensorhealth.time.time", return_value=health.get("a")["next_probe"]):
+                plantcare.check_sensors(self.sensors, 3, messenger, self.evaluators, health=health)
+            self.assertEqual(self.sensors[0].read.call_count, 7)
+            messenger.send_dark.assert_called_once()
+            self.sensors[0].read.side_effect = None
+            with patch("sensorhealth.time.time", return_value=health.get("a")["next_probe"]):
+                self.assertEqual(plantcare.check_sensors(self.sensors, 3, messenger, self.evaluators, health=health), 3)
+            self.assertFalse(health.is_dark("a"))
+
+    def test_check_sensors_passive(self):
+        complete = {"light": 100, "temperature": 20.5, "moisture": 35, "conductivity": 200}
+        for i, sensor in enumerate(self.sensors):
+            sensor.mac = "00:00:00:00:00:0{}".format(i)
+            self.evaluators[sensor.name].boundaries = {}
+        self.evaluators["c"].boundaries = {"battery": {"min": 10, "max": 100}}
+        heard = {
+            "00:00:00:00:00:00": complete, "00:00:00:00:00:01": {"moisture": 35}, "00:00:00:00:00:02": complete
+        }
+        listener = Mock()
+        with patch("plantcare.advertisement.scan", return_value=heard) as scan:
+            success = plantcare.check_sensors(
+                self.sensors, 2, Mock(), self.evaluators, listeners=[listener], passive_window=10
+            )
+        self.assertEqual(success, 3)
+        scan.assert_called_once_with("hci0", 10, [s.mac for s in self.sensors])
+        self.sensors[0].read.assert_not_called()
+        self.sensors[1].read.assert_called_once()
+        # battery is monitored, but not advertised
+        self.sensors[2].read.assert_called_once()
+        self.assertEqual(listener.on_readings.call_args_list[0][0][:2], ("a", complete))
+
+    @patch("plantcare.monotonic")
+    def test_check_sensors_backoff(self, monotonic):
+        clock = _Clock(Event(), 1000)
+        monotonic.side_effect = clock.monotonic
+        order = []
+        for sensor in self.sensors:
+            sensor.read.side_effect = lambda name=sensor.name: order.append((name, clock.now)) or {}
+        self.sensors[0].read.side_effect = lambda: order.append(("a", clock.now)) or _raise(PlantSensorException())
+        with patch("plantcare._SLEEP", 10), patch("plantcare._JITTER", 0):
+            success = plantcare.check_sensors(self.sensors, 4, Mock(), self.evaluators, clock._stop)
+        self.assertEqual(success, 2)
+        self.assertEqual(order, [("a", 0), ("b", 0), ("c", 0), ("a", 10), ("a", 30), ("a", 70)])
+
+    @patch("plantcare.monotonic")
+    def test_check_sensors_cycle_timeout(self, monotonic):
+        clock = _Clock(Event(), 1000)
+        monotonic.side_effect = clock.monotonic
+        self.sensors[0].read.side_effect = PlantSensorException()
+        with patch("plantcare._SLEEP", 10), patch("plantcare._JITTER", 0):
+            success = plantcare.check_sensors(self.sensors, 5, Mock(), self.evaluators, clock._stop, cycle_timeout=25)
+        self.assertEqual(success, 2)
+        self.assertEqual(self.sensors[0].read.call_count, 2)
+
+    def test_check_sensors_adapters_in_parallel(self):
+        barrier = Barrier(2)
+        lock = Lock()
+        active = {}
+        peak = {}
+
+        def read(adapter):
+            with lock:
+                active[adapter] = active.get(adapter, 0) + 1
+                peak[adapter] = max(peak.get(adapter, 0), active[adapter])
+            barrier.wait(timeout=5)
+            with lock:
+                active[adapter] -= 1
+            return {}
+
+        for n in ["d", "e", "f"]:
+            self.sensors.append(_mock_sensor())
+            self.sensors[-1].name = n
+            self.evaluators[n] = Mock()
+        for i, sensor in enumerate(self.sensors):
+            sensor.adapter = "hci{}".format(i % 2)
+            sensor.read.side_effect = lambda adapter=sensor.adapter: read(adapter)
+        self.assertEqual(plantcare.check_sensors(self.sensors, 2, Mock(), self.evaluators), 6)
+        self.assertEqual(peak, {"hci0": 1, "hci1": 1})
+
+    def test_check_sensors_adapters_failed(self):
+        self.sensors[0].adapter = "hci1"
+        failed_sensor_readings = self.sensors[1].read
+        failed_sensor_readings.side_effect = PlantSensorException()
+        self.assertEqual(plantcare.check_sensors(self.sensors, 3, Mock(), self.evaluators), 2)
+        self.assertEqual(failed_sensor_readings.call_count, 3)
+
+
+class TestCheckSensorsSimulated(TestCase):
+    def test_check_sensors(self):
+        macs = ["00:00:00:00:00:{:02X}".format(i) for i in range(20)]
+        backend = simulated_backend(
+            failure_rate=0.2, drop_rate=0.1, readings={mac: {"moisture": 10} for mac in macs[:5]}
+        )
+        sensors = [PlantSensor("hci{}".format(i % 2), mac, mac, backend=backend) for i, mac in enumerate(macs)]
+        evaluators = {
+            mac: RangeCheckerEvaluator({"wellbeing_range": {"moisture": {"min": 20, "max": None}}}) for mac in macs
+        }
+        messenger = Mock()
+        with patch("plantcare._SLEEP", 0):
+            self.assertEqual(plantcare.check_sensors(sensors, 20, messenger, evaluators), 20)
+        self.assertGreater(backend.stats["failures"], 0)
+        self.assertEqual(sorted(c[0][0] for c in messenger.send.call_args_list), macs[:5])
+
+    def test_check_sensors_metrics(self):
+        backend = simulated_backend(failure_rate=1)
+        sensor = PlantSensor("hci0", "rose", "00:00:00:00:00:00", backend=backend)
+        evaluators = {"rose": RangeCheckerEvaluator({"wellbeing_range": {}})}
+        registry = metrics.enable()
+        try:
+            with patch("plantcare._SLEEP", 0):
+                self.assertEqual(plantcare.check_sensors([sensor], 3, Mock(), evaluators), 0)
+            backend.failure_rate = 0
+            self.assertEqual(plantcare.check_sensors([sensor], 3, Mock(), evaluators), 1)
+        finally:
+            metrics.disable()
+        self.assertEqual(registry.counter("read_failures", sensor="rose", cause="BluetoothBackendException"), 3)
+        self.assertEqual(registry.counter("retries", sensor="rose"), 2)
+        self.assertEqual(registry.counter("given_up", sensor="rose"), 1)
+        self.assertEqual(registry.counter("readings", sensor="rose", source="gatt"), 1)
+        self.assertEqual(registry.timing("phase", phase="firmware_check", sensor="rose")[0], 4)
+        self.assertEqual(registry.timing("phase", phase="read", sensor="rose")[0], 1)
+
+
+class TestRunDaemon(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        logging.basicConfig(level=logging.CRITICAL)
+        plantcare._SLEEP = 0
+
+    def setUp(self):
+        self.stop = Event()
+        self.sensors = []
+        for n in ["a", "b"]:
+            self.sensors.append(_mock_sensor())
+            self.sensors[-1].name = n
+            self.sensors[-1].read.return_value = {}
+
+    @patch("plantcare.monotonic")
+    def test_run_daemon_intervals(self, monotonic):
+        clock = _Clock(self.stop, 25)
+        monotonic.side_effect = clock.monotonic
+        plantcare.run_daemon(self.sensors, {"a": 10, "b": 30}, 2, Mock(), {"a": Mock(), "b": Mock()}, self.stop)
+        self.assertEqual(self.sensors[0].read.call_count, 3)
+        self.assertEqual(self.sensors[1].read.call_count, 1)
+        self.assertEqual(clock.waits, [10, 10, 10])
+
+    def test_run_daemon_stopped(self):
+        self.stop.set()
+        plantcare.run_daemon(self.sensors, {"a": 10, "b": 10}, 2, Mock(), {"a": Mock(), "b": Mock()}, self.stop)
+        self.sensors[0].read.assert_not_called()
+
+    @patch("plantcare.monotonic")
+    def test_run_daemon_reload(self, monotonic):
+        clock = _Clock(self.stop, 25)
+        monotonic.side_effect = clock.monotonic
+        added = _mock_sensor()
+        added.name = "c"
+        added.read.return_value = {}
+        reloads = [None, ([self.sensors[0], added], {"a": 10, "c": 10})]
+        evaluators = {"a": Mock(), "b": Mock(), "c": Mock()}
+        plantcare.run_daemon(
+            self.sensors, {"a": 10, "b": 10}, 2, Mock(), evaluators, self.stop,
+            reload=lambda: reloads.pop(0) if reloads else None
+        )
+        self.assertEqual(self.sensors[0].read.call_count, 3)
+        self.assertEqual(self.sensors[1].read.call_count, 1)
+        self.assertEqual(added.read.call_count, 3)
+        self.assertEqual(clock.waits, [5, 5, 5, 5, 5])
+
+    @patch("plantcare.monotonic")
+    def test_run_daemon_refresh(self, monotonic):
+        clock = _Clock(self.stop, 25)
+        monotonic.side_effect = clock.monotonic
+        refresh = api.RefreshRequests()
+        events = []
+        # "b" is asked for twice during the first wait, "x" isn't a sensor (anymore)
+        waits = clock.wait
+        clock.wait = lambda timeout: (
+            events.extend([refresh.request("b"), refresh.request("b"), refresh.request("x")]) if not events else None,
+            waits(timeout)
+        )
+        self.stop.wait = clock.wait
+        plantcare.run_daemon(
+            self.sensors, {"a": 100, "b": 100}, 2, Mock(), {"a": Mock(), "b": Mock()}, self.stop, refresh=refresh
+        )
+        self.assertEqual(self.sensors[0].read.call_count, 1)
+        self.assertEqual(self.sensors[1].read.call_count, 2)
+        self.assertIs(events[0], events[1])
+        self.assertTrue(all(event.is_set() for event in events))
+        self.assertEqual(set(clock.waits), {1})
+
+    @patch("plantcare.monotonic")
+    def test_run_daemon_adaptive(self, monotonic):
+        clock = _Clock(self.stop, 25)
+        monotonic.side_effect = clock.monotonic
+        adaptive = Mock()
+        adaptive.next_interval.side_effect = lambda name, boundaries, default: {"a": 5, "b": 20}[name]
+        evaluators = {"a": Mock(), "b": Mock()}
+        plantcare.run_daemon(self.sensors, {"a": 10, "b": 10}, 2, Mock(), evaluators, self.stop, adaptive=adaptive)
+        self.assertEqual(self.sensors[0].read.call_count, 5)
+        self.assertEqual(self.sensors[1].read.call_count, 2)
+        adaptive.next_interval.assert_any_call("a", evaluators["a"].boundaries, 10)
+
+
+class TestConfigReloader(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "config.json")
+        self.config = {
+            "telegram": {"token": "123:ABC", "channel": "-100"},
+            "sensors": {
+                "rose": {"mac": "00:00:00:00:00:01", "wellbeing_range": {"moisture": {"min": 40}}},
+                "tulip": {"mac": "00:00:00:00:00:02", "wellbeing_range": {"moisture": {"min": 30}}}
+            }
+        }
+        self._write()
+        patch.dict(os.environ, {"CONFIG_FILE": self.path}).start()
+        self.addCleanup(patch.stopall)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(config.reload)
+        config.reload()
+        settings = plantcare._read_config(daemon=True)
+        self.sensors = [
+            PlantSensor("hci0", name, sensor["mac"], backend=simulated_backend())
+            for name, sensor in settings["sensors"].items()
+        ]
+        table = BoundaryTable()
+        self.evaluators = {
+            name: RangeCheckerEvaluator(sensor, table=table) for name, sensor in settings["sensors"].items()
+        }
+        self.render = AlertMessageRender(settings["sensors"], settings["message_templates"], table)
+        self.adaptive = Mock()
+        self.reloader = plantcare.ConfigReloader(
+            settings, self.sensors, self.evaluators, self.render, adaptive=self.adaptive
+        )
+        self.mtime = 0
+
+    def _write(self):
+        with open(self.path, "w") as f:
+            json.dump(self.config, f)
+        if hasattr(self, "mtime"):
+            self.mtime += 1
+            os.utime(self.path, ns=(self.mtime, self.mtime))
+
+    def test_unchanged(self):
+        self.assertIsNone(self.reloader())
+
+    def test_threshold_changed(self):
+        rose = self.evaluators["rose"]
+        self.config["sensors"]["tulip"]["wellbeing_range"]["moisture"]["min"] = 20
+        self._write()
+        sensors, intervals = self.reloader()
+        self.assertIs(sensors[0], self.sensors[0])
+        self.assertIs(sensors[1], self.sensors[1])
+        self.assertIs(self.evaluators["rose"], rose)
+        self.assertTrue(self.evaluators["tulip"].need_to_notify("moisture", 15))
+        self.assertFalse(self.evaluators["tulip"].need_to_notify("moisture", 25))
+        self.assertEqual(self.render.table.boundary("tulip", "moisture").text, "≥ 20")
+        self.assertEqual(intervals, {"rose": 3600, "tulip": 3600})
+
+    def test_sensors_changed(self):
+        self.config["sensors"]["tulip"]["mac"] = "00:00:00:00:00:03"
+        del self.config["sensors"]["rose"]
+        self.config["sensors"]["lily"] = {"mac": "00:00:00:00:00:04", "interval": 60, "wellbeing_range": {}}
+        self._write()
+        sensors, intervals = self.reloader()
+        self.assertEqual([s.name for s in sensors], ["tulip", "lily"])
+        self.assertIsNot(sensors[0], self.sensors[1])
+        self.assertEqual(sensors[0].mac, "00:00:00:00:00:03")
+        self.assertEqual(sorted(self.evaluators), ["lily", "tulip"])
+        self.assertEqual(sorted(self.render.table), ["lily", "tulip"])
+        self.assertEqual(intervals, {"tulip": 3600, "lily": 60})
+        # a sensor added again later under the name doesn't start from the removed one's trend
+        self.adaptive.forget.assert_called_once_with("rose")
+
+    def test_invalid_rejected(self):
+        self.config["sensors"]["tulip"]["wellbeing_range"]["moisture"] = {"min": 50, "max": 10}
+        self._write()
+        self.assertIsNone(self.reloader())
+        self.assertEqual(config.get_sensors()["tulip"]["wellbeing_range"]["moisture"]["min"], 30)
+        with open(self.path, "w") as f:
+            f.write("{")
+        os.utime(self.path, ns=(10, 10))
+        self.assertIsNone(self.reloader())
+        self.assertEqual(config.get_sensors()["tulip"]["wellbeing_range"]["moisture"]["min"], 30)
+
+    def test_wrong_shape_rejected(self):
+        valid = json.loads(json.dumps(self.config))
+        for sensors in (
+            dict(valid["sensors"], tulip={"mac": "00:00:00:00:00:02", "wellbeing_range": {"moisture": 5}}),
+            dict(valid["sensors"], tulip={"mac": 5, "wellbeing_range": {}}),
+            {"tulip": "x"},
+        ):
+            self.config["sensors"] = sensors
+            self._write()
+            with self.assertLogs("plantcare", level="ERROR"):
+                self.assertIsNone(self.reloader())
+            self.assertEqual(config.get_sensors()["tulip"]["wellbeing_range"]["moisture"]["min"], 30)
+
+    def test_hysteresis_changed(self):
+        self.assertTrue(self.evaluators["rose"].is_recovered("moisture", 41))
+        self.config["alerts"] = {"hysteresis": {"moisture": 5}}
+        self._write()
+        self.assertIsNotNone(self.reloader())
+        self.assertFalse(self.evaluators["rose"].is_recovered("moisture", 41))
+        self.assertTrue(self.evaluators["tulip"].is_recovered("moisture", 35))
+        self.assertTrue(self.evaluators["rose"].is_recovered("moisture", 45))
+
+    def test_restart_only_setting_ignored(self):
+        self.config["max_attempts"] = 2
+        self.config["sensors"]["rose"]["wellbeing_range"]["moisture"]["min"] = 45
+        self._write()
+        with self.assertLogs("plantcare", level="WARNING"):
+            self.assertIsNotNone(self.reloader())
+        self.assertFalse(self.evaluators["rose"].need_to_notify("moisture", 46))
+
 
 def _mock_evaluator_need_to_notify_second(param, value):
     if param == "p1" and value == 1:
@@ -60,7 +479,7 @@ def _mock_evaluator_need_to_notify_second(param, value):
 
 class TestCheckSensor(TestCase):
     def setUp(self) -> None:
-        self.sensor = Mock()
+        self.sensor = _mock_sensor()
         self.sensor.name = "plant"
         self.evaluator = Mock()
         self.messenger = Mock()
@@ -81,3 +500,64 @@ class TestCheckSensor(TestCase):
 
         self.sensor.read.assert_called()
         self.messenger.send.assert_called_once_with("plant", "p2", 2)
+
+    def test__check_sensor_alert_opened(self):
+        self.sensor.read.return_value = {"p1": 1, "p2": 2}
+        self.evaluator.need_to_notify.side_effect = _mock_evaluator_need_to_notify_second
+        alerts = Mock()
+        alerts.update.side_effect = [None, AlertState.OPEN]
+        plantcare._check_sensor(self.sensor, self.evaluator, self.messenger, alerts=alerts)
+
+        self.messenger.send.assert_called_once_with("plant", "p2", 2)
+        self.assertEqual(alerts.update.call_args_list[1][0][:3], ("plant", "p2", True))
+
+    def test__check_sensor_anomaly(self):
+        with TemporaryDirectory() as tmp:
+            state = AnomalyState(os.path.join(tmp, "anomalies.json"))
+            evaluator = plantcare._new_evaluator(
+                "plant", {"wellbeing_range": {"moisture": {"min": 20, "max": None, "stuck": 2}}}, {}, state
+            )
+            self.sensor.read.return_value = {"moisture": 30}
+            plantcare._check_sensor(self.sensor, evaluator, self.messenger)
+            self.messenger.send_anomaly.assert_not_called()
+            plantcare._check_sensor(self.sensor, evaluator, self.messenger)
+            self.messenger.send_anomaly.assert_called_once_with("plant", "moisture", 30, "stuck")
+            self.sensor.read.return_value = {"moisture": 10}
+            plantcare._check_sensor(self.sensor, evaluator, self.messenger)
+            self.messenger.send.assert_called_once_with("plant", "moisture", 10)
+
+    def test__check_sensor_cached(self):
+        listener = Mock()
+        self.sensor.read.return_value = {"moisture": 30, "battery": 90}
+        self.sensor.ages = {"moisture": 0, "battery": 600}
+        plantcare._check_sensor(self.sensor, self.evaluator, self.messenger, [listener])
+        # cached values are evaluated, but they aren't new samples for the listeners
+        self.evaluator.update.assert_called_once_with({"moisture": 30, "battery": 90}, ANY, self.sensor.ages)
+        self.assertEqual(listener.on_readings.call_args[0][:2], ("plant", {"moisture": 30}))
+        self.sensor.ages = {"moisture": 60, "battery": 660}
+        plantcare._check_sensor(self.sensor, self.evaluator, self.messenger, [listener])
+        listener.on_readings.assert_called_once()
+
+    def test__new_evaluator(self):
+        sensor = {"wellbeing_range": {"moisture": {"min": 20, "max": None}}}
+        self.assertIs(type(plantcare._new_evaluator("plant", sensor, {}, None)), RangeCheckerEvaluator)
+
+    def test__check_sensor_alert_still_open(self):
+        self.sensor.read.return_value = {"p1": 1}
+        self.evaluator.need_to_notify.return_value = True
+        alerts = Mock()
+        alerts.update.return_value = None
+        plantcare._check_sensor(self.sensor, self.evaluator, self.messenger, alerts=alerts)
+
+        self.messenger.send.assert_not_called()
+
+    def test__check_sensor_alert_closed(self):
+        self.sensor.read.return_value = {"p1": 1}
+        self.evaluator.need_to_notify.return_value = False
+        alerts = Mock()
+        alerts.update.return_value = AlertState.CLOSE
+        alerts.notify_recovery = True
+        plantcare._check_sensor(self.sensor, self.evaluator, self.messenger, alerts=alerts)
+
+        self.messenger.send.assert_not_called()
+        self.messenger.send_recovered.assert_called_once_with("plant", "p1", 1)
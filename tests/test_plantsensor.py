@@ -0,0 +1,231 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import Mock, patch
+
+from devicecache import DeviceInfoCache
+from plantsensor import PlantSensor, PlantSensorException
+from tests.blesim import simulated_backend
+
+_VERSION_BATTERY = bytes([99, 0x2b]) + b"3.2.1"
+_NAME = b"Flower care"
+_DATA = bytes.fromhex("d9000082040000230d0102083c000000")
+
+
+class _Backend(object):
+    connects = 0
+    operations = []
+    data = _DATA
+    version_battery = _VERSION_BATTERY
+
+    def __init__(self, adapter, address_type="public"):
+        self.adapter = adapter
+
+    def connect(self, mac):
+        _Backend.connects += 1
+
+    def disconnect(self):
+        pass
+
+    def write_handle(self, handle, value):
+        _Backend.operations.append(("write", handle))
+
+    def read_handle(self, handle):
+        _Backend.operations.append(("read", handle))
+        return {0x38: _Backend.version_battery, 0x03: _NAME}.get(handle, _Backend.data)
+
+    @staticmethod
+    def check_backend():
+        return True
+
+
+class TestPlantSensorRead(TestCase):
+    def setUp(self):
+        _Backend.connects = 0
+        _Backend.operations = []
+        _Backend.data = _DATA
+        _Backend.version_battery = _VERSION_BATTERY
+        self.sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=_Backend)
+        self.sensor.read()
+        _Backend.connects = 0
+        _Backend.operations = []
+
+    def test_read_values(self):
+        self.assertEqual(
+            self.sensor.read(),
+            {"light": 1154, "temperature": 21.7, "moisture": 35, "conductivity": 269, "battery": 99}
+        )
+
+    def test_read_one_connection(self):
+        self.sensor.read()
+        self.assertEqual(_Backend.connects, 1)
+        self.assertEqual(len(_Backend.operations), 3)
+        self.assertEqual(self.sensor.gatt_operations, 3)
+        self.assertEqual(_Backend.operations.count(("read", 0x38)), 1)
+        self.assertEqual(_Backend.operations.count(("read", 0x35)), 1)
+
+    def test_read_repeated(self):
+        for _ in range(3):
+            self.sensor.read()
+        self.assertEqual(_Backend.connects, 3)
+        self.assertEqual(len(_Backend.operations), 9)
+
+    def test_read_invalid_data(self):
+        _Backend.data = bytes(16)
+        with self.assertRaises(PlantSensorException):
+            self.sensor.read()
+
+    def test_read_short_data(self):
+        _Backend.data = _DATA[:8]
+        with self.assertRaises(PlantSensorException):
+            self.sensor.read()
+
+
+class TestPlantSensorDeviceCache(TestCase):
+    def setUp(self):
+        _Backend.connects = 0
+        _Backend.operations = []
+        _Backend.data = _DATA
+        _Backend.version_battery = _VERSION_BATTERY
+        self.cache = Mock()
+        self.sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=_Backend, device_cache=self.cache)
+
+    def test_firmware_checked_and_cached(self):
+        self.cache.get.return_value = None
+        self.sensor.read()
+        self.assertEqual(_Backend.operations.count(("read", 0x38)), 2)
+        self.assertEqual(_Backend.operations.count(("read", 0x03)), 1)
+        self.cache.put.assert_called_once_with("10:EA:BA:58:10:B8", "3.2.1", "Flower care")
+
+    def test_firmware_check_skipped(self):
+        self.cache.get.return_value = {"firmware": "3.2.1", "name": "Flower care", "verified": 0}
+        self.sensor.read()
+        self.assertEqual(_Backend.connects, 1)
+        self.assertEqual(len(_Backend.operations), 3)
+        self.cache.put.assert_not_called()
+
+    def test_firmware_downgrade(self):
+        self.cache.get.return_value = {"firmware": "3.2.2", "name": "Flower care", "verified": 0}
+        with self.assertRaises(PlantSensorException):
+            self.sensor.read()
+        self.cache.invalidate.assert_called_once_with("10:EA:BA:58:10:B8")
+
+    def test_firmware_upgrade(self):
+        self.cache.get.return_value = {"firmware": "3.1.9", "name": "Flower care", "verified": 0}
+        self.sensor.read()
+        self.cache.put.assert_called_once_with("10:EA:BA:58:10:B8", "3.2.1", "Flower care")
+
+    def test_decode_failure(self):
+        self.cache.get.return_value = {"firmware": "3.2.1", "name": "Flower care", "verified": 0}
+        _Backend.data = bytes(16)
+        with self.assertRaises(PlantSensorException):
+            self.sensor.read()
+        self.cache.invalidate.assert_called_once_with("10:EA:BA:58:10:B8")
+
+
+class TestPlantSensorSimulated(TestCase):
+    def test_read(self):
+        backend = simulated_backend(readings={"10:EA:BA:58:10:B8": {"moisture": 12}})
+        sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=backend)
+        self.assertEqual(
+            sensor.read(),
+            {"light": 1154, "temperature": 21.7, "moisture": 12, "conductivity": 269, "battery": 99}
+        )
+        # firmware version and name on the first read, then one connection per read
+        sensor.read()
+        self.assertEqual(backend.stats["connects"], 4)
+
+    def test_unwritable_device_cache(self):
+        with TemporaryDirectory() as tmp:
+            # a file where the data dir is expected
+            path = os.path.join(tmp, "data")
+            open(path, "w").close()
+            cache = DeviceInfoCache(os.path.join(path, "devices.json"), 3600)
+            backend = simulated_backend(readings={"10:EA:BA:58:10:B8": {"moisture": 12}})
+            sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=backend, device_cache=cache)
+            with self.assertLogs("devicecache", level="WARNING"):
+                self.assertEqual(sensor.read()["moisture"], 12)
+            # the firmware check is still skipped, from memory
+            sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=backend, device_cache=cache)
+            connects = backend.stats["connects"]
+            self.assertEqual(sensor.read()["moisture"], 12)
+            self.assertEqual(backend.stats["connects"], connects + 1)
+
+    def test_connection_failure(self):
+        sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=simulated_backend(failure_rate=1))
+        with self.assertRaises(PlantSensorException):
+            sensor.read()
+
+    def test_connection_drop(self):
+        backend = simulated_backend()
+        sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=backend)
+        sensor.read()
+        backend.drop_rate = 1
+        with self.assertRaises(PlantSensorException):
+            sensor.read()
+        self.assertEqual(backend.stats["drops"], 1)
+
+    def test_set_adapter(self):
+        sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=simulated_backend())
+        sensor.read()
+        poller = sensor._poller
+        sensor.set_adapter("hci0")
+        self.assertIs(sensor._poller, poller)
+        sensor.set_adapter("hci1")
+        self.assertIsNone(sensor._poller)
+        sensor.read()
+        self.assertEqual(sensor._poller._bt_interface._backend.adapter, "hci1")
+
+
+@patch("plantsensor.monotonic")
+class TestPlantSensorFreshness(TestCase):
+    def setUp(self):
+        _Backend.connects = 0
+        _Backend.operations = []
+        _Backend.data = _DATA
+        _Backend.version_battery = _VERSION_BATTERY
+
+    def _sensor(self, **kwargs):
+        sensor = PlantSensor("hci0", "rose", "10:EA:BA:58:10:B8", backend=_Backend, **kwargs)
+        sensor._poller = sensor._get_poller()
+        _Backend.connects = 0
+        _Backend.operations = []
+        return sensor
+
+    def test_battery_ttl(self, monotonic):
+        sensor = self._sensor(ttls={"battery": 3600})
+        monotonic.return_value = 0
+        sensor.read()
+        monotonic.return_value = 600
+        self.assertEqual(sensor.read()["battery"], 99)
+        self.assertEqual(sensor.gatt_operations, 2)
+        self.assertEqual(sensor.ages["battery"], 600)
+        self.assertEqual(sensor.ages["moisture"], 0)
+        self.assertEqual(_Backend.operations.count(("read", 0x38)), 1)
+        monotonic.return_value = 3600
+        sensor.read()
+        self.assertEqual(_Backend.operations.count(("read", 0x38)), 2)
+
+    def test_all_fresh(self, monotonic):
+        sensor = self._sensor(ttls={p: 3600 for p in ("light", "temperature", "moisture", "conductivity", "battery")})
+        monotonic.return_value = 0
+        first = sensor.read()
+        monotonic.return_value = 10
+        self.assertEqual(sensor.read(), first)
+        self.assertEqual(_Backend.connects, 1)
+        self.assertEqual(sensor.gatt_operations, 0)
+
+    def test_monitored_only(self, monotonic):
+        monotonic.return_value = 0
+        sensor = self._sensor(parameters=("moisture",))
+        self.assertEqual(sensor.read(), {"moisture": 35})
+        self.assertEqual(_Backend.operations, [("write", 0x33), ("read", 0x35)])
+        sensor = self._sensor(parameters=("battery",))
+        self.assertEqual(sensor.read(), {"battery": 99})
+        self.assertEqual(_Backend.operations, [("read", 0x38)])
+
+    def test_nothing_monitored(self, monotonic):
+        monotonic.return_value = 0
+        sensor = self._sensor(parameters=())
+        self.assertEqual(sensor.read(), {})
+        self.assertEqual(_Backend.connects, 0)
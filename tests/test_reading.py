@@ -0,0 +1,36 @@
+import json
+from unittest import TestCase
+
+from reading import Reading
+
+
+class TestReading(TestCase):
+    def test_mapping(self):
+        reading = Reading({"moisture": 35, "light": 1000})
+        self.assertEqual(reading, {"light": 1000, "moisture": 35})
+        # parameters come in PARAMETERS order
+        self.assertEqual(list(reading), ["light", "moisture"])
+        self.assertEqual(len(reading), 2)
+        self.assertEqual(reading["moisture"], 35)
+        self.assertIn("light", reading)
+        self.assertNotIn("battery", reading)
+        self.assertEqual(reading.get("battery", 0), 0)
+        self.assertIsNone(reading.get("humidity"))
+        with self.assertRaises(KeyError):
+            reading["battery"]
+        self.assertEqual(repr(reading), "{'light': 1000, 'moisture': 35}")
+        self.assertEqual(json.dumps(dict(reading)), '{"light": 1000, "moisture": 35}')
+
+    def test_values(self):
+        reading = Reading.from_values([None, 21.5, 35, None, 0])
+        self.assertEqual(dict(reading), {"temperature": 21.5, "moisture": 35, "battery": 0})
+        self.assertEqual(Reading(reading), reading)
+        self.assertEqual(Reading(), {})
+        self.assertFalse(Reading())
+
+    def test_read_only(self):
+        reading = Reading({"moisture": 35})
+        with self.assertRaises(TypeError):
+            reading["moisture"] = 10
+        with self.assertRaises(AttributeError):
+            reading.extra = 1
@@ -0,0 +1,108 @@
+import math
+import os
+import tempfile
+from unittest import TestCase
+
+from readingstore import ReadingStore, FIELDS
+
+_DAY = 86400
+_T0 = 1700006400  # 2023-11-15 00:00:00 UTC
+
+
+def _readings(moisture, battery=None):
+    return {"light": 100, "temperature": 20.5, "moisture": moisture, "conductivity": 300, "battery": battery}
+
+
+class TestReadingStore(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.store = ReadingStore(self.dir.name)
+
+    def tearDown(self):
+        self.store.close()
+        self.dir.cleanup()
+
+    def test_query_raw(self):
+        self.store.append("a", _readings(40, 99), _T0 + 10)
+        self.store.append("b", _readings(50), _T0 + 20)
+        self.store.append("a", _readings(41, 98), _T0 + _DAY + 10)
+        result = self.store.query(_T0, _T0 + 2 * _DAY)
+        self.assertEqual(list(result["ts"]), [_T0 + 10, _T0 + 20, _T0 + _DAY + 10])
+        result = self.store.query(_T0, _T0 + 2 * _DAY, name="a")
+        self.assertEqual(list(result["values"][:, FIELDS.index("moisture")]), [40, 41])
+        self.assertTrue(math.isnan(self.store.query(_T0, _T0 + _DAY, name="b")["values"][0, FIELDS.index("battery")]))
+
+    def test_query_range(self):
+        for i in range(10):
+            self.store.append("a", _readings(i), _T0 + i * 3600)
+        self.assertEqual(len(self.store.query(_T0 + 3600, _T0 + 3 * 3600)), 2)
+        self.assertEqual(len(self.store.query(_T0, _T0 + _DAY, name="unknown")), 0)
+
+    def test_persistent_sensor_ids(self):
+        self.store.append("a", _readings(1), _T0)
+        self.store.append("b", _readings(2), _T0)
+        self.store.close()
+        store = ReadingStore(self.dir.name)
+        self.assertEqual(store.sensor_id("b"), 1)
+        self.assertEqual(len(store.query(_T0, _T0 + 1, name="b")), 1)
+
+    def test_rollup(self):
+        for i in range(4):
+            self.store.append("a", _readings(40 + i), _T0 + i * 1800)
+        self.store.append("b", _readings(10), _T0 + 100)
+        self.store.rollup(now=_T0 + _DAY + 100)
+        hourly = self.store.query(_T0, _T0 + _DAY, name="a", resolution="hourly")
+        moisture = FIELDS.index("moisture")
+        self.assertEqual(list(hourly["ts"]), [_T0, _T0 + 3600])
+        self.assertEqual(list(hourly["count"]), [2, 2])
+        self.assertEqual(list(hourly["min"][:, moisture]), [40, 42])
+        self.assertEqual(list(hourly["mean"][:, moisture]), [40.5, 42.5])
+        self.assertEqual(list(hourly["max"][:, moisture]), [41, 43])
+        daily = self.store.query(_T0, _T0 + _DAY, resolution="daily")
+        self.assertEqual(len(daily), 2)
+        self.assertEqual(daily[daily["sensor"] == 0]["mean"][0, moisture], 41.5)
+        self.assertTrue(math.isnan(daily[0]["mean"][FIELDS.index("battery")]))
+
+    def test_rollup_skips_today(self):
+        self.store.append("a", _readings(40), _T0 + 100)
+        self.store.rollup(now=_T0 + 200)
+        self.assertEqual(len(self.store.query(_T0, _T0 + _DAY, resolution="hourly")), 0)
+
+    def test_rollup_late_readings(self):
+        self.store.append("a", _readings(40), _T0 + 100)
+        self.store.rollup(now=_T0 + _DAY + 100)
+        self.store.append("a", _readings(50), _T0 + 200)
+        self.store.rollup(now=_T0 + _DAY + 200)
+        daily = self.store.query(_T0, _T0 + _DAY, resolution="daily")
+        self.assertEqual(list(daily["count"]), [2])
+
+    def test_retention(self):
+        self.store.append("a", _readings(40), _T0 + 100)
+        self.store.append("a", _readings(40), _T0 + 40 * _DAY)
+        self.store.rollup(now=_T0 + 40 * _DAY + 100, raw_retention=30, hourly_retention=365)
+        self.assertEqual(len(self.store.query(_T0, _T0 + _DAY)), 0)
+        self.assertEqual(len(self.store.query(_T0, _T0 + _DAY, resolution="hourly")), 1)
+        self.assertEqual(len(self.store.query(_T0, _T0 + _DAY, resolution="daily")), 1)
+        self.assertEqual(len(os.listdir(os.path.join(self.dir.name, "raw"))), 1)
+
+    def test_truncated_record(self):
+        self.store.append("a", _readings(40), _T0 + 100)
+        self.store.close()
+        with open(os.path.join(self.dir.name, "raw", "20231115.bin"), "ab") as f:
+            f.write(b"\x01\x02")
+        self.assertEqual(len(self.store.query(_T0, _T0 + _DAY)), 1)
+
+    def test_stream(self):
+        self.store.append("a", _readings(40, 99), _T0 + 10)
+        self.store.append("b", _readings(50), _T0 + 20)
+        self.store.append("a", _readings(41), _T0 + _DAY + 10)
+        self.store.close()
+        with open(os.path.join(self.dir.name, "raw", "20231116.bin"), "ab") as f:
+            f.write(b"\x01\x02")
+        records = list(self.store.stream())
+        self.assertEqual(
+            [(name, ts) for name, ts, _ in records], [("a", _T0 + 10), ("b", _T0 + 20), ("a", _T0 + _DAY + 10)]
+        )
+        self.assertEqual(records[0][2], _readings(40, 99))
+        self.assertNotIn("battery", records[1][2])
+        self.assertEqual(len(list(self.store.stream(_T0 + 15, _T0 + _DAY))), 1)
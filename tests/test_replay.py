@@ -0,0 +1,121 @@
+import io
+import json
+import os
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+import config
+import replay
+from readingstore import ReadingStore
+
+_HOUR = 3600
+_T0 = 1700006400
+
+
+class TestReplay(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "config.json")
+        self.config = {
+            "telegram": {"token": "123:ABC", "channel": "-100"},
+            "alerts": {"enabled": True, "renotify_interval": 0, "recovery_message": True},
+            "sensors": {
+                "rose": {"mac": "00:00:00:00:00:01", "wellbeing_range": {"moisture": {"min": 40}}},
+                "tulip": {
+                    "mac": "00:00:00:00:00:02",
+                    "wellbeing_range": {"temperature": {"min": 10, "max": 30}, "moisture": {"stuck": 3}}
+                }
+            }
+        }
+        with open(self.path, "w") as f:
+            json.dump(self.config, f)
+        patch.dict(os.environ, {"CONFIG_FILE": self.path}).start()
+        self.addCleanup(patch.stopall)
+        self.addCleanup(config.reload)
+        config.reload()
+        self.records = [
+            ("rose", _T0, {"moisture": 50}),
+            ("rose", _T0 + _HOUR, {"moisture": 35}),
+            ("rose", _T0 + 2 * _HOUR, {"moisture": 30}),
+            ("rose", _T0 + 3 * _HOUR, {"moisture": 45}),
+            ("rose", _T0 + 4 * _HOUR, {"moisture": 20}),
+            ("tulip", _T0, {"temperature": 20, "moisture": 30}),
+            ("tulip", _T0 + _HOUR, {"temperature": 35, "moisture": 30}),
+            ("tulip", _T0 + 2 * _HOUR, {"temperature": 20, "moisture": 30}),
+            ("lily", _T0, {"moisture": 0}),
+        ]
+
+    def _settings(self):
+        return {
+            "sensors": config.get_sensors(), "message_templates": config.get_message_templates(),
+            "alerts": config.get_alerts()
+        }
+
+    def test_replay(self):
+        counts = replay.replay(iter(self.records), self._settings())
+        self.assertEqual(counts[("rose", "moisture")], {"readings": 5, "alerts": 2, "anomalies": 0, "recoveries": 1})
+        self.assertEqual(
+            counts[("tulip", "temperature")], {"readings": 3, "alerts": 1, "anomalies": 0, "recoveries": 1}
+        )
+        self.assertEqual(counts[("tulip", "moisture")], {"readings": 3, "alerts": 0, "anomalies": 1, "recoveries": 0})
+        self.assertNotIn(("lily", "moisture"), counts)
+
+    def test_replay_without_alert_state(self):
+        settings = self._settings()
+        settings["alerts"] = dict(settings["alerts"], enabled=False)
+        counts = replay.replay(iter(self.records), settings)
+        # every reading out of the boundaries is sent
+        self.assertEqual(counts[("rose", "moisture")]["alerts"], 3)
+        self.assertEqual(counts[("rose", "moisture")]["recoveries"], 0)
+
+    def test_replay_doesnt_touch_live_state(self):
+        with patch.dict(self.config, data_dir=os.path.join(self.tmp.name, "data")):
+            with open(self.path, "w") as f:
+                json.dump(self.config, f)
+            config.reload()
+            replay.replay(iter(self.records), self._settings())
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "data")))
+
+    def test_read_jsonl(self):
+        path = os.path.join(self.tmp.name, "readings.jsonl")
+        with open(path, "w") as f:
+            for name, timestamp, readings in self.records:
+                f.write(json.dumps({"name": name, "timestamp": timestamp, "readings": readings}) + "\n")
+            f.write("\n")
+        self.assertEqual(list(replay.read_records(path)), self.records)
+        with open(path, "a") as f:
+            f.write("{\"name\": \"rose\"}\n")
+        with self.assertRaisesRegex(ValueError, "Line 11"):
+            list(replay.read_records(path))
+
+    def test_read_jsonl_values(self):
+        path = os.path.join(self.tmp.name, "readings.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"name": "rose", "timestamp": 0, "readings": {"moisture": 30, "battery": None}}) + "\n")
+            f.write(json.dumps({"name": "rose", "timestamp": 60, "readings": {"moisture": "wet"}}) + "\n")
+        records = replay.read_records(path)
+        self.assertEqual(next(records), ("rose", 0, {"moisture": 30}))
+        with self.assertRaisesRegex(ValueError, "Line 2"):
+            next(records)
+        with self.assertLogs("replay", level="ERROR") as logs:
+            self.assertFalse(replay.main(path))
+        self.assertIn("Line 2 of", logs.output[0])
+
+    def test_main_store(self):
+        store = ReadingStore(os.path.join(self.tmp.name, "store"))
+        for name, timestamp, readings in self.records:
+            store.append(name, readings, timestamp)
+        store.close()
+        out = io.StringIO()
+        with redirect_stdout(out):
+            self.assertTrue(replay.main(os.path.join(self.tmp.name, "store")))
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(), ["sensor", "parameter", "readings", "alerts", "anomalies", "recoveries"])
+        self.assertEqual(lines[1].split(), ["rose", "moisture", "5", "2", "0", "1"])
+        self.assertEqual(len(lines), 4)
+
+    def test_main_missing_source(self):
+        self.assertFalse(replay.main(os.path.join(self.tmp.name, "missing.jsonl")))
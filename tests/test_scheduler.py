@@ -0,0 +1,32 @@
+from unittest import TestCase
+
+from scheduler import Scheduler
+
+
+class TestScheduler(TestCase):
+    def test_pop_due_in_time_order(self):
+        s = Scheduler()
+        s.schedule("b", 2)
+        s.schedule("a", 1)
+        s.schedule("c", 3)
+        self.assertEqual(s.pop_due(2), ["a", "b"])
+        self.assertEqual(s.next_time(), 3)
+        self.assertEqual(len(s), 1)
+
+    def test_reschedule(self):
+        s = Scheduler()
+        s.schedule("a", 1)
+        s.schedule("a", 5)
+        self.assertEqual(s.pop_due(4), [])
+        self.assertEqual(s.when("a"), 5)
+        self.assertEqual(s.pop_due(5), ["a"])
+        self.assertIsNone(s.next_time())
+
+    def test_remove(self):
+        s = Scheduler()
+        s.schedule("a", 1)
+        s.schedule("b", 2)
+        s.remove("a")
+        self.assertNotIn("a", s)
+        self.assertEqual(s.next_time(), 2)
+        self.assertEqual(s.pop_due(10), ["b"])
@@ -0,0 +1,55 @@
+import os
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sensorhealth import SensorHealth
+
+
+class TestSensorHealth(TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "health.json")
+        self.health = SensorHealth(self.path, 3, 100, 250)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_goes_dark_once(self):
+        self.assertFalse(self.health.failure("a", "BTLEException", now=0))
+        self.assertFalse(self.health.failure("a", "BTLEException", now=10))
+        self.assertEqual(self.health.attempts("a", 5, now=10), 5)
+        self.assertTrue(self.health.failure("a", "BTLEDisconnectError", now=20))
+        self.assertTrue(self.health.is_dark("a"))
+        self.assertFalse(self.health.failure("a", "BTLEDisconnectError", now=120))
+        self.assertEqual(self.health.get("a")["last_error"], "BTLEDisconnectError")
+
+    def test_probes_with_backoff(self):
+        for t in (0, 10, 20):
+            self.health.failure("a", "BTLEException", now=t)
+        self.assertEqual(self.health.attempts("a", 5, now=119), 0)
+        self.assertEqual(self.health.attempts("a", 5, now=120), 1)
+        self.health.failure("a", "BTLEException", now=120)
+        self.assertEqual(self.health.attempts("a", 5, now=319), 0)
+        self.assertEqual(self.health.attempts("a", 5, now=320), 1)
+        self.health.failure("a", "BTLEException", now=320)
+        # capped at max_probe_interval
+        self.assertEqual(self.health.attempts("a", 5, now=570), 1)
+
+    def test_recovers(self):
+        for t in (0, 10, 20):
+            self.health.failure("a", "BTLEException", now=t)
+        self.assertTrue(self.health.success("a", now=120))
+        self.assertFalse(self.health.is_dark("a"))
+        self.assertEqual(self.health.attempts("a", 5, now=121), 5)
+        self.assertFalse(self.health.success("a", now=130))
+        self.assertEqual(self.health.get("a")["last_success"], 130)
+
+    def test_persisted(self):
+        for t in (0, 10, 20):
+            self.health.failure("a", "BTLEException", now=t)
+        self.health.success("b", now=20)
+        self.health.save()
+        health = SensorHealth(self.path, 3, 100, 250)
+        self.assertTrue(health.is_dark("a"))
+        self.assertFalse(health.is_dark("b"))
+        self.assertIsNone(health.get("c"))
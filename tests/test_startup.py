@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_HEAVY = ("telegram", "bluepy", "btlewrap", "miflora", "numpy", "paho")
+_CONFIG = {
+    "telegram": {"token": "123:ABC", "channel": "-100"},
+    "sensors": {"Rose": {"mac": "10:EA:BA:58:10:B8", "wellbeing_range": {"moisture": {"min": 40}}}}
+}
+
+
+def _imported(code, config=_CONFIG):
+    env = dict(os.environ, CONFIG=json.dumps(config))
+    env.pop("CONFIG_FILE", None)
+    script = "import sys\n{}\nprint(' '.join(m for m in {!r} if m in sys.modules))".format(code, _HEAVY)
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=_ROOT, env=env, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True
+    )
+    return result.stdout.split()
+
+
+class TestStartup(TestCase):
+    def test_import_plantcare(self):
+        self.assertEqual(_imported("import plantcare"), [])
+
+    def test_check_config(self):
+        self.assertEqual(_imported("import plantcare\nassert plantcare.check_config()"), [])
+
+    def test_check_config_invalid(self):
+        config = dict(_CONFIG, sensors={})
+        self.assertEqual(_imported("import plantcare\nassert not plantcare.check_config()", config), [])
+
+    def test_sensors_and_messenger_created(self):
+        code = (
+            "from messenger import AlertMessageRender, Dispatcher, Messenger\n"
+            "from plantsensor import PlantSensor\n"
+            "PlantSensor('hci0', 'Rose', '10:EA:BA:58:10:B8')\n"
+            "Dispatcher(Messenger('123:ABC', '-100', 'MarkdownV2', AlertMessageRender({}, {}))).close(5)"
+        )
+        self.assertEqual(_imported(code), [])